@@ -22,6 +22,35 @@ ML_MODEL_DIR = BASE_DIR / "media" / "ml_models"  # go one level above settings.p
 env = environ.Env()
 environ.Env.read_env(os.path.join(BASE_DIR, '.env'))
 
+# Wire format for prediction calls to the ML service: "binary" negotiates the
+# compact format and falls back to JSON if the service does not support it.
+ML_WIRE_FORMAT = env('ML_WIRE_FORMAT', default='binary')
+
+# Compound search indexes: fingerprints of every Compound, kept in memory and
+# persisted under COMPOUND_INDEX_DIR (Morgan for similarity search, RDKit
+# pattern fingerprints for the substructure prescreen). Each process picks up
+# compounds created by the others at most every COMPOUND_INDEX_SYNC_SECONDS.
+COMPOUND_INDEX_DIR = env('COMPOUND_INDEX_DIR', default=str(BASE_DIR / "media" / "compound_index"))
+COMPOUND_INDEX_SYNC_SECONDS = env.float('COMPOUND_INDEX_SYNC_SECONDS', default=5)
+SIMILARITY_FP_RADIUS = env.int('SIMILARITY_FP_RADIUS', default=2)
+SIMILARITY_FP_BITS = env.int('SIMILARITY_FP_BITS', default=2048)
+SUBSTRUCTURE_FP_BITS = env.int('SUBSTRUCTURE_FP_BITS', default=2048)
+
+# Threads running RDKit substructure matches on the prescreened candidates.
+SUBSTRUCTURE_MATCH_WORKERS = env.int('SUBSTRUCTURE_MATCH_WORKERS', default=os.cpu_count() or 1)
+
+# Background prediction jobs (predict/ with background=true) are queued in the
+# database and run by PREDICTION_JOB_WORKERS threads in each web process; set
+# it to 0 to run them only with `manage.py run_prediction_jobs`. Jobs call the
+# ML service in chunks of PREDICTION_JOB_CHUNK_SIZE SMILES, and a job whose
+# worker has not reported for PREDICTION_JOB_STALE_SECONDS is run again, at
+# most PREDICTION_JOB_MAX_ATTEMPTS times in all.
+PREDICTION_JOB_WORKERS = env.int('PREDICTION_JOB_WORKERS', default=2)
+PREDICTION_JOB_POLL_SECONDS = env.float('PREDICTION_JOB_POLL_SECONDS', default=2)
+PREDICTION_JOB_CHUNK_SIZE = env.int('PREDICTION_JOB_CHUNK_SIZE', default=1000)
+PREDICTION_JOB_STALE_SECONDS = env.float('PREDICTION_JOB_STALE_SECONDS', default=300)
+PREDICTION_JOB_MAX_ATTEMPTS = env.int('PREDICTION_JOB_MAX_ATTEMPTS', default=3)
+
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.1/howto/deployment/checklist/
 
@@ -14,3 +14,11 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'antimalaria_backend.settings')
 
 application = get_wsgi_application()
+
+# Run queued prediction jobs in this process (PREDICTION_JOB_WORKERS threads).
+from api.v1.predictions.jobs import start_workers  # noqa: E402
+start_workers()
+
+# Map (or build) the compound search indexes before the first search.
+from api.v1.compounds.index import start_loading  # noqa: E402
+start_loading()
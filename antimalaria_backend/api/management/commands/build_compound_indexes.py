@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from api.v1.compounds.index import SIMILARITY_INDEX, SUBSTRUCTURE_INDEX
+
+
+class Command(BaseCommand):
+    help = (
+        "Fingerprint every compound and write the similarity and substructure index files, so servers map "
+        "them at start-up instead of building them."
+    )
+
+    def handle(self, *args, **options):
+        for index in (SIMILARITY_INDEX, SUBSTRUCTURE_INDEX):
+            index.build()
+            stats = index.stats()
+            self.stdout.write(self.style.SUCCESS(f"Indexed {stats['rows']} compounds into {stats['path']}."))
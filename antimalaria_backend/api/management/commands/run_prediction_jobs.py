@@ -0,0 +1,22 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from api.v1.predictions.jobs import WORKERS, start_workers
+
+
+class Command(BaseCommand):
+    help = (
+        "Run queued background prediction jobs in this process, for deployments that keep them out of the web "
+        "processes (PREDICTION_JOB_WORKERS=0 there)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=max(settings.PREDICTION_JOB_WORKERS, 1))
+
+    def handle(self, *args, **options):
+        workers = max(options["workers"], 1)
+        self.stdout.write(self.style.SUCCESS(f"Running prediction jobs with {workers} worker(s)."))
+        start_workers(workers - 1)
+        try:
+            WORKERS.loop()
+        except KeyboardInterrupt:
+            pass
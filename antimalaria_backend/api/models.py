@@ -36,6 +36,14 @@ class ModelUpdate(models.Model):
 class Prediction(models.Model):
     class Meta:
         ordering = ['-created_at']
+        indexes = [models.Index(fields=['status', 'created_at'])]
+
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
 
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, null=True, blank=True)
@@ -44,6 +52,18 @@ class Prediction(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     completed_at = models.DateTimeField(null=True, blank=True)
 
+    # Background jobs (see api/v1/predictions/jobs.py); synchronous
+    # predictions are saved as completed.
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='completed')
+    stage = models.CharField(max_length=20, null=True, blank=True)
+    progress = models.FloatField(null=True, blank=True)
+    job_input = models.JSONField(null=True, blank=True)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(null=True, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    started_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+
     def __str__(self):
         return f"Prediction Job {self.id} ({self.status})"
 
@@ -0,0 +1,184 @@
+import random
+import tempfile
+import threading
+from pathlib import Path
+from unittest import mock
+from django.test import TestCase
+from rdkit import Chem, DataStructs
+from rdkit.Chem.rdFingerprintGenerator import GetMorganGenerator
+from rest_framework.test import APIClient
+from api.models import Compound, CustomUser
+from api.v1.compounds import views
+from api.v1.compounds.index import SimilarityIndex, SubstructureIndex
+
+FRAGMENTS = ["C", "CC", "O", "N", "C(Cl)", "C(=O)O", "C(=O)N", "c1ccccc1", "c1ccncc1", "C1CCNCC1", "c1ccc2ccccc2c1"]
+
+
+def random_smiles(count, seed=0):
+    rng = random.Random(seed)
+    found = set()
+    while len(found) < count:
+        mol = Chem.MolFromSmiles("".join(rng.choice(FRAGMENTS) for _ in range(rng.randint(2, 6))))
+        if mol is not None:
+            found.add(Chem.MolToSmiles(mol))
+    return sorted(found)
+
+
+class SimilarityIndexTests(TestCase):
+    def setUp(self):
+        self.compounds = Compound.objects.bulk_create(
+            [Compound(smiles=smiles) for smiles in random_smiles(400)] + [Compound(smiles="bad(")]
+        )
+        self.index = SimilarityIndex(compact_min_rows=10 ** 9)
+        self.index.build()
+        self.index.loaded = True
+
+    def brute_force(self, smiles):
+        generator = GetMorganGenerator(radius=2, fpSize=2048)
+        query = generator.GetFingerprint(Chem.MolFromSmiles(smiles))
+        scores = {}
+        for compound in Compound.objects.all():
+            mol = Chem.MolFromSmiles(compound.smiles)
+            if mol is not None:
+                scores[compound.pk] = DataStructs.TanimotoSimilarity(query, generator.GetFingerprint(mol))
+        return scores
+
+    def test_top_k_matches_brute_force(self):
+        for smiles in ["Nc1ccnc2ccccc12", "CCO", self.compounds[7].smiles]:
+            scores = self.brute_force(smiles)
+            hits = self.index.search(smiles, k=10)
+            # Ties may be broken either way, so the scores are compared.
+            self.assertEqual(
+                [round(similarity, 6) for _, similarity in hits],
+                [round(score, 6) for score in sorted(scores.values(), reverse=True)[:10]],
+            )
+            for pk, similarity in hits:
+                self.assertAlmostEqual(similarity, scores[pk])
+
+    def test_threshold(self):
+        smiles = self.compounds[3].smiles
+        scores = self.brute_force(smiles)
+        hits = self.index.search(smiles, k=1000, threshold=0.5)
+        self.assertEqual({pk for pk, _ in hits}, {pk for pk, score in scores.items() if score >= 0.5})
+
+    def test_sync_adds_new_compounds(self):
+        compound = Compound.objects.create(smiles="ClCCCCCCCCCCCCl")
+        self.index.sync(force=True)
+        self.assertEqual(self.index.search("ClCCCCCCCCCCCCl", k=1), [(compound.pk, 1.0)])
+        self.index.sync(force=True)
+        self.assertEqual(self.index.stats()["rows"], 401)
+
+    def test_compaction_drops_deleted_compounds(self):
+        Compound.objects.filter(pk__in=[compound.pk for compound in self.compounds[:50]]).delete()
+        self.index.compact()
+        self.assertEqual(self.index.stats()["rows"], 350)
+        deleted = {compound.pk for compound in self.compounds[:50]}
+        self.assertFalse(deleted & {pk for pk, _ in self.index.search(self.compounds[0].smiles, k=1000)})
+
+
+class PersistedIndexTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = Path(directory.name) / "similarity.bin"
+        self.compounds = Compound.objects.bulk_create([Compound(smiles=smiles) for smiles in random_smiles(200, seed=4)])
+
+    def test_file_is_written_without_the_lock(self):
+        index = SimilarityIndex(self.path, compact_min_rows=10 ** 9)
+        save = index.save
+        free = []
+
+        def probe():
+            # What a search on another thread does while the file is written.
+            acquired = index._lock.acquire(timeout=5)
+            if acquired:
+                index._lock.release()
+            free.append(acquired)
+
+        def save_and_probe(*args):
+            thread = threading.Thread(target=probe)
+            thread.start()
+            thread.join()
+            save(*args)
+
+        with mock.patch.object(index, "save", side_effect=save_and_probe):
+            index.build()
+            Compound.objects.create(smiles="ClCCCCCCCCCCCCl")
+            index.loaded = True
+            index.sync(force=True)
+            index.compact()
+        self.assertEqual(free, [True, True])
+
+        reloaded = SimilarityIndex(self.path)
+        self.assertTrue(reloaded.load())
+        self.assertEqual(reloaded.stats()["rows"], 201)
+        reloaded.loaded = True
+        self.assertEqual(reloaded.search("ClCCCCCCCCCCCCl", k=1)[0][1], 1.0)
+        self.assertEqual(index.search("CCO", k=5), reloaded.search("CCO", k=5))
+
+
+class SimilarityViewTests(TestCase):
+    def setUp(self):
+        self.compounds = Compound.objects.bulk_create([Compound(smiles=smiles) for smiles in random_smiles(200, seed=1)])
+        self.index = SimilarityIndex()
+        self.index.build()
+        self.index.loaded = True
+        patcher = mock.patch("api.v1.compounds.views.SIMILARITY_INDEX", self.index)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = APIClient()
+        self.client.force_authenticate(CustomUser.objects.create(username="alice"))
+
+    def search(self, smiles, k):
+        return self.client.post("/api/v1/compounds/similar/", {"smiles": smiles, "k": k}, format="json")
+
+    def test_deleted_compounds_are_made_up_for(self):
+        smiles = self.compounds[0].smiles
+        best = [pk for pk, _ in self.index.search(smiles, k=8)]
+        Compound.objects.filter(pk__in=best[:6]).delete()
+        response = self.search(smiles, 5)
+        self.assertEqual(response.status_code, 200)
+        ids = [hit["compound"]["id"] for hit in response.json()["data"]]
+        self.assertEqual(len(ids), 5)
+        self.assertFalse({str(pk) for pk in best[:6]} & set(ids))
+
+    def test_unloaded_index_is_not_built_in_the_request(self):
+        index = SimilarityIndex()
+        with mock.patch("api.v1.compounds.views.SIMILARITY_INDEX", index), \
+                mock.patch.object(index, "start_loading") as start_loading, \
+                mock.patch.object(index, "build") as build:
+            response = self.search("CCO", 5)
+        self.assertEqual(response.status_code, 503)
+        start_loading.assert_called_once_with()
+        build.assert_not_called()
+
+
+class SubstructureIndexTests(TestCase):
+    def test_screen_keeps_every_match(self):
+        compounds = Compound.objects.bulk_create([Compound(smiles=smiles) for smiles in random_smiles(300, seed=2)])
+        index = SubstructureIndex()
+        index.build()
+        index.loaded = True
+        for smarts in ["c1ccncc1", "[Cl]", "C(=O)[OH]", "NC1CCNCC1"]:
+            query = Chem.MolFromSmarts(smarts)
+            expected = {c.pk for c in compounds if Chem.MolFromSmiles(c.smiles).HasSubstructMatch(query)}
+            candidates = set(index.screen(query))
+            self.assertLessEqual(expected, candidates)
+            subset = [c.pk for c in compounds[:100]]
+            self.assertEqual(set(index.screen(query, subset)), candidates & set(subset))
+
+    def test_parallel_and_serial_matching_agree(self):
+        compounds = Compound.objects.bulk_create(
+            [Compound(smiles=smiles) for smiles in random_smiles(300, seed=3)] + [Compound(smiles="bad(")]
+        )
+        ids = [c.pk for c in compounds]
+        with mock.patch.object(views, "MATCH_CHUNK_SIZE", 40):
+            for smarts in ["c1ccncc1", "C(=O)[OH]", "[#6]"]:
+                query = Chem.MolFromSmarts(smarts)
+                serial = views.match_substructure(query, ids, workers=1)
+                parallel = views.match_substructure(query, ids, workers=4)
+                self.assertEqual(parallel, serial)
+                self.assertEqual(
+                    set(serial), {c.pk for c in compounds if (m := Chem.MolFromSmiles(c.smiles)) and m.HasSubstructMatch(query)}
+                )
+
@@ -0,0 +1,144 @@
+from datetime import timedelta
+from unittest import mock
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from api.models import CustomUser, Prediction
+from api.v1.predictions import jobs
+
+
+@override_settings(PREDICTION_JOB_STALE_SECONDS=60, PREDICTION_JOB_MAX_ATTEMPTS=2)
+class JobQueueTests(TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(jobs.WORKERS, "notify")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.alice = CustomUser.objects.create(username="alice")
+        self.bob = CustomUser.objects.create(username="bob")
+
+    def submit(self, user, smiles=("CCO", "CCN"), minutes_ago=0):
+        job = jobs.submit(user, list(smiles), {s: i for i, s in enumerate(smiles)}, "manual", model_method="rf")
+        Prediction.objects.filter(id=job.id).update(created_at=timezone.now() - timedelta(minutes=minutes_ago))
+        return job
+
+    def state(self, job):
+        return Prediction.objects.get(id=job.id)
+
+    def test_submit_queues_the_request(self):
+        job = self.state(self.submit(self.alice, ["CCO", "c1ccccc1"]))
+        self.assertEqual(job.status, jobs.QUEUED)
+        self.assertEqual(job.job_input, {"smiles": ["CCO", "c1ccccc1"], "positions": [0, 1], "model_method": "rf"})
+        jobs.WORKERS.notify.assert_called_once_with()
+
+    def test_claim_takes_the_oldest_job_once(self):
+        newer = self.submit(self.alice, minutes_ago=1)
+        older = self.submit(self.alice, minutes_ago=2)
+
+        claimed = jobs.claim()
+        self.assertEqual(claimed.id, older.id)
+        self.assertEqual((claimed.status, claimed.attempts), (jobs.RUNNING, 1))
+        self.assertIsNotNone(claimed.heartbeat_at)
+        self.assertEqual(jobs.claim().id, newer.id)
+        self.assertIsNone(jobs.claim())
+
+    def test_claim_lets_idle_users_go_first(self):
+        self.submit(self.alice, minutes_ago=3)
+        self.submit(self.alice, minutes_ago=2)
+        bobs = self.submit(self.bob, minutes_ago=1)
+        jobs.claim()
+        self.assertEqual(jobs.claim().id, bobs.id)
+
+    def test_claim_skips_jobs_taken_by_another_worker(self):
+        job = self.submit(self.alice)
+        original_filter = Prediction.objects.filter
+
+        # Another worker claims the job between reading the candidates and updating.
+        def filter_after_race(*args, **kwargs):
+            if kwargs.get("id") == job.id:
+                original_filter(id=job.id).update(status=jobs.RUNNING)
+            return original_filter(*args, **kwargs)
+
+        with mock.patch.object(Prediction.objects, "filter", side_effect=filter_after_race):
+            self.assertIsNone(jobs.claim())
+
+    def test_stale_jobs_are_requeued_then_failed(self):
+        job = self.submit(self.alice)
+        fresh = self.submit(self.bob)
+        jobs.claim()
+        jobs.claim()
+        stale = timezone.now() - timedelta(seconds=120)
+        Prediction.objects.filter(id=job.id).update(heartbeat_at=stale)
+
+        jobs.requeue_stale()
+        self.assertEqual(self.state(job).status, jobs.QUEUED)
+        self.assertEqual(self.state(fresh).status, jobs.RUNNING)
+
+        self.assertEqual(jobs.claim().id, job.id)
+        self.assertEqual(self.state(job).attempts, 2)
+        Prediction.objects.filter(id=job.id).update(heartbeat_at=stale)
+        jobs.requeue_stale()
+        job = self.state(job)
+        self.assertEqual(job.status, jobs.FAILED)
+        self.assertIsNotNone(job.completed_at)
+        self.assertIsNone(job.heartbeat_at)
+
+    def test_tracker_progress_and_completion(self):
+        self.submit(self.alice)
+        job = jobs.claim()
+        tracker = jobs.JobTracker(job)
+        tracker.stage("predicting")
+        tracker.update(1, 2)
+        self.assertEqual((self.state(job).stage, self.state(job).progress), ("predicting", 0.0))
+
+        # Throttled to one write per PROGRESS_INTERVAL.
+        with mock.patch.object(jobs, "PROGRESS_INTERVAL", 0):
+            tracker.update(1, 2)
+            self.assertEqual(self.state(job).progress, 0.3)
+            tracker.stage("saving")
+            tracker.complete({"prediction_id": str(job.id)})
+        job = self.state(job)
+        self.assertEqual((job.status, job.progress), (jobs.COMPLETED, 1.0))
+        self.assertIsNotNone(job.completed_at)
+
+    def test_tracker_notices_cancellation(self):
+        self.submit(self.alice)
+        job = jobs.claim()
+        tracker = jobs.JobTracker(job)
+        tracker.stage("predicting")
+        Prediction.objects.filter(id=job.id).delete()
+        with self.assertRaises(jobs.JobCancelled):
+            tracker.stage("enriching")
+
+    def test_fail_only_touches_running_jobs(self):
+        queued = self.submit(self.alice)
+        jobs.fail(queued, "boom")
+        self.assertEqual(self.state(queued).status, jobs.QUEUED)
+
+        job = jobs.claim()
+        jobs.fail(job, "boom", result={"error": "boom"})
+        job = self.state(job)
+        self.assertEqual((job.status, job.error, job.result), (jobs.FAILED, "boom", {"error": "boom"}))
+
+    def run_with(self, **predict):
+        self.submit(self.alice)
+        job = jobs.claim()
+        with mock.patch("api.v1.predictions.views.PredictIC50View.predict", **predict) as view:
+            jobs.run(job)
+        return self.state(job), view
+
+    def test_run_passes_the_request_to_the_view(self):
+        job, view = self.run_with(return_value=(201, {}))
+        args, kwargs = view.call_args
+        self.assertEqual(args[1:], (["CCO", "CCN"], {"CCO": 0, "CCN": 1}, "manual"))
+        self.assertEqual(kwargs["model_method"], "rf")
+        self.assertIsInstance(kwargs["tracker"], jobs.JobTracker)
+
+    def test_run_records_errors(self):
+        job, _ = self.run_with(return_value=(502, {"error": "ML service unavailable"}))
+        self.assertEqual((job.status, job.error), (jobs.FAILED, "ML service unavailable"))
+
+        job, _ = self.run_with(side_effect=RuntimeError("boom"))
+        self.assertEqual((job.status, job.error), (jobs.FAILED, "boom"))
+
+    def test_run_leaves_cancelled_jobs_alone(self):
+        job, _ = self.run_with(side_effect=jobs.JobCancelled())
+        self.assertEqual(job.status, jobs.RUNNING)
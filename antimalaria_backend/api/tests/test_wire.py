@@ -0,0 +1,112 @@
+import json
+import struct
+from unittest import mock
+import numpy as np
+from django.test import SimpleTestCase, override_settings
+from api.v1.predictions import wire
+
+# Result kind of {"predictions", "errors"} bodies; the backend decodes it as the fallthrough.
+KIND_PARTIAL = 1
+
+
+def decode_batch(data):
+    # The ML service's parser, for checking what the backend sends.
+    assert data[:4] == wire.BATCH_MAGIC
+    (flags,) = struct.unpack_from("<B", data, 4)
+    pos, fields = 5, []
+    for _ in range(2):
+        (length,) = struct.unpack_from("<H", data, pos)
+        fields.append(data[pos + 2:pos + 2 + length].decode("utf-8"))
+        pos += 2 + length
+    (n,) = struct.unpack_from("<I", data, pos)
+    smiles_list = data[pos + 4:].decode("utf-8").split("\0") if n else []
+    assert len(smiles_list) == n
+    return smiles_list, fields[0], fields[1], bool(flags & wire.FLAG_PARTIAL)
+
+
+def encode_result(kind, values, tail=None):
+    # The ML service's encoder: kind, float64 values (NaN for None), JSON tail.
+    values = np.array([np.nan if value is None else value for value in values], dtype="<f8")
+    tail = json.dumps(tail).encode("utf-8") if tail is not None else b""
+    return wire.RESULT_MAGIC + struct.pack("<BI", kind, len(values)) + values.tobytes() + struct.pack("<I", len(tail)) + tail
+
+
+def response(status_code, content=b"", content_type="application/json", data=None):
+    result = mock.Mock(status_code=status_code, content=content, headers={"Content-Type": content_type}, text="")
+    result.json.return_value = data
+    return result
+
+
+class WireCodecTests(SimpleTestCase):
+    def test_batch_layout(self):
+        smiles = ["CCO", "c1ccccc1", "CC(=O)Oc1ccccc1C(=O)O", "ÅC"]
+        data = wire.encode_batch(smiles, "rf", "ECFP", partial=True)
+        self.assertEqual(decode_batch(data), (smiles, "rf", "ECFP", True))
+        self.assertEqual(decode_batch(wire.encode_batch([], None, "MACCS")), ([], "", "MACCS", False))
+
+    def test_nul_is_refused(self):
+        with self.assertRaises(ValueError):
+            wire.encode_batch(["CC\0O"], "rf", "ECFP")
+
+    def test_results(self):
+        self.assertEqual(wire.decode_result(encode_result(wire.KIND_LIST, [1.5, 2.25])), [1.5, 2.25])
+        errors = [{"index": 1, "smiles": "xx", "error": "Invalid SMILES"}]
+        self.assertEqual(
+            wire.decode_result(encode_result(KIND_PARTIAL, [1.5, None, 3.0], errors)),
+            {"predictions": [1.5, None, 3.0], "errors": errors},
+        )
+        self.assertEqual(wire.decode_result(encode_result(wire.KIND_OTHER, [], {"error": "No model"})), {"error": "No model"})
+        with self.assertRaises(ValueError):
+            wire.decode_result(b'{"predictions": []}')
+
+
+@override_settings(ML_WIRE_FORMAT="binary")
+class PostPredictTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch.object(wire, "_binary_supported", True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(wire, "requests")
+        self.requests = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_binary_request_and_result(self):
+        self.requests.post.return_value = response(200, encode_result(wire.KIND_LIST, [4.5]), wire.RESULT_MEDIA_TYPE)
+        self.assertEqual(wire.post_predict("http://ml/predict/", ["CCO"], "rf", "ECFP"), (200, [4.5]))
+
+        _, kwargs = self.requests.post.call_args
+        self.assertEqual(kwargs["headers"]["Content-Type"], wire.BATCH_MEDIA_TYPE)
+        self.assertTrue(kwargs["headers"]["Accept"].startswith(wire.RESULT_MEDIA_TYPE))
+        self.assertEqual(decode_batch(kwargs["data"]), (["CCO"], "rf", "ECFP", False))
+
+    def test_json_answer_to_a_binary_request(self):
+        self.requests.post.return_value = response(404, data={"error": "No model"})
+        self.assertEqual(wire.post_predict("http://ml/predict/", ["CCO"], "rf", "ECFP"), (404, {"error": "No model"}))
+
+    def test_falls_back_to_json_on_415(self):
+        self.requests.post.side_effect = [response(415), response(200, data=[4.5]), response(200, data=[5.5])]
+        self.assertEqual(wire.post_predict("http://ml/predict/", ["CCO"], "rf", "ECFP"), (200, [4.5]))
+        self.assertEqual(self.requests.post.call_args.kwargs["json"]["smiles"], ["CCO"])
+
+        # Later batches go straight to JSON.
+        self.assertEqual(wire.post_predict("http://ml/predict/", ["CCN"], "rf", "ECFP"), (200, [5.5]))
+        self.assertEqual(self.requests.post.call_count, 3)
+        self.assertIn("json", self.requests.post.call_args.kwargs)
+
+    def test_unencodable_batch_goes_as_json(self):
+        self.requests.post.return_value = response(200, data={"predictions": [None], "errors": []})
+        wire.post_predict("http://ml/predict/", ["CC\0O"], "rf", "ECFP", partial=True)
+        self.assertEqual(self.requests.post.call_count, 1)
+        self.assertEqual(self.requests.post.call_args.kwargs["json"]["smiles"], ["CC\0O"])
+
+    def test_extra_fields_go_as_json(self):
+        self.requests.post.return_value = response(200, data=[4.5])
+        wire.post_predict("http://ml/predict/", ["CCO"], "rf", "ECFP", applicability=True)
+        self.assertEqual(self.requests.post.call_count, 1)
+        self.assertTrue(self.requests.post.call_args.kwargs["json"]["applicability"])
+
+    @override_settings(ML_WIRE_FORMAT="json")
+    def test_json_setting(self):
+        self.requests.post.return_value = response(200, data=[4.5])
+        self.assertEqual(wire.post_predict("http://ml/predict/", ["CCO"], "rf", "ECFP"), (200, [4.5]))
+        self.assertNotIn("data", self.requests.post.call_args.kwargs)
@@ -0,0 +1,589 @@
+"""
+In-memory fingerprint indexes over the Compound catalog.
+
+Every compound's SMILES is reduced to a fingerprint packed into uint64
+words. The bulk of an index is one matrix sorted by bit count and
+memory-mapped from a file under COMPOUND_INDEX_DIR, so a restart maps the
+file instead of re-fingerprinting the catalog and the workers of one server
+share its pages. Compounds created since are fingerprinted into a small
+in-memory delta, which is merged into a new file in the background once it
+grows; rows of deleted compounds are dropped by that merge.
+
+Each server process maps (or, when there is no file yet, builds) the indexes
+on a background thread at start-up; searches made before that finishes raise
+IndexNotReady instead of building the index inside a request. Run
+`manage.py build_compound_indexes` before deploying to keep start-up short.
+
+SimilarityIndex ranks Morgan fingerprints by Tanimoto similarity.
+SubstructureIndex holds RDKit pattern fingerprints, whose bits for a
+substructure are a subset of the bits of every molecule containing it, so
+only molecules passing that screen need an actual substructure match.
+"""
+import heapq
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from datetime import timedelta
+from pathlib import Path
+import numpy as np
+from django.conf import settings
+from django.db import connection
+from django.utils.dateparse import parse_datetime
+from rdkit import Chem, DataStructs
+from rdkit.Chem.rdFingerprintGenerator import GetMorganGenerator
+from api.models import Compound
+
+MAGIC = b"CSIMIDX1"
+ALIGN = 64
+# Rows scored per step, so temporaries stay a few MB.
+BLOCK_ROWS = 65536
+# Compounds created this close to the last sync are fetched again, so rows
+# committed late by another process are not missed.
+SYNC_OVERLAP = timedelta(seconds=5)
+
+# Set bits of every 16-bit value, for numpy versions without bitwise_count.
+_POPCOUNT_16 = np.unpackbits(np.arange(1 << 16, dtype=">u2").view(np.uint8)).reshape(-1, 16).sum(axis=1).astype(np.uint8)
+
+
+class IndexNotReady(Exception):
+    """The index is still being mapped or built in this process."""
+
+
+def popcount_rows(words):
+    # Set bits per row of an (n, w) uint64 matrix.
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(words).sum(axis=1, dtype=np.int32)
+    return _POPCOUNT_16[words.view(np.uint16)].sum(axis=1, dtype=np.int32)
+
+
+def _align(offset):
+    return (offset + ALIGN - 1) // ALIGN * ALIGN
+
+
+class FingerprintIndex:
+    """
+    Packed fingerprints of every Compound, kept in step with the table.
+
+    Subclasses set kind and implement fingerprint_bits(mol); params (stored
+    in the file header) name everything that changes the fingerprints, so a
+    file built with other parameters is rebuilt rather than used.
+    """
+
+    kind = None
+
+    def __init__(self, path=None, n_bits=2048, sync_interval=5.0, compact_fraction=0.05, compact_min_rows=1024):
+        if n_bits % 64:
+            raise ValueError("n_bits must be a multiple of 64.")
+        self.path = Path(path) if path else None
+        self.n_bits = n_bits
+        self.words = n_bits // 64
+        self.sync_interval = sync_interval
+        self.compact_fraction = compact_fraction
+        self.compact_min_rows = compact_min_rows
+
+        self.loaded = False
+        self._loading = False
+        self.synced_at = None
+        self.last_sync = 0.0
+        # id -> created_at of rows inside the sync overlap window.
+        self._recent = {}
+
+        self._main = self._empty()
+        self._buckets = self._bucket(self._main[1])
+        self._lookup = None
+        self._delta = self._empty()
+        self._compacting = False
+
+        self._lock = threading.RLock()
+        # Serializes build() and compact(), which write the file without
+        # holding self._lock.
+        self._write_lock = threading.Lock()
+
+    @property
+    def params(self):
+        return {"kind": self.kind, "n_bits": self.n_bits}
+
+    def fingerprint_bits(self, mol):
+        # One bool per fingerprint bit.
+        raise NotImplementedError
+
+    def _empty(self):
+        return (
+            np.zeros((0, self.words), dtype=np.uint64),
+            np.zeros(0, dtype=np.uint16),
+            np.zeros((0, 16), dtype=np.uint8),
+        )
+
+    @staticmethod
+    def _bucket(counts):
+        # Distinct bit counts of a sorted counts array and their row ranges.
+        values, starts = np.unique(counts, return_index=True)
+        ends = np.append(starts[1:], len(counts))
+        return values.astype(np.int32), starts, ends
+
+    def fingerprint(self, smiles):
+        """Packed fingerprint words and bit count of smiles, or None when it does not parse."""
+        mol = Chem.MolFromSmiles(smiles) if smiles else None
+        if mol is None:
+            return None
+        return self.pack(mol)
+
+    def pack(self, mol):
+        bits = self.fingerprint_bits(mol)
+        words = np.packbits(bits, bitorder="little").view(np.uint64)
+        return words, int(bits.sum())
+
+    def _fingerprint_rows(self, rows):
+        # rows of (id, smiles) -> (fps, counts, ids) for the ones that parse.
+        fps, counts, ids = [], [], []
+        for pk, smiles in rows:
+            result = self.fingerprint(smiles)
+            if result is None:
+                continue
+            fps.append(result[0])
+            counts.append(result[1])
+            ids.append(np.frombuffer(pk.bytes, dtype=np.uint8))
+        if not fps:
+            return self._empty()
+        return np.vstack(fps), np.array(counts, dtype=np.uint16), np.vstack(ids)
+
+    def start_loading(self):
+        """Map the persisted index (building it first if there is none) on a background thread."""
+        with self._lock:
+            if self.loaded or self._loading:
+                return
+            self._loading = True
+        threading.Thread(target=self._load_or_build, name=f"{self.kind}-index-load", daemon=True).start()
+
+    def _load_or_build(self):
+        try:
+            with self._lock:
+                found = self.load()
+            if not found:
+                self.build()
+            self.loaded = True
+            self.sync(force=True)
+        except Exception as e:
+            # Retried by the next search.
+            print(f"Failed to load {self.kind} index: {e}")
+        finally:
+            self._loading = False
+            connection.close()
+
+    def ensure_loaded(self):
+        """Catch up with the table; raises IndexNotReady (and starts loading) until the index is loaded."""
+        if not self.loaded:
+            self.start_loading()
+            raise IndexNotReady(f"The {self.kind} index is still being built; try again shortly.")
+        self.sync()
+
+    def build(self):
+        start = time.perf_counter()
+        queryset = Compound.objects.exclude(smiles__isnull=True).values_list("id", "smiles", "created_at")
+        rows, created = [], []
+        for pk, smiles, created_at in queryset.iterator(chunk_size=10000):
+            rows.append((pk, smiles))
+            created.append(created_at)
+
+        main = self._sorted(*self._fingerprint_rows(rows))
+        synced_at = max(created) if created else None
+        recent = {}
+        if synced_at is not None:
+            cutoff = synced_at - SYNC_OVERLAP
+            recent = {pk: created_at for (pk, _), created_at in zip(rows, created) if created_at >= cutoff}
+
+        with self._write_lock:
+            self.save(main, synced_at, recent)
+            with self._lock:
+                self._swap_main(main)
+                self._delta = self._empty()
+                self.synced_at = synced_at
+                self._recent = recent
+                self.last_sync = time.monotonic()
+        print(f"Built {self.kind} index of {len(self._main[1])} compounds in {time.perf_counter() - start:.1f}s.")
+
+    @staticmethod
+    def _sorted(fps, counts, ids):
+        order = np.argsort(counts, kind="stable")
+        return fps[order], counts[order], ids[order]
+
+    def _swap_main(self, main):
+        # Called under self._lock once main has been saved: the saved file is
+        # mapped, so the workers of one server share its pages.
+        if self.path is None:
+            self._set_main(*main)
+        else:
+            self._map()
+
+    def _set_main(self, fps, counts, ids):
+        self._main = (fps, counts, ids)
+        self._buckets = self._bucket(counts)
+        self._lookup = None
+
+    def _snapshot(self):
+        with self._lock:
+            return self._main, self._buckets, self._delta
+
+    def sync(self, force=False):
+        """Add compounds created (by any process) since the last sync, at most every sync_interval seconds."""
+        if not force and time.monotonic() - self.last_sync < self.sync_interval:
+            return
+        with self._lock:
+            if not force and time.monotonic() - self.last_sync < self.sync_interval:
+                return
+            self.last_sync = time.monotonic()
+            synced_at = self.synced_at
+
+        # Queried without the lock, so searches are not held up by the database.
+        queryset = Compound.objects.exclude(smiles__isnull=True)
+        if synced_at is not None:
+            queryset = queryset.filter(created_at__gt=synced_at - SYNC_OVERLAP)
+        rows = list(queryset.values_list("id", "smiles", "created_at"))
+
+        with self._lock:
+            # A concurrent sync may have indexed some of the rows meanwhile,
+            # and pruned them from _recent if they fell out of the overlap.
+            cutoff = self.synced_at - SYNC_OVERLAP if self.synced_at is not None else None
+            fresh = [
+                (pk, smiles, created_at) for pk, smiles, created_at in rows
+                if pk not in self._recent and (cutoff is None or created_at >= cutoff)
+            ]
+            if fresh:
+                self._append(fresh)
+                self.synced_at = max([created_at for _, _, created_at in fresh] + ([self.synced_at] if self.synced_at else []))
+                self._prune_recent()
+
+    def add(self, compounds):
+        """Index newly created compounds right away; a no-op until the index is loaded."""
+        if not self.loaded:
+            return
+        with self._lock:
+            fresh = [(c.pk, c.smiles, c.created_at) for c in compounds if c.smiles and c.pk not in self._recent]
+            if fresh:
+                self._append(fresh)
+
+    def _append(self, fresh):
+        fps, counts, ids = self._fingerprint_rows([(pk, smiles) for pk, smiles, _ in fresh])
+        delta_fps, delta_counts, delta_ids = self._delta
+        self._delta = (
+            np.vstack([delta_fps, fps]),
+            np.concatenate([delta_counts, counts]),
+            np.vstack([delta_ids, ids]),
+        )
+        for pk, _, created_at in fresh:
+            self._recent[pk] = created_at
+        self._maybe_compact()
+
+    def _prune_recent(self):
+        if self.synced_at is not None:
+            cutoff = self.synced_at - SYNC_OVERLAP
+            self._recent = {pk: created_at for pk, created_at in self._recent.items() if created_at >= cutoff}
+
+    def _maybe_compact(self):
+        if self._compacting:
+            return
+        if len(self._delta[1]) < max(self.compact_min_rows, self.compact_fraction * len(self._main[1])):
+            return
+        self._compacting = True
+        threading.Thread(target=self._compact_in_background, name=f"{self.kind}-index-compact", daemon=True).start()
+
+    def _compact_in_background(self):
+        try:
+            self.compact()
+        finally:
+            connection.close()
+
+    def compact(self):
+        """Merge the delta into the sorted main matrix, without deleted compounds, and persist it."""
+        try:
+            with self._write_lock:
+                with self._lock:
+                    # The sync position is saved as of this snapshot, so a
+                    # restart fetches again whatever is appended meanwhile.
+                    main, delta = self._main, self._delta
+                    synced_at, recent = self.synced_at, dict(self._recent)
+                merged = self._sorted(*(np.concatenate([m, d]) for m, d in zip(main, delta)))
+                existing = self._existing(merged[2])
+                merged = tuple(array[existing] for array in merged)
+                self.save(merged, synced_at, recent)
+                with self._lock:
+                    # Rows appended while merging stay in the delta.
+                    n = len(delta[1])
+                    self._delta = tuple(array[n:] for array in self._delta)
+                    self._swap_main(merged)
+        except Exception as e:
+            print(f"Failed to compact {self.kind} index: {e}")
+        finally:
+            self._compacting = False
+
+    @staticmethod
+    def _existing(ids):
+        # Mask of the rows of ids (an (n, 16) uint8 array) whose compound still exists.
+        existing = b"".join(pk.bytes for pk in Compound.objects.values_list("id", flat=True).iterator(chunk_size=10000))
+        full = np.dtype((np.void, 16))
+        return np.isin(
+            np.ascontiguousarray(ids).view(full).ravel(),
+            np.frombuffer(existing, dtype=np.uint8).reshape(-1, 16).view(full).ravel(),
+        )
+
+    def save(self, main, synced_at, recent):
+        # Writes the (fps, counts, ids) arrays of main without taking
+        # self._lock, so searches go on during the write. The file is written
+        # next to the target and renamed over it, so other processes map
+        # either the old or the new file, never a partial one. recent holds
+        # the indexed ids inside the sync overlap, which the first sync after
+        # loading must not add again.
+        if self.path is None:
+            return
+        fps, counts, ids = main
+        header = json.dumps({
+            "params": self.params,
+            "rows": len(counts),
+            "synced_at": synced_at.isoformat() if synced_at else None,
+            "recent": {str(pk): created_at.isoformat() for pk, created_at in recent.items()},
+        }).encode("utf-8")
+        fps_offset = _align(len(MAGIC) + 4 + len(header))
+        counts_offset = _align(fps_offset + fps.nbytes)
+        ids_offset = _align(counts_offset + counts.nbytes)
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix=f".{self.kind}-", dir=self.path.parent)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(MAGIC + len(header).to_bytes(4, "little") + header)
+                for offset, array in ((fps_offset, fps), (counts_offset, counts), (ids_offset, ids)):
+                    f.seek(offset)
+                    f.write(np.ascontiguousarray(array).tobytes())
+            os.replace(tmp_path, self.path)
+        except Exception:
+            os.unlink(tmp_path)
+            raise
+
+    def load(self):
+        """Map the persisted index; False when there is none or it was built with other parameters."""
+        if self.path is None or not self.path.is_file():
+            return False
+        try:
+            header = self._map()
+        except (OSError, ValueError) as e:
+            print(f"Ignoring {self.kind} index {self.path}: {e}")
+            return False
+        if header is None:
+            return False
+        self.synced_at = parse_datetime(header["synced_at"]) if header["synced_at"] else None
+        self._recent = {uuid.UUID(pk): parse_datetime(created_at) for pk, created_at in header["recent"].items()}
+        self._delta = self._empty()
+        return True
+
+    def _map(self):
+        with open(self.path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError("not a fingerprint index")
+            header_length = int.from_bytes(f.read(4), "little")
+            header = json.loads(f.read(header_length))
+        if header.get("params") != self.params:
+            print(f"{self.kind.capitalize()} index {self.path} was built with other fingerprint parameters; rebuilding.")
+            return None
+
+        n = header["rows"]
+        fps_offset = _align(len(MAGIC) + 4 + header_length)
+        counts_offset = _align(fps_offset + n * self.words * 8)
+        ids_offset = _align(counts_offset + n * 2)
+        if n == 0:
+            self._set_main(*self._empty())
+            return header
+        self._set_main(
+            np.memmap(self.path, dtype=np.uint64, mode="r", offset=fps_offset, shape=(n, self.words)),
+            np.memmap(self.path, dtype=np.uint16, mode="r", offset=counts_offset, shape=(n,)),
+            np.memmap(self.path, dtype=np.uint8, mode="r", offset=ids_offset, shape=(n, 16)),
+        )
+        return header
+
+    def stats(self):
+        with self._lock:
+            return {
+                "loaded": self.loaded,
+                "rows": len(self._main[1]) + len(self._delta[1]),
+                "delta_rows": len(self._delta[1]),
+                "params": self.params,
+                "synced_at": self.synced_at.isoformat() if self.synced_at else None,
+                "path": str(self.path) if self.path else None,
+            }
+
+
+class SimilarityIndex(FingerprintIndex):
+    """
+    Tanimoto search over Morgan fingerprints.
+
+    Search uses the bit-count bound: a row with b bits can score at most
+    min(a, b) / max(a, b) against a query with a bits, so rows are visited
+    one bit-count bucket at a time from the most promising outwards, and the
+    scan stops once no remaining bucket can beat the k-th best hit or the
+    threshold.
+    """
+
+    kind = "similarity"
+
+    def __init__(self, path=None, radius=2, n_bits=2048, **kwargs):
+        self.radius = radius
+        self._generator = None
+        super().__init__(path, n_bits, **kwargs)
+
+    @property
+    def params(self):
+        return {**super().params, "fingerprint": "morgan", "radius": self.radius}
+
+    def fingerprint_bits(self, mol):
+        if self._generator is None:
+            self._generator = GetMorganGenerator(radius=self.radius, fpSize=self.n_bits)
+        return self._generator.GetFingerprintAsNumPy(mol).astype(bool)
+
+    def search(self, smiles, k=10, threshold=0.0):
+        """
+        The k compounds most similar to smiles with Tanimoto similarity of at
+        least threshold, as [(compound id, similarity)], best first. Raises
+        ValueError for SMILES that do not parse.
+        """
+        query = self.fingerprint(smiles)
+        if query is None:
+            raise ValueError(f"Invalid SMILES input of {smiles}")
+        q, a = query
+        if a == 0 or k <= 0:
+            return []
+
+        self.ensure_loaded()
+        main, (values, starts, ends), delta = self._snapshot()
+
+        heap = []
+        n_main = len(main[1])
+
+        def score(fps, counts, offset):
+            for block in range(0, len(counts), BLOCK_ROWS):
+                block_fps = fps[block:block + BLOCK_ROWS]
+                common = popcount_rows(np.bitwise_and(block_fps, q))
+                scores = common / (a + counts[block:block + BLOCK_ROWS].astype(np.int32) - common)
+                floor = max(threshold, heap[0][0]) if len(heap) == k else threshold
+                candidates = np.flatnonzero(scores >= floor)
+                if len(candidates) > k:
+                    candidates = candidates[np.argpartition(scores[candidates], -k)[-k:]]
+                for i in candidates.tolist():
+                    item = (float(scores[i]), offset + block + i)
+                    if len(heap) < k:
+                        heapq.heappush(heap, item)
+                    elif item > heap[0]:
+                        heapq.heapreplace(heap, item)
+
+        score(delta[0], delta[1], n_main)
+
+        bounds = np.minimum(values, a) / np.maximum(values, a)
+        for bucket in np.argsort(-bounds, kind="stable").tolist():
+            bound = bounds[bucket]
+            if bound < threshold or (len(heap) == k and bound <= heap[0][0]):
+                break
+            start, end = starts[bucket], ends[bucket]
+            score(main[0][start:end], main[1][start:end], start)
+
+        hits = []
+        for similarity, row in sorted(heap, reverse=True):
+            ids = main[2] if row < n_main else delta[2]
+            hits.append((uuid.UUID(bytes=ids[row if row < n_main else row - n_main].tobytes()), similarity))
+        return hits
+
+class SubstructureIndex(FingerprintIndex):
+    """
+    Substructure prescreen over RDKit pattern fingerprints.
+
+    A molecule can only contain the query if its fingerprint has every bit
+    of the query's, and so at least as many bits, which skips the buckets
+    with fewer.
+    """
+
+    kind = "substructure"
+
+    @property
+    def params(self):
+        return {**super().params, "fingerprint": "pattern"}
+
+    def fingerprint_bits(self, mol):
+        bits = np.zeros(self.n_bits, dtype=bool)
+        DataStructs.ConvertToNumpyArray(Chem.PatternFingerprint(mol, fpSize=self.n_bits), bits)
+        return bits
+
+    def _main_lookup(self, ids):
+        # First 8 id bytes of the main rows, sorted, built once per mapped file.
+        with self._lock:
+            if self._lookup is None or self._lookup[0] is not ids:
+                keys = np.ascontiguousarray(ids[:, :8]).view(np.uint64).ravel()
+                order = np.argsort(keys, kind="stable")
+                self._lookup = (ids, order, keys[order])
+            return self._lookup[1:]
+
+    @staticmethod
+    def _rows_of(ids, wanted, lookup=None):
+        # Rows of ids (an (n, 16) uint8 array) equal to a row of wanted, found
+        # by binary search over the first 8 bytes and confirmed on all 16.
+        if lookup is None:
+            keys = np.ascontiguousarray(ids[:, :8]).view(np.uint64).ravel()
+            order = np.argsort(keys, kind="stable")
+            lookup = (order, keys[order])
+        order, sorted_keys = lookup
+        wanted_keys = np.ascontiguousarray(wanted[:, :8]).view(np.uint64).ravel()
+        lo = np.searchsorted(sorted_keys, wanted_keys, side="left")
+        hi = np.searchsorted(sorted_keys, wanted_keys, side="right")
+        rows = np.concatenate([order[a:b] for a, b in zip(lo.tolist(), hi.tolist()) if b > a] or [np.zeros(0, dtype=np.intp)])
+        full = np.dtype((np.void, 16))
+        rows = rows[np.isin(np.ascontiguousarray(ids[rows]).view(full).ravel(), wanted.view(full).ravel())]
+        return np.sort(rows)
+
+    def screen(self, query, compound_ids=None):
+        """
+        Ids of the indexed compounds (among compound_ids, if given) whose
+        pattern fingerprint contains every bit of the query mol's. Compounds
+        whose SMILES did not parse are never returned.
+        """
+        q, a = self.pack(query)
+        self.ensure_loaded()
+        main, _, delta = self._snapshot()
+        if compound_ids is not None:
+            wanted = np.frombuffer(b"".join(pk.bytes for pk in compound_ids), dtype=np.uint8).reshape(-1, 16)
+
+        hits = []
+        for segment, (fps, counts, ids) in (("main", main), ("delta", delta)):
+            if compound_ids is not None:
+                rows = self._rows_of(ids, wanted, self._main_lookup(ids) if segment == "main" else None)
+                rows = rows[counts[rows] >= a]
+            elif segment == "main":
+                # Sorted by bit count, so the rows with at least a bits are a suffix.
+                rows = np.arange(int(np.searchsorted(counts, a, side="left")), len(counts))
+            else:
+                rows = np.flatnonzero(counts >= a)
+            for block in range(0, len(rows), BLOCK_ROWS):
+                chunk = rows[block:block + BLOCK_ROWS]
+                contained = (np.bitwise_and(fps[chunk], q) == q).all(axis=1)
+                hits.append(ids[chunk[contained]])
+
+        found = np.vstack(hits) if hits else np.zeros((0, 16), dtype=np.uint8)
+        return [uuid.UUID(bytes=row.tobytes()) for row in found]
+
+
+SIMILARITY_INDEX = SimilarityIndex(
+    Path(settings.COMPOUND_INDEX_DIR) / "similarity.bin",
+    radius=settings.SIMILARITY_FP_RADIUS,
+    n_bits=settings.SIMILARITY_FP_BITS,
+    sync_interval=settings.COMPOUND_INDEX_SYNC_SECONDS,
+)
+
+SUBSTRUCTURE_INDEX = SubstructureIndex(
+    Path(settings.COMPOUND_INDEX_DIR) / "substructure.bin",
+    n_bits=settings.SUBSTRUCTURE_FP_BITS,
+    sync_interval=settings.COMPOUND_INDEX_SYNC_SECONDS,
+)
+
+
+def start_loading():
+    """Start mapping (or building) both indexes in this process."""
+    for index in (SIMILARITY_INDEX, SUBSTRUCTURE_INDEX):
+        index.start_loading()
@@ -0,0 +1,68 @@
+from drf_spectacular.utils import OpenApiResponse, OpenApiExample, OpenApiTypes
+from .serializers import SimilaritySearchSerializer, SubstructureSearchSerializer
+
+compound_similarity_schema = {
+    "description": "Find the compounds most similar to a SMILES by Tanimoto similarity of their Morgan fingerprints, across every compound ever predicted. Returns up to `k` compounds with similarity of at least `threshold`, best first.",
+    "request": SimilaritySearchSerializer,
+    "responses": {
+        200: OpenApiResponse(
+            description="Similar compounds.",
+            response=OpenApiTypes.OBJECT,
+            examples=[
+                OpenApiExample(
+                    name="Similarity Search Success",
+                    value={
+                        "status": "success",
+                        "message": "Found 1 similar compounds.",
+                        "data": [
+                            {
+                                "similarity": 0.7143,
+                                "compound": {
+                                    "id": "uuid-of-compound-1",
+                                    "iupac_name": "propan-1-ol",
+                                    "cid": "1031",
+                                    "smiles": "CCCO",
+                                }
+                            }
+                        ]
+                    }
+                )
+            ]
+        ),
+        400: OpenApiResponse(description="Invalid SMILES or parameters."),
+        403: OpenApiResponse(description="Forbidden: User not authenticated."),
+        503: OpenApiResponse(description="The similarity index is still being built after a restart."),
+    }
+}
+
+compound_substructure_schema = {
+    "description": "Find the compounds in your prediction history (every prediction for admins) that contain a substructure, given as SMARTS or SMILES. Candidates are prescreened by their stored pattern fingerprints and only the survivors are matched. Returns the matching prediction results, newest first.",
+    "request": SubstructureSearchSerializer,
+    "responses": {
+        200: OpenApiResponse(
+            description="Prediction results of the compounds containing the substructure.",
+            response={
+                "type": "object",
+                "properties": {
+                    "status": {"type": "string"},
+                    "message": {"type": "string"},
+                    "data": {
+                        "type": "array",
+                        "items": {"$ref": "#/components/schemas/PredictionCompound"}
+                    },
+                    "stats": {
+                        "type": "object",
+                        "properties": {
+                            "compounds": {"type": "integer"},
+                            "candidates": {"type": "integer"},
+                            "matches": {"type": "integer"},
+                        }
+                    }
+                }
+            }
+        ),
+        400: OpenApiResponse(description="Invalid query."),
+        403: OpenApiResponse(description="Forbidden: User not authenticated."),
+        503: OpenApiResponse(description="The substructure index is still being built after a restart."),
+    }
+}
@@ -0,0 +1,16 @@
+from rest_framework import serializers
+from api.models import Compound
+
+class CompoundSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Compound
+        exclude = ['created_at']
+
+class SimilaritySearchSerializer(serializers.Serializer):
+    smiles = serializers.CharField(help_text="Query SMILES")
+    k = serializers.IntegerField(required=False, default=10, min_value=1, max_value=1000, help_text="Number of most similar compounds to return")
+    threshold = serializers.FloatField(required=False, default=0.0, min_value=0.0, max_value=1.0, help_text="Minimum Tanimoto similarity")
+
+class SubstructureSearchSerializer(serializers.Serializer):
+    query = serializers.CharField(help_text="Substructure as SMARTS (or SMILES with query_type 'smiles'), e.g. Nc1ccnc2ccccc12")
+    query_type = serializers.ChoiceField(choices=["smarts", "smiles"], required=False, default="smarts", help_text="How to parse the query")
@@ -0,0 +1,7 @@
+from django.urls import path
+from .views import CompoundSimilarityView, CompoundSubstructureView
+
+urlpatterns = [
+  path('similar/', CompoundSimilarityView.as_view(), name='compound_similar'),
+  path('substructure/', CompoundSubstructureView.as_view(), name='compound_substructure'),
+]
@@ -0,0 +1,124 @@
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from rdkit import Chem
+from rest_framework import status
+from rest_framework.views import APIView
+from rest_framework.response import Response
+from rest_framework.permissions import IsAuthenticated
+from drf_spectacular.utils import extend_schema
+from api.models import Compound, PredictionCompound
+from api.v1.prediction_compounds.serializers import PredictionCompoundSerializer
+from .index import SIMILARITY_INDEX, SUBSTRUCTURE_INDEX, IndexNotReady
+from .schemas import compound_similarity_schema, compound_substructure_schema
+from .serializers import CompoundSerializer, SimilaritySearchSerializer, SubstructureSearchSerializer
+
+# Compounds fetched, parsed and matched per task.
+MATCH_CHUNK_SIZE = 500
+
+def _parsed_chunks(compound_ids):
+    # (id, mol) of each chunk of compound_ids whose SMILES parse.
+    for start in range(0, len(compound_ids), MATCH_CHUNK_SIZE):
+        rows = Compound.objects.filter(id__in=compound_ids[start:start + MATCH_CHUNK_SIZE]).values_list("id", "smiles")
+        mols = [(pk, Chem.MolFromSmiles(smiles)) for pk, smiles in rows if smiles]
+        yield [(pk, mol) for pk, mol in mols if mol is not None]
+
+def _match_chunk(query, mols):
+    return [pk for pk, mol in mols if mol.HasSubstructMatch(query)]
+
+def match_substructure(query, compound_ids, workers=None):
+    """
+    Ids among compound_ids whose SMILES contain query. Each chunk's SMILES
+    are read and parsed on the request thread, so worker threads never open
+    database connections; its HasSubstructMatch calls, which release the
+    GIL, run on up to workers (SUBSTRUCTURE_MATCH_WORKERS) threads while the
+    next chunk is parsed.
+    """
+    workers = settings.SUBSTRUCTURE_MATCH_WORKERS if workers is None else workers
+    compound_ids = list(compound_ids)
+    if workers <= 1 or len(compound_ids) <= MATCH_CHUNK_SIZE:
+        return [pk for mols in _parsed_chunks(compound_ids) for pk in _match_chunk(query, mols)]
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(_match_chunk, query, mols) for mols in _parsed_chunks(compound_ids)]
+        return [pk for future in futures for pk in future.result()]
+
+def similar_compounds(smiles, k, threshold):
+    """
+    The k existing compounds most similar to smiles, as [(compound,
+    similarity)]. Compounds deleted since they were indexed are skipped, so
+    more hits are fetched until k remain or the index has no more.
+    """
+    fetch = k
+    while True:
+        hits = SIMILARITY_INDEX.search(smiles, k=fetch, threshold=threshold)
+        compounds = Compound.objects.in_bulk([pk for pk, _ in hits])
+        found = [(compounds[pk], similarity) for pk, similarity in hits if pk in compounds]
+        if len(found) >= k or len(hits) < fetch:
+            return found[:k]
+        fetch *= 2
+
+class CompoundSimilarityView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    @extend_schema(**compound_similarity_schema)
+    def post(self, request, *args, **kwargs):
+        serializer = SimilaritySearchSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        params = serializer.validated_data
+
+        try:
+            hits = similar_compounds(params["smiles"], params["k"], params["threshold"])
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except IndexNotReady as e:
+            return Response({"error": str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+        data = [
+            {"similarity": round(similarity, 4), "compound": CompoundSerializer(compound).data}
+            for compound, similarity in hits
+        ]
+        return Response({
+            "status": "success",
+            "message": f"Found {len(data)} similar compounds.",
+            "data": data
+        }, status=status.HTTP_200_OK)
+
+class CompoundSubstructureView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    @extend_schema(**compound_substructure_schema)
+    def post(self, request, *args, **kwargs):
+        serializer = SubstructureSearchSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        query_text = serializer.validated_data["query"]
+        query_type = serializer.validated_data["query_type"]
+
+        query = Chem.MolFromSmarts(query_text) if query_type == "smarts" else Chem.MolFromSmiles(query_text)
+        if query is None:
+            return Response({"error": f"Invalid {query_type.upper()} query of {query_text}"}, status=status.HTTP_400_BAD_REQUEST)
+
+        results = PredictionCompound.objects.select_related('prediction', 'prediction__user', 'prediction__ml_model', 'compound')
+        compound_ids = None
+        if request.user.role != 'admin':
+            results = results.filter(prediction__user=request.user)
+            compound_ids = set(results.values_list('compound_id', flat=True))
+
+        try:
+            candidates = SUBSTRUCTURE_INDEX.screen(query, compound_ids)
+        except IndexNotReady as e:
+            return Response({"error": str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        matched = match_substructure(query, candidates)
+
+        results = results.filter(compound_id__in=matched).order_by('-prediction__created_at')
+        return Response({
+            "status": "success",
+            "message": f"Found {len(matched)} compounds containing the substructure.",
+            "data": PredictionCompoundSerializer(results, many=True).data,
+            "stats": {
+                "compounds": len(compound_ids) if compound_ids is not None else SUBSTRUCTURE_INDEX.stats()["rows"],
+                "candidates": len(candidates),
+                "matches": len(matched),
+            }
+        }, status=status.HTTP_200_OK)
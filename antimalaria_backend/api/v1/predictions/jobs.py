@@ -0,0 +1,223 @@
+"""
+Background execution of prediction requests.
+
+A job is a Prediction row in the "queued" state whose request (SMILES and
+models) is kept in job_input; the table is the queue, so no broker is
+needed and any number of worker threads, in the web processes or in
+`manage.py run_prediction_jobs`, can share it. A worker claims a job with a
+conditional UPDATE (only one claimant sees it still queued), then runs the
+same stages as a synchronous request: the ML call in chunks, PubChem
+enrichment of new compounds, and saving the results. Stage, progress and a
+heartbeat are written to the row as it goes; clients poll them and read the
+results once completed_at is set.
+
+A running job whose heartbeat is older than PREDICTION_JOB_STALE_SECONDS
+belonged to a worker that died and is queued again, up to
+PREDICTION_JOB_MAX_ATTEMPTS runs. Deleting a job's Prediction cancels it.
+"""
+import threading
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import F
+from django.utils import timezone
+from api.models import Prediction
+
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+
+# Share of the overall progress covered by each stage.
+STAGES = {
+    "predicting": (0.0, 0.6),
+    "enriching": (0.6, 0.9),
+    "saving": (0.9, 1.0),
+}
+
+# Progress is written at most this often (seconds), heartbeats included.
+PROGRESS_INTERVAL = 1.0
+
+# Queued jobs looked at per claim when picking the next one.
+CLAIM_CANDIDATES = 20
+
+
+class JobCancelled(Exception):
+    """The job was deleted, or handed to another worker, while it ran."""
+
+
+def submit(user, smiles_list, input_positions, input_source_type, ml_model=None, **params):
+    """
+    Queue a prediction of smiles_list (deduplicated, with input_positions
+    mapping each to its first index in the submitted input). params are the
+    request's model_method/model_descriptor or models/consensus.
+    """
+    job = Prediction.objects.create(
+        user=user,
+        ml_model=ml_model,
+        input_source_type=input_source_type,
+        status=QUEUED,
+        progress=0.0,
+        job_input={
+            "smiles": smiles_list,
+            "positions": [input_positions[smiles] for smiles in smiles_list],
+            **params,
+        },
+    )
+    WORKERS.notify()
+    return job
+
+
+def requeue_stale():
+    """Queue again (or fail, past the attempt limit) jobs whose worker stopped."""
+    now = timezone.now()
+    stale = Prediction.objects.filter(
+        status=RUNNING,
+        heartbeat_at__lt=now - timedelta(seconds=settings.PREDICTION_JOB_STALE_SECONDS),
+    )
+    stale.filter(attempts__lt=settings.PREDICTION_JOB_MAX_ATTEMPTS).update(status=QUEUED, stage=None, heartbeat_at=None)
+    stale.update(status=FAILED, error="The job's worker stopped responding.", heartbeat_at=None, completed_at=now)
+
+
+def claim():
+    """
+    Take the next queued job, or return None. The oldest job wins, except
+    that users without a running job go before those who have one, so one
+    user's backlog does not hold up everyone else.
+    """
+    candidates = list(
+        Prediction.objects.filter(status=QUEUED).order_by("created_at").values_list("id", "user_id")[:CLAIM_CANDIDATES]
+    )
+    if not candidates:
+        return None
+    busy = set(Prediction.objects.filter(status=RUNNING).values_list("user_id", flat=True))
+    candidates.sort(key=lambda candidate: candidate[1] in busy)
+
+    for job_id, _ in candidates:
+        now = timezone.now()
+        claimed = Prediction.objects.filter(id=job_id, status=QUEUED).update(
+            status=RUNNING, stage=None, progress=0.0, started_at=now, heartbeat_at=now, attempts=F("attempts") + 1
+        )
+        if claimed:
+            return Prediction.objects.select_related("user", "ml_model").get(id=job_id)
+    return None
+
+
+class JobTracker:
+    """
+    Progress of one running job, written to its row. Raises JobCancelled
+    from any update once the row is gone or no longer running.
+    """
+
+    def __init__(self, job):
+        self.job = job
+        self.stage_name = None
+        self._written_at = 0.0
+
+    def stage(self, name):
+        self.stage_name = name
+        self._write(STAGES[name][0], force=True)
+
+    def update(self, done, total):
+        start, end = STAGES[self.stage_name]
+        self._write(start + (end - start) * done / max(total, 1))
+
+    def complete(self, result):
+        self._write(1.0, force=True, status=COMPLETED, result=result, completed_at=timezone.now(), heartbeat_at=None)
+
+    def _write(self, progress, force=False, **fields):
+        now = time.monotonic()
+        if not force and now - self._written_at < PROGRESS_INTERVAL:
+            return
+        self._written_at = now
+        fields.setdefault("heartbeat_at", timezone.now())
+        updated = Prediction.objects.filter(id=self.job.id, status=RUNNING).update(
+            stage=self.stage_name, progress=round(progress, 4), **fields
+        )
+        if not updated:
+            raise JobCancelled()
+
+
+def fail(job, error, result=None):
+    Prediction.objects.filter(id=job.id, status=RUNNING).update(
+        status=FAILED, error=error, result=result, heartbeat_at=None, completed_at=timezone.now()
+    )
+
+
+def run(job):
+    """Execute a claimed job and record its outcome."""
+    from .views import PredictIC50View
+
+    params = dict(job.job_input)
+    smiles_list = params.pop("smiles")
+    input_positions = dict(zip(smiles_list, params.pop("positions")))
+    try:
+        status_code, payload = PredictIC50View().predict(
+            job.user, smiles_list, input_positions, job.input_source_type,
+            tracker=JobTracker(job), job=job, **params
+        )
+    except JobCancelled:
+        print(f"Prediction job {job.id} was cancelled.")
+        return
+    except Exception as e:
+        print(f"Prediction job {job.id} failed: {e}")
+        fail(job, str(e) or type(e).__name__)
+        return
+
+    if status_code >= 400:
+        fail(job, payload.get("error") or "Prediction failed.", result=payload)
+
+
+class JobWorkers:
+    """Worker threads polling for queued jobs in this process."""
+
+    def __init__(self):
+        self.threads = []
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._last_requeue = 0.0
+
+    def start(self, workers):
+        with self._lock:
+            for i in range(len(self.threads), workers):
+                thread = threading.Thread(target=self.loop, name=f"prediction-job-{i}", daemon=True)
+                thread.start()
+                self.threads.append(thread)
+
+    def notify(self):
+        self._wake.set()
+
+    def loop(self, stop=None):
+        """Run jobs until stop (a threading.Event) is set, or forever."""
+        stop = stop or threading.Event()
+        while not stop.is_set():
+            close_old_connections()
+            try:
+                self._maybe_requeue()
+                job = claim()
+            except Exception as e:
+                # Typically the database is unreachable or not migrated yet.
+                print(f"Prediction job queue unavailable: {e}")
+                job = None
+            if job is None:
+                self._wake.wait(settings.PREDICTION_JOB_POLL_SECONDS)
+                self._wake.clear()
+                continue
+            run(job)
+        close_old_connections()
+
+    def _maybe_requeue(self):
+        with self._lock:
+            if time.monotonic() - self._last_requeue < settings.PREDICTION_JOB_STALE_SECONDS / 2:
+                return
+            self._last_requeue = time.monotonic()
+        requeue_stale()
+
+
+WORKERS = JobWorkers()
+
+
+def start_workers(workers=None):
+    """Start the worker threads of this process (PREDICTION_JOB_WORKERS by default)."""
+    WORKERS.start(settings.PREDICTION_JOB_WORKERS if workers is None else workers)
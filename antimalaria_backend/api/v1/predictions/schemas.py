@@ -1,5 +1,5 @@
 from drf_spectacular.utils import OpenApiResponse, OpenApiExample, OpenApiTypes
-from .serializers import PredictionSerializer, PredictionInputSerializer
+from .serializers import PredictionSerializer, PredictionInputSerializer, PredictionJobSerializer
 
 # PredictionViewSet schemas
 prediction_list_schema = {
@@ -54,7 +54,7 @@ prediction_download_schema = {
 }
 
 predict_ic50_schema = {
-    "description": "Submit a comma-separated string/CSV file with SMILES strings to predict IC50 values using the specified ML model.",
+    "description": "Submit a comma-separated string/CSV file with SMILES strings to predict IC50 values using the specified ML model. Invalid SMILES are reported per index in `errors` while the valid ones are still predicted and saved. With `models` (\"all\" or a list of {model_method, model_descriptor}) the SMILES are predicted by every listed model in one call, each saved as its own prediction and returned per model in `data`, with an optional `consensus` (mean or median) across models. With `background` the request is queued as a job instead: the response is 202 with the prediction id, and `predictions/jobs/{id}/` reports its status and progress until `completed_at` is set.",
     "request": PredictionInputSerializer,
     "responses": {
         200: OpenApiResponse(
@@ -101,11 +101,45 @@ predict_ic50_schema = {
                                     "molecular_formula": "C2H7N"
                                 } 
                             }
+                        ],
+                        "errors": []
+                    }
+                ),
+                OpenApiExample(
+                    name="Partial Success",
+                    value={
+                        "status": "success",
+                        "message": "Prediction complete and saved for 1 SMILES.",
+                        "data": [
+                            {
+                                "smiles": "CCO",
+                                "pic50": 5.67,
+                                "lelp": 0.45,
+                                "category": "strong",
+                                "compound": {"id": "uuid-of-compound-1", "smiles": "CCO"}
+                            }
+                        ],
+                        "errors": [
+                            {"index": 1, "smiles": "C1CC", "error": "Unparsable SMILES syntax."}
                         ]
                     }
                 )
             ]
         ),
+        202: OpenApiResponse(
+            description="Prediction queued as a background job.",
+            response=OpenApiTypes.OBJECT,
+            examples=[
+                OpenApiExample(
+                    name="Job Queued",
+                    value={
+                        "status": "success",
+                        "message": "Prediction of 25000 SMILES queued.",
+                        "data": {"id": "uuid-of-prediction", "status": "queued"}
+                    }
+                )
+            ]
+        ),
         400: OpenApiResponse(
             description="Bad request.",
             response=OpenApiTypes.OBJECT,
@@ -118,3 +152,14 @@ predict_ic50_schema = {
         )
     }
 }
+
+prediction_job_schema = {
+    "description": "Status of a background prediction job: `status` (queued, running, completed or failed), the current `stage` (predicting, enriching, saving) and `progress` from 0 to 1. Once `completed_at` is set, `result` holds the response summary and invalid SMILES, and the compounds are read from the prediction (or, for several models, from the predictions listed in `result.models`).",
+    "responses": {
+        200: OpenApiResponse(
+            description="Job status.",
+            response=PredictionJobSerializer
+        ),
+        404: OpenApiResponse(description="Prediction not found."),
+    }
+}
@@ -34,17 +34,38 @@ class PredictionSerializer(serializers.ModelSerializer):
         fields = [
             "id",
             "input_source_type",
+            "status",
             "created_at",
+            "completed_at",
             "user",
             "ml_model",
             "prediction_compounds" 
         ]
 
+class PredictionJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Prediction
+        fields = [
+            "id",
+            "status",
+            "stage",
+            "progress",
+            "error",
+            "attempts",
+            "created_at",
+            "started_at",
+            "completed_at",
+            "result",
+        ]
+
 class PredictionInputSerializer(serializers.Serializer):
     smiles = serializers.CharField(required=False, help_text="Comma-separated SMILES strings")
     file = serializers.FileField(required=False, help_text="CSV file containing SMILES in the first column")
-    model_method = serializers.CharField(required=True, help_text="Model method used for prediction")
-    model_descriptor = serializers.CharField(required=True, help_text="Model descriptor used for prediction")
+    model_method = serializers.CharField(required=False, help_text="Model method used for prediction (unless 'models' is given)")
+    model_descriptor = serializers.CharField(required=False, help_text="Model descriptor used for prediction (unless 'models' is given)")
+    models = serializers.JSONField(required=False, help_text="\"all\" or a list of {model_method, model_descriptor} to predict with several models in one call")
+    consensus = serializers.ChoiceField(choices=["mean", "median"], required=False, help_text="Aggregate the models' predictions per SMILES")
+    background = serializers.BooleanField(required=False, help_text="Queue the prediction as a background job and return its id at once")
 
     def validate(self, data):
         if not data.get('smiles') and not data.get('file'):
@@ -54,6 +75,9 @@ class PredictionInputSerializer(serializers.Serializer):
             if not data['file'].name.endswith(('.csv', '.json')):
                 raise serializers.ValidationError("File must be a CSV or JSON.")
         
+        if data.get('models') is not None:
+            return data
+
         if not data.get('model_descriptor'):
             raise serializers.ValidationError("Model descriptor is required.")
         
@@ -1,6 +1,6 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import PredictionViewSet, PredictIC50View, PredictionDownloadView
+from .views import PredictionViewSet, PredictIC50View, PredictionDownloadView, PredictionJobView
 
 router = DefaultRouter()
 router.register(r'', PredictionViewSet, basename='predictions')
@@ -9,5 +9,6 @@ router.register(r'', PredictionViewSet, basename='predictions')
 urlpatterns = [
   path('predict/', PredictIC50View.as_view(), name='predict'),
   path('download/<uuid:id>/', PredictionDownloadView.as_view(), name='download'),
+  path('jobs/<uuid:id>/', PredictionJobView.as_view(), name='prediction-job'),
   path('', include(router.urls)),
 ]
\ No newline at end of file
@@ -3,6 +3,10 @@ from rest_framework import status, viewsets
 from rest_framework.views import APIView
 import csv
 import io
+import json
+from contextlib import nullcontext
+from django.conf import settings
+from django.db import transaction
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
 import pubchempy as pcp
@@ -11,16 +15,20 @@ from rdkit import Chem
 from rdkit.Chem import Crippen
 from rest_framework.response import Response
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from .serializers import PredictionSerializer
+from .serializers import PredictionSerializer, PredictionJobSerializer
+from .wire import post_predict, post_predict_multi
+from . import jobs
 from rest_framework.permissions import IsAuthenticated
 from api.models import Prediction, Compound, PredictionCompound, MLModel
+from api.v1.compounds.index import SIMILARITY_INDEX, SUBSTRUCTURE_INDEX
 from drf_spectacular.utils import extend_schema_view, extend_schema
 from .schemas import (
     prediction_list_schema,
     prediction_retrieve_schema,
     prediction_destroy_schema,
     predict_ic50_schema,
-    prediction_download_schema
+    prediction_download_schema,
+    prediction_job_schema
 )
 import environ
 env = environ.Env()
@@ -76,8 +84,18 @@ class PredictIC50View(APIView):
         smiles_input = request.data.get("smiles", None)
         model_descriptor = request.data.get("model_descriptor", None)
         model_method = request.data.get("model_method", None)
+        # Several models at once: "all" active models or a list of
+        # {model_method, model_descriptor} (JSON-encoded in form uploads).
+        models = request.data.get("models", None)
+        consensus = request.data.get("consensus", None)
 
-        if not all([model_descriptor, model_method]):
+        if isinstance(models, str) and models != "all":
+            try:
+                models = json.loads(models)
+            except ValueError:
+                return Response({"error": 'models must be "all" or a list of {model_method, model_descriptor}.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        if models is None and not all([model_descriptor, model_method]):
             return Response(
                 {"error": "model_descriptor and model_method are required."},
                 status=status.HTTP_400_BAD_REQUEST
@@ -104,91 +122,267 @@ class PredictIC50View(APIView):
         else:
             return Response({"error": "Provide either a 'smiles' field or a 'file' (CSV)."}, status=status.HTTP_400_BAD_REQUEST)
 
-        seen = set()
-        smiles_list = [s for s in smiles_list if not (s in seen or seen.add(s))]
+        input_positions = {}
+        for position, smiles in enumerate(smiles_list):
+            input_positions.setdefault(smiles, position)
+        smiles_list = list(input_positions)
 
         if not smiles_list:
             return Response({"error": "No valid SMILES strings provided."}, status=status.HTTP_400_BAD_REQUEST)
         
-        try:
-            ml_predict_url = "http://localhost:8080/api/v1/predict/"
-            response = requests.post(ml_predict_url, json={
-                "smiles": smiles_list,
-                "model_method": model_method,
-                "model_descriptor": model_descriptor,
-                "input_source_type": "csv" if csv_file else "text",
-            })
-
-            if response.status_code != 200:
-                return Response({"error": "ML prediction API error.", "details": response.json().get("detail")}, status=status.HTTP_400_BAD_REQUEST)
+        input_source_type = "csv" if csv_file else "text"
+        if models is not None:
+            params = {"models": models, "consensus": consensus}
+        else:
+            params = {"model_method": model_method, "model_descriptor": model_descriptor}
 
-            predictions = response.json()
-            if "error" in predictions:
-                return Response(predictions, status=status.HTTP_400_BAD_REQUEST)
+        if str(request.data.get("background", "")).lower() in ("true", "1"):
+            ml_model = None
+            if models is None:
+                ml_model = get_object_or_404(MLModel, descriptor=model_descriptor, method=model_method, is_active=True)
+            job = jobs.submit(user, smiles_list, input_positions, input_source_type, ml_model=ml_model, **params)
+            return Response({
+                "status": "success",
+                "message": f"Prediction of {len(smiles_list)} SMILES queued.",
+                "data": {"id": str(job.id), "status": job.status},
+            }, status=status.HTTP_202_ACCEPTED)
 
-            if not predictions:
-                return Response({"error": "No predictions returned from ML API."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            status_code, payload = self.predict(user, smiles_list, input_positions, input_source_type, **params)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(payload, status=status_code)
+
+    def predict(self, user, smiles_list, input_positions, input_source_type, model_method=None, model_descriptor=None,
+                models=None, consensus=None, tracker=None, job=None):
+        """
+        Predict, enrich and save smiles_list with one model, or with several
+        when models is given; returns (status_code, response body).
+
+        A background job passes its tracker, which records the stages and
+        the progress, and its Prediction, which is filled with the results
+        instead of a new one; the ML service is then called in chunks.
+        """
+        if tracker is not None:
+            tracker.stage("predicting")
+        status_code, result = self.call_ml(
+            smiles_list, model_method, model_descriptor, models, consensus, input_source_type,
+            chunk_size=settings.PREDICTION_JOB_CHUNK_SIZE if job is not None else None,
+            tracker=tracker,
+        )
+        if status_code != 200:
+            details = result.get("detail") if isinstance(result, dict) else None
+            return status.HTTP_400_BAD_REQUEST, {"error": "ML prediction API error.", "details": details or result}
+        if "error" in result:
+            return status.HTTP_400_BAD_REQUEST, result
+
+        invalid_smiles = self.invalid_smiles(result, input_positions)
+        entries = result["models"] if models is not None else [result]
+        valid_smiles = {
+            smiles
+            for entry in entries
+            for smiles, ic50 in zip(smiles_list, entry.get("predictions") or [])
+            if ic50 is not None
+        }
+        if not valid_smiles:
+            return status.HTTP_400_BAD_REQUEST, {"error": "No predictions returned from ML API.", "errors": invalid_smiles}
 
+        if models is None:
             ml_model = get_object_or_404(MLModel, descriptor=model_descriptor, method=model_method, is_active=True)
+
+        if tracker is not None:
+            tracker.stage("enriching")
+        compound_map = self.resolve_compounds(valid_smiles, tracker)
+
+        if tracker is not None:
+            tracker.stage("saving")
+        # A job saves all of its results or none, so a retried job starts clean.
+        with transaction.atomic() if job is not None else nullcontext():
+            if models is None:
+                valid_predictions = [
+                    (smiles, ic50) for smiles, ic50 in zip(smiles_list, result["predictions"]) if ic50 is not None
+                ]
+                prediction, response_data = self.save_prediction(
+                    user, ml_model, input_source_type, valid_predictions, compound_map, prediction=job
+                )
+                payload = {
+                    "status": "success",
+                    "message": f"Prediction complete and saved for {len(response_data)} SMILES.",
+                    "data": response_data,
+                    "errors": invalid_smiles
+                }
+            else:
+                payload = self.save_many(user, smiles_list, result, input_source_type, valid_smiles, compound_map)
+                payload["errors"] = invalid_smiles
+
+            if tracker is not None:
+                tracker.complete(self.job_result(payload, multi=models is not None))
+        return status.HTTP_200_OK, payload
+
+    def call_ml(self, smiles_list, model_method, model_descriptor, models, consensus, input_source_type,
+                chunk_size=None, tracker=None):
+        """
+        Call the ML service for smiles_list in chunks of chunk_size (one call
+        when None), so no single call runs into the service's timeout, and
+        merge the chunks' results into one result as a single call returns it.
+        """
+        chunk_size = chunk_size or max(len(smiles_list), 1)
+        merged = None
+        for offset in range(0, len(smiles_list), chunk_size):
+            chunk = smiles_list[offset:offset + chunk_size]
+            if models is None:
+                status_code, result = post_predict(
+                    "http://localhost:8080/api/v1/predict/",
+                    chunk,
+                    model_method=model_method,
+                    model_descriptor=model_descriptor,
+                    partial=True,
+                    input_source_type=input_source_type,
+                )
+            else:
+                status_code, result = post_predict_multi(
+                    "http://localhost:8080/api/v1/predict/multi/",
+                    chunk,
+                    models,
+                    partial=True,
+                    consensus=consensus,
+                )
+            if status_code != 200 or not isinstance(result, dict) or "error" in result:
+                return status_code, result
+
+            merged = result if merged is None else self.merge_results(merged, result, offset)
+            if tracker is not None:
+                tracker.update(offset + len(chunk), len(smiles_list))
+        return 200, merged
+
+    def merge_results(self, merged, result, offset):
+        # Appends a later chunk's result: errors are re-indexed into the whole
+        # list, and a model that failed on any chunk is reported as failed.
+        merged["errors"] = (merged.get("errors") or []) + [
+            {**error, "index": error.get("index", 0) + offset} for error in result.get("errors") or []
+        ]
+        if "models" not in merged:
+            merged["predictions"] = merged["predictions"] + result["predictions"]
+            return merged
+
+        for entry, part in zip(merged["models"], result["models"]):
+            if "error" in part and "error" not in entry:
+                entry["error"] = part["error"]
+            if "error" not in entry:
+                entry["predictions"] = entry["predictions"] + part["predictions"]
+        if "consensus" in merged:
+            for key in ("predictions", "std"):
+                merged["consensus"][key] = merged["consensus"][key] + result["consensus"][key]
+        return merged
+
+    def save_many(self, user, smiles_list, result, input_source_type, valid_smiles, compound_map):
+        """
+        Save every model's results of a multi-model call as its own
+        Prediction and build the response.
+        """
+        entries = result.get("models", [])
+        # Both services share the model table; method and descriptor are the
+        # fallback when the id is unknown here.
+        ml_models = {
+            str(pk): ml_model
+            for pk, ml_model in MLModel.objects.in_bulk([entry["model_id"] for entry in entries if entry.get("model_id")]).items()
+        }
+        data = []
+        for entry in entries:
+            item = {"model_method": entry.get("model_method"), "model_descriptor": entry.get("model_descriptor")}
+            ml_model = ml_models.get(entry.get("model_id")) or MLModel.objects.filter(
+                method=entry.get("model_method"), descriptor=entry.get("model_descriptor"), is_active=True
+            ).first()
+            if "error" in entry or ml_model is None:
+                data.append({**item, "error": entry.get("error", "Model not found.")})
+                continue
+
+            valid_predictions = [
+                (smiles, ic50) for smiles, ic50 in zip(smiles_list, entry["predictions"]) if ic50 is not None
+            ]
+            prediction, response_data = self.save_prediction(
+                user, ml_model, input_source_type, valid_predictions, compound_map
+            )
+            data.append({**item, "prediction_id": str(prediction.id), "data": response_data})
+
+        response = {
+            "status": "success",
+            "message": f"Prediction complete and saved for {len(valid_smiles)} SMILES with {len(entries)} models.",
+            "data": data,
+        }
+        if "consensus" in result:
+            aggregate = result["consensus"]
+            response["consensus"] = {
+                "method": aggregate["method"],
+                "models": aggregate["models"],
+                "data": [
+                    {"smiles": smiles, "pic50": value, "std": std}
+                    for smiles, value, std in zip(smiles_list, aggregate["predictions"], aggregate["std"])
+                    if value is not None
+                ],
+            }
+        return response
+
+    def job_result(self, payload, multi):
+        # What a job keeps of the response: the per-compound data is saved as
+        # PredictionCompounds and read back through the predictions.
+        result = {key: value for key, value in payload.items() if key != "data"}
+        if multi:
+            result["models"] = [{key: value for key, value in item.items() if key != "data"} for item in payload["data"]]
+        return result
+
+    def invalid_smiles(self, result, input_positions):
+        # Invalid SMILES come back per index of the deduplicated list; map
+        # them back to the first position in the submitted input.
+        return [
+            {**error, "index": input_positions.get(error.get("smiles"), error.get("index"))}
+            for error in result.get("errors", [])
+        ]
+
+    def resolve_compounds(self, smiles_set, tracker=None):
+        compound_map = {c.smiles: c for c in Compound.objects.filter(smiles__in=smiles_set)}
+        to_fetch = [smiles for smiles in smiles_set if smiles not in compound_map]
+        if to_fetch:
+            with ThreadPoolExecutor() as executor:
+                future_to_smiles = {executor.submit(self.fetch_pubchem_data, smiles): smiles for smiles in to_fetch}
+                for done, future in enumerate(as_completed(future_to_smiles), 1):
+                    smiles = future_to_smiles[future]
+                    try:
+                        compound_map[smiles] = Compound.objects.create(smiles=smiles, **future.result())
+                    except Exception as e:
+                        print(f"Failed to create compound {smiles}: {e}")
+                    if tracker is not None:
+                        tracker.update(done, len(to_fetch))
+            created = [compound_map[smiles] for smiles in to_fetch if smiles in compound_map]
+            SIMILARITY_INDEX.add(created)
+            SUBSTRUCTURE_INDEX.add(created)
+        return compound_map
+
+    def save_prediction(self, user, ml_model, input_source_type, valid_predictions, compound_map, prediction=None):
+        # A background job's Prediction already exists and is completed by
+        # its tracker.
+        if prediction is None:
             prediction = Prediction.objects.create(
                 user=user,
                 ml_model=ml_model,
-                input_source_type="csv" if csv_file else "text",
+                input_source_type=input_source_type,
                 completed_at=timezone.now()
             )
 
-            compounds_to_fetch = []
-            results = []
-            smiles_set = set(smiles_list)
-            existing_compounds = Compound.objects.filter(smiles__in=smiles_set)
-            compound_map = {c.smiles: c for c in existing_compounds}
-
-            for smiles, ic50 in zip(smiles_list, predictions):
-                compound = compound_map.get(smiles)
-                if compound:
-                    results.append((smiles, ic50, compound))
-                else:
-                    compounds_to_fetch.append((smiles, ic50))
-
-            fetched_compounds = {}
-            if compounds_to_fetch:
-                with ThreadPoolExecutor() as executor:
-                    future_to_smiles = {
-                        executor.submit(self.fetch_pubchem_data, smiles): (smiles, ic50)
-                        for smiles, ic50 in compounds_to_fetch
-                    }
-                    for future in as_completed(future_to_smiles):
-                        smiles, ic50 = future_to_smiles[future]
-                        try:
-                            fetch_data = future.result()
-                            compound = Compound.objects.create(smiles=smiles, **fetch_data)
-                            fetched_compounds[smiles] = (ic50, compound)
-                        except Exception as e:
-                            fetched_compounds[smiles] = (ic50, None)
-
-            response_data = []
-            prediction_compounds = []
-
-            with ThreadPoolExecutor() as executor:
-                futures = [
-                    executor.submit(self.process_prediction, smiles, ic50, compound_map.get(smiles), prediction)
-                    for smiles, ic50 in zip(smiles_list, predictions)
-                ]
-                for future in as_completed(futures):
-                    response_item, pred_comp = future.result()
-                    response_data.append(response_item)
-                    if pred_comp:
-                        prediction_compounds.append(pred_comp)
-            PredictionCompound.objects.bulk_create(prediction_compounds)
-
-            return Response({
-                "status": "success",
-                "message": f"Prediction complete and saved for {len(response_data)} SMILES.",
-                "data": response_data
-            }, status=status.HTTP_200_OK)
-
-        except ValueError as e:
-            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        response_data = []
+        prediction_compounds = []
+        with ThreadPoolExecutor() as executor:
+            futures = [
+                executor.submit(self.process_prediction, smiles, ic50, compound_map.get(smiles), prediction)
+                for smiles, ic50 in valid_predictions
+            ]
+            for future in as_completed(futures):
+                response_item, pred_comp = future.result()
+                response_data.append(response_item)
+                if pred_comp:
+                    prediction_compounds.append(pred_comp)
+        PredictionCompound.objects.bulk_create(prediction_compounds)
+        return prediction, response_data
 
     def process_prediction(self, smiles, ic50, compound, prediction):
         if ic50 > 6:
@@ -289,6 +483,20 @@ class PredictIC50View(APIView):
         return None
 
 
+@extend_schema(**prediction_job_schema)
+class PredictionJobView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, id, *args, **kwargs):
+        qs = Prediction.objects.all() if request.user.role == 'admin' else Prediction.objects.filter(user=request.user)
+        job = get_object_or_404(qs, id=id)
+        return Response({
+            "status": "success",
+            "message": f"Prediction job is {job.status}.",
+            "data": PredictionJobSerializer(job).data
+        }, status=status.HTTP_200_OK)
+
+
 @extend_schema(**prediction_download_schema)
 class PredictionDownloadView(APIView):
     permission_classes = [IsAuthenticated]
@@ -0,0 +1,128 @@
+"""
+Client side of the ML service's binary /predict/ wire format (see the ML
+service's api/v1/wire.py for the layout), with JSON as the fallback.
+"""
+import json
+import struct
+import numpy as np
+import requests
+from django.conf import settings
+
+BATCH_MEDIA_TYPE = "application/x-ic50-batch"
+RESULT_MEDIA_TYPE = "application/x-ic50-result"
+BATCH_MAGIC = b"ICB1"
+RESULT_MAGIC = b"ICR1"
+FLAG_PARTIAL = 1
+
+KIND_LIST = 0
+KIND_OTHER = 2
+
+# Flipped off the first time the ML service rejects the binary format.
+_binary_supported = True
+
+
+def _pack_str(value):
+    data = (value or "").encode("utf-8")
+    return struct.pack("<H", len(data)) + data
+
+
+def encode_batch(smiles_list, model_method, model_descriptor, partial=False):
+    # One join and one split beat per-item length prefixes in Python; NUL
+    # never occurs in SMILES, and inputs containing it are refused.
+    joined = "\0".join(smiles_list)
+    if joined.count("\0") != max(len(smiles_list) - 1, 0):
+        raise ValueError("SMILES must not contain NUL characters.")
+    return b"".join([
+        BATCH_MAGIC,
+        struct.pack("<B", FLAG_PARTIAL if partial else 0),
+        _pack_str(model_method),
+        _pack_str(model_descriptor),
+        struct.pack("<I", len(smiles_list)),
+        joined.encode("utf-8"),
+    ])
+
+
+def decode_result(data):
+    if data[:4] != RESULT_MAGIC:
+        raise ValueError("Not an IC50 result.")
+    kind, n = struct.unpack_from("<BI", data, 4)
+    pos = 9
+    values = np.frombuffer(data, dtype="<f8", count=n, offset=pos)
+    pos += 8 * n
+    (length,) = struct.unpack_from("<I", data, pos)
+    tail = json.loads(data[pos + 4:pos + 4 + length]) if length else None
+
+    if kind == KIND_OTHER:
+        return tail
+    predictions = values.tolist()
+    if kind == KIND_LIST:
+        return predictions
+    for i in np.flatnonzero(np.isnan(values)).tolist():
+        predictions[i] = None
+    return {"predictions": predictions, "errors": tail}
+
+
+def post_predict(url, smiles_list, model_method, model_descriptor, partial=False, **extra):
+    """
+    POST a prediction batch to the ML service and return (status_code, body).
+
+    Uses the binary format when ML_WIRE_FORMAT is "binary", retrying as JSON
+    (and staying on JSON) if the service answers 415 Unsupported Media Type.
+    Batches the binary format cannot carry, and any batch with extra fields
+    (the binary layout has no slot for them), go as JSON.
+    """
+    global _binary_supported
+
+    body = None
+    if settings.ML_WIRE_FORMAT == "binary" and _binary_supported and not extra:
+        try:
+            body = encode_batch(smiles_list, model_method, model_descriptor, partial=partial)
+        except ValueError:
+            pass
+
+    if body is not None:
+        response = requests.post(
+            url,
+            data=body,
+            headers={
+                "Content-Type": BATCH_MEDIA_TYPE,
+                "Accept": f"{RESULT_MEDIA_TYPE}, application/json;q=0.5",
+            },
+        )
+        if response.status_code != 415:
+            return response.status_code, _decode_response(response)
+        _binary_supported = False
+
+    response = requests.post(url, json={
+        "smiles": smiles_list,
+        "model_method": model_method,
+        "model_descriptor": model_descriptor,
+        "partial": partial,
+        **extra,
+    })
+    return response.status_code, _decode_response(response)
+
+
+def post_predict_multi(url, smiles_list, models, partial=False, consensus=None):
+    """
+    POST one batch for several models to the ML service's multi-model
+    endpoint and return (status_code, body). Always JSON: the per-model
+    table does not fit the binary result layout.
+    """
+    response = requests.post(url, json={
+        "smiles": smiles_list,
+        "models": models,
+        "partial": partial,
+        "consensus": consensus,
+    })
+    return response.status_code, _decode_response(response)
+
+
+def _decode_response(response):
+    content_type = response.headers.get("Content-Type", "").split(";")[0].strip()
+    if content_type == RESULT_MEDIA_TYPE:
+        return decode_result(response.content)
+    try:
+        return response.json()
+    except ValueError:
+        return {"detail": response.text}
@@ -6,4 +6,5 @@ urlpatterns = [
     path('predictions/', include('api.v1.predictions.urls')), # /api/v1/predictions/
     path('prediction_compounds/', include('api.v1.prediction_compounds.urls')), # /api/v1/prediction_compounds/
     path('models/', include('api.v1.models.urls')),          # /api/v1/models/
+    path('compounds/', include('api.v1.compounds.urls')),    # /api/v1/compounds/
 ]
@@ -14,3 +14,9 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'antimalaria_ml.settings')
 
 application = get_asgi_application()
+
+# Only server processes import this module, so management commands never
+# load models.
+from api.v1.startup import start_warm_up  # noqa: E402
+
+start_warm_up()
@@ -23,6 +23,62 @@ env = environ.Env()
 # Read the .env file if it exists
 environ.Env.read_env(BASE_DIR / '.env')
 
+# Models are unpickled on first use; inactive ones are unloaded LRU-first once
+# the loaded models exceed this many bytes (0 keeps everything loaded).
+MODEL_MEMORY_BUDGET_BYTES = env.int('MODEL_MEMORY_BUDGET_BYTES', default=0)
+
+# Seconds between model directory re-scans in each worker, so uploads,
+# replacements and deletions made through one worker reach all of them.
+MODEL_REGISTRY_REFRESH_SECONDS = env.int('MODEL_REGISTRY_REFRESH_SECONDS', default=5)
+
+# Threads per prediction for xgboost/lightgbm/sklearn. 0 lets the CPU budget
+# below decide per request.
+INFERENCE_THREADS = env.int('INFERENCE_THREADS', default=0)
+
+# CPUs each server process may use for featurization and inference, split
+# between its concurrent predictions (0 divides the available CPUs by
+# GUNICORN_WORKERS). Batches get at most one inference thread per
+# CPU_MIN_ROWS_PER_THREAD molecules.
+CPU_BUDGET = env.int('CPU_BUDGET', default=0)
+CPU_MIN_ROWS_PER_THREAD = env.int('CPU_MIN_ROWS_PER_THREAD', default=256)
+
+# Featurize into CSR matrices for models whose backend accepts sparse input.
+SPARSE_FINGERPRINTS = env.bool('SPARSE_FINGERPRINTS', default=True)
+
+# Featurization process pool. Batches smaller than FEATURIZE_POOL_MIN_BATCH
+# (or any batch when FEATURIZE_WORKERS <= 1) are featurized in-process.
+FEATURIZE_WORKERS = env.int('FEATURIZE_WORKERS', default=os.cpu_count() or 1)
+FEATURIZE_CHUNK_SIZE = env.int('FEATURIZE_CHUNK_SIZE', default=1024)
+FEATURIZE_POOL_MIN_BATCH = env.int('FEATURIZE_POOL_MIN_BATCH', default=4096)
+
+# Fingerprint cache budgets in bytes; set both to 0 to disable the cache.
+FINGERPRINT_CACHE_PATH = Path(env('FINGERPRINT_CACHE_PATH', default=str(ML_MODEL_DIR.parent / "fingerprint_cache.sqlite3")))
+FINGERPRINT_CACHE_MEMORY_BYTES = env.int('FINGERPRINT_CACHE_MEMORY_BYTES', default=64 * 1024 * 1024)
+FINGERPRINT_CACHE_DISK_BYTES = env.int('FINGERPRINT_CACHE_DISK_BYTES', default=1024 * 1024 * 1024)
+
+# Memoized predictions per (model content hash, SMILES); 0 disables it.
+PREDICTION_CACHE_SIZE = env.int('PREDICTION_CACHE_SIZE', default=500000)
+
+# Concurrent /predict/ calls for the same model are merged into one batch for
+# up to PREDICT_BATCH_MAX_WAIT_MS or PREDICT_BATCH_MAX_SIZE molecules. Only
+# useful with threaded workers (GUNICORN_THREADS > 1); 0 disables it.
+PREDICT_BATCH_MAX_WAIT_MS = env.float('PREDICT_BATCH_MAX_WAIT_MS', default=0)
+PREDICT_BATCH_MAX_SIZE = env.int('PREDICT_BATCH_MAX_SIZE', default=4096)
+
+# Thread pool behind the async /predict/async/ endpoint. Requests are run in
+# ASYNC_PREDICT_CHUNK_SIZE slices; beyond ASYNC_PREDICT_MAX_QUEUE waiting or
+# running slices new requests get 503 (0 means unbounded).
+ASYNC_PREDICT_WORKERS = env.int('ASYNC_PREDICT_WORKERS', default=os.cpu_count() or 1)
+ASYNC_PREDICT_CHUNK_SIZE = env.int('ASYNC_PREDICT_CHUNK_SIZE', default=1024)
+ASYNC_PREDICT_MAX_QUEUE = env.int('ASYNC_PREDICT_MAX_QUEUE', default=64)
+
+# Molecules featurized and predicted per step by the streaming endpoint.
+PREDICT_STREAM_CHUNK_SIZE = env.int('PREDICT_STREAM_CHUNK_SIZE', default=1024)
+
+# Shared directory where each worker process writes its metrics, so /metrics
+# reports all gunicorn workers together. Empty keeps metrics per process.
+METRICS_DIR = env('METRICS_DIR', default='')
+
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.2/howto/deployment/checklist/
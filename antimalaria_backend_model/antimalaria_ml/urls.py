@@ -1,7 +1,11 @@
 from django.contrib import admin
 from django.urls import path, include
+from api.v1.views import MetricsView, LivenessView, ReadinessView
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/v1/', include('api.v1.urls')),
+    path('metrics', MetricsView.as_view(), name="metrics"),
+    path('healthz', LivenessView.as_view(), name="liveness"),
+    path('readyz', ReadinessView.as_view(), name="readiness"),
 ]
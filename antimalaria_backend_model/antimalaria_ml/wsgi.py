@@ -14,3 +14,9 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'antimalaria_ml.settings')
 
 application = get_wsgi_application()
+
+# Only server processes import this module, so management commands never
+# load models.
+from api.v1.startup import start_warm_up  # noqa: E402
+
+start_warm_up()
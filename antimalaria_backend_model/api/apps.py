@@ -5,8 +5,3 @@ class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
 
-    def ready(self):
-        from .v1 import utils
-        utils.load_all_models()
-        utils.load_features()
-
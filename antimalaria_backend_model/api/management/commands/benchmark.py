@@ -0,0 +1,63 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from api.v1.benchmark import run_benchmark, compare_reports
+from api.v1.utils import get_featurizer
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark featurization and prediction on a synthetic SMILES corpus with small "
+        "locally trained models, optionally comparing against a stored baseline report."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--molecules", type=int, default=5000, help="Corpus size for featurization.")
+        parser.add_argument("--batch-sizes", default="1,32,1024,4096", help="Comma-separated prediction batch sizes.")
+        parser.add_argument("--repeats", type=int, default=5, help="Timed runs per measurement.")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--descriptor", default="ECFP", help="A descriptor from DESCRIPTORS in api/v1/utils.py.")
+        parser.add_argument("--output", help="Write the JSON report to this file.")
+        parser.add_argument("--baseline", help="JSON report to compare against.")
+        parser.add_argument("--tolerance", type=float, default=0.1,
+                            help="Relative slowdown that counts as a regression (default 0.1).")
+
+    def handle(self, *args, **options):
+        try:
+            batch_sizes = [int(size) for size in options["batch_sizes"].split(",") if size.strip()]
+        except ValueError:
+            raise CommandError("--batch-sizes must be a comma-separated list of integers.")
+
+        try:
+            get_featurizer(options["descriptor"])
+        except ValueError:
+            raise CommandError(f"Unknown descriptor '{options['descriptor']}'.")
+
+        report = run_benchmark(
+            molecules=options["molecules"],
+            batch_sizes=batch_sizes,
+            repeats=options["repeats"],
+            seed=options["seed"],
+            descriptor=options["descriptor"],
+        )
+
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f"Report written to {options['output']}")
+        else:
+            self.stdout.write(json.dumps(report, indent=2))
+
+        if not options["baseline"]:
+            return
+
+        with open(options["baseline"]) as f:
+            baseline = json.load(f)
+        rows = compare_reports(report, baseline, tolerance=options["tolerance"])
+        for row in rows:
+            line = f"{row['metric']}: {row['baseline']:.4g} -> {row['current']:.4g} ({row['change']:+.1%})"
+            self.stdout.write(self.style.ERROR(line) if row["regressed"] else line)
+
+        regressions = [row for row in rows if row["regressed"]]
+        if regressions:
+            raise CommandError(f"{len(regressions)} metric(s) regressed by more than {options['tolerance']:.0%}.")
+        self.stdout.write(self.style.SUCCESS("No regressions against the baseline."))
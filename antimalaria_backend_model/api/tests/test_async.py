@@ -0,0 +1,136 @@
+import asyncio
+import threading
+from unittest import mock
+from django.test import SimpleTestCase, TestCase
+from api.models import MLModel
+from api.v1 import utils
+from api.v1.offload import BoundedExecutor, QueueFull
+
+
+class AsyncPredictTests(TestCase):
+    def setUp(self):
+        MLModel.objects.create(method="RF", descriptor="ECFP", version="1", file="ml_models/rf_ecfp.pkl", is_active=True)
+        self.body = {"smiles": ["CCO"], "model_method": "RF", "model_descriptor": "ECFP"}
+
+    def test_refused_under_wsgi(self):
+        response = self.client.post("/api/v1/predict/async/", self.body, content_type="application/json")
+        self.assertEqual(response.status_code, 501)
+
+    async def test_served_under_asgi(self):
+        with mock.patch("api.v1.views.apredict_batch_ic50", new=mock.AsyncMock(return_value=[5.5])) as predict:
+            response = await self.async_client.post("/api/v1/predict/async/", self.body, content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), [5.5])
+        self.assertEqual(predict.await_args.kwargs["model_name"], "rf_ecfp.pkl")
+
+
+def fake_predict(smiles_list, model_name, model_descriptor, partial=False):
+    # Partial-mode result where "bad" is invalid and each molecule predicts
+    # its own length.
+    return {
+        "predictions": [None if s == "bad" else float(len(s)) for s in smiles_list],
+        "errors": [{"index": i, "smiles": s, "error": "Invalid SMILES"} for i, s in enumerate(smiles_list) if s == "bad"],
+    }
+
+
+class AsyncChunkingTests(SimpleTestCase):
+    # Invalid rows open, close and fill whole 3-row chunks.
+    SMILES = ["bad", "CC", "CCC", "C", "bad", "bad", "bad", "CCCC", "OO", "bad"]
+    INVALID = [0, 4, 5, 6, 9]
+
+    def setUp(self):
+        self.predict = mock.Mock(wraps=fake_predict)
+        for name, value in [
+            ("predict_batch_ic50", self.predict),
+            ("get_model_and_featurizer", mock.Mock()),
+            ("INFERENCE_EXECUTOR", BoundedExecutor(max_workers=2, max_queue=4)),
+        ]:
+            patcher = mock.patch.object(utils, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    async def test_errors_are_reindexed_across_chunks(self):
+        result = await utils.apredict_batch_ic50(self.SMILES, "rf.pkl", "ECFP", partial=True, chunk_size=3)
+
+        self.assertEqual([call.args[0] for call in self.predict.call_args_list], [
+            self.SMILES[0:3], self.SMILES[3:6], self.SMILES[6:9], self.SMILES[9:],
+        ])
+        self.assertEqual([error["index"] for error in result["errors"]], self.INVALID)
+        for i, (smiles, prediction) in enumerate(zip(self.SMILES, result["predictions"])):
+            self.assertEqual(prediction, None if i in self.INVALID else float(len(smiles)))
+        self.assertEqual(len(result["predictions"]), len(self.SMILES))
+
+    async def test_legacy_mode_names_the_first_invalid_smiles(self):
+        smiles = ["CC", "CCC", "C", "CO", "bad", "CCCC"]
+        result = await utils.apredict_batch_ic50(smiles, "rf.pkl", "ECFP", chunk_size=2)
+        self.assertEqual(result, {"error": "Invalid SMILES input of bad"})
+
+        result = await utils.apredict_batch_ic50(smiles[:4], "rf.pkl", "ECFP", chunk_size=3)
+        self.assertEqual(result, [2.0, 3.0, 1.0, 2.0])
+
+    async def test_failed_chunk_stops_the_batch(self):
+        self.predict.side_effect = [fake_predict(["CC", "CCC"], "rf.pkl", "ECFP"), {"error": "Model crashed"}]
+        result = await utils.apredict_batch_ic50(["CC", "CCC", "C", "CO", "O"], "rf.pkl", "ECFP", chunk_size=2)
+        self.assertEqual(result, {"error": "Model crashed"})
+        self.assertEqual(self.predict.call_count, 2)
+
+
+class BoundedExecutorTests(SimpleTestCase):
+    def setUp(self):
+        self.release = threading.Event()
+        self.addCleanup(self.release.set)
+        self.active = 0
+        self.peak = 0
+        self.lock = threading.Lock()
+
+    def blocking(self, value):
+        with self.lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        self.release.wait(10)
+        with self.lock:
+            self.active -= 1
+        return value
+
+    async def wait_for(self, executor, **expected):
+        for _ in range(500):
+            stats = executor.stats()
+            if all(stats[key] == value for key, value in expected.items()):
+                return stats
+            await asyncio.sleep(0.01)
+        self.fail(f"Executor never reached {expected}: {executor.stats()}")
+
+    async def test_queue_and_workers_are_bounded(self):
+        executor = BoundedExecutor(max_workers=2, max_queue=4)
+        tasks = [asyncio.ensure_future(executor.run(self.blocking, i)) for i in range(4)]
+        await self.wait_for(executor, running=2, queued=2)
+
+        with self.assertRaises(QueueFull):
+            await executor.run(self.blocking, 4)
+        self.assertEqual(executor.stats()["rejected"], 1)
+
+        self.release.set()
+        self.assertEqual(await asyncio.gather(*tasks), [0, 1, 2, 3])
+        self.assertEqual(self.peak, 2)
+        stats = executor.stats()
+        self.assertEqual((stats["depth"], stats["completed"]), (0, 4))
+
+        # Capacity is given back once calls finish.
+        self.assertEqual(await executor.run(self.blocking, 5), 5)
+
+    async def test_cancelled_waiting_call_frees_its_slot(self):
+        executor = BoundedExecutor(max_workers=1, max_queue=2)
+        running = asyncio.ensure_future(executor.run(self.blocking, 0))
+        waiting = asyncio.ensure_future(executor.run(self.blocking, 1))
+        await self.wait_for(executor, running=1, queued=1)
+
+        waiting.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await waiting
+        stats = await self.wait_for(executor, queued=0)
+        self.assertEqual(stats["cancelled"], 1)
+
+        self.release.set()
+        self.assertEqual(await running, 0)
+        self.assertEqual(await executor.run(self.blocking, 2), 2)
+        self.assertEqual(executor.stats()["completed"], 2)
@@ -0,0 +1,59 @@
+import importlib.util
+import unittest
+import numpy as np
+from django.test import SimpleTestCase
+from scipy import sparse
+from sklearn.ensemble import RandomForestRegressor
+from api.v1.backends import InferenceBackend, LightGBMBackend, SklearnBackend, XGBoostBackend, select_backend
+
+
+def fingerprints(n_rows=300, n_features=64, seed=1):
+    rng = np.random.default_rng(seed)
+    X = (rng.random((n_rows, n_features)) < 0.2).astype(np.float32)
+    y = X[:, :4].sum(axis=1) + rng.random(n_rows)
+    return X, y
+
+
+class BackendParityTests(SimpleTestCase):
+    """Each backend must match model.predict on dense float64 input, and on CSR when it accepts it."""
+
+    def assert_parity(self, model, backend_class):
+        X, _ = fingerprints(n_rows=100, seed=2)
+        backend = select_backend(model)
+        self.assertIsInstance(backend, backend_class)
+
+        expected = np.asarray(model.predict(X.astype(np.float64)), dtype=np.float64).ravel()
+        np.testing.assert_allclose(backend.predict(X), expected, rtol=1e-5, atol=1e-6)
+        # Sparse input is densified by backends that do not take it, so both
+        # must be right whatever the featurizer produced.
+        np.testing.assert_allclose(backend.predict(sparse.csr_matrix(X)), expected, rtol=1e-5, atol=1e-6)
+        return backend
+
+    def test_sklearn(self):
+        X, y = fingerprints()
+        backend = self.assert_parity(RandomForestRegressor(n_estimators=10, random_state=0).fit(X, y), SklearnBackend)
+        self.assertTrue(backend.accepts_sparse)
+
+    @unittest.skipUnless(importlib.util.find_spec("xgboost"), "xgboost is not installed")
+    def test_xgboost(self):
+        import xgboost
+        X, y = fingerprints()
+        backend = self.assert_parity(xgboost.XGBRegressor(n_estimators=20).fit(X, y), XGBoostBackend)
+        self.assertFalse(backend.accepts_sparse)
+
+    @unittest.skipUnless(importlib.util.find_spec("lightgbm"), "lightgbm is not installed")
+    def test_lightgbm(self):
+        import lightgbm
+        X, y = fingerprints()
+        backend = self.assert_parity(lightgbm.LGBMRegressor(n_estimators=20, verbose=-1).fit(X, y), LightGBMBackend)
+        self.assertTrue(backend.accepts_sparse)
+
+    def test_unknown_model_falls_back_to_predict(self):
+        class Model:
+            def predict(self, X):
+                return np.asarray(X).sum(axis=1)
+
+        X, _ = fingerprints(n_rows=10)
+        backend = select_backend(Model())
+        self.assertIs(type(backend), InferenceBackend)
+        np.testing.assert_allclose(backend.predict(sparse.csr_matrix(X)), X.sum(axis=1))
@@ -0,0 +1,87 @@
+import threading
+from unittest import mock
+from django.test import SimpleTestCase
+from api.v1.batching import PredictionCoalescer
+
+
+def fake_predict(smiles_list, model_name, model_descriptor, partial=False):
+    # Each molecule predicts its own length; "bad" is invalid and "boom"
+    # makes the whole call raise.
+    if "boom" in smiles_list:
+        raise RuntimeError("Model crashed")
+    if "fatal" in smiles_list:
+        return {"error": "Batch rejected"}
+    errors = [{"index": i, "smiles": s, "error": "Invalid SMILES"} for i, s in enumerate(smiles_list) if s == "bad"]
+    return {
+        "predictions": [None if s == "bad" else float(len(s)) for s in smiles_list],
+        "errors": errors,
+    }
+
+
+class PredictionCoalescerTests(SimpleTestCase):
+    def run_together(self, requests, predict_fn=fake_predict):
+        """
+        Run each (smiles_list, partial) request on its own thread. The batch
+        only closes once it holds every molecule, so all requests share it.
+        """
+        predict = mock.Mock(wraps=predict_fn)
+        coalescer = PredictionCoalescer(predict, max_wait=10, max_batch=sum(len(smiles) for smiles, _ in requests))
+        results = [None] * len(requests)
+
+        def call(i, smiles_list, partial):
+            try:
+                results[i] = coalescer.predict(smiles_list, "rf.pkl", "ECFP", partial=partial)
+            except Exception as e:
+                results[i] = e
+
+        threads = [threading.Thread(target=call, args=(i, *request)) for i, request in enumerate(requests)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(10)
+        self.assertEqual(coalescer.stats()["max_requests_per_batch"], len(requests))
+        return results, predict
+
+    def test_each_caller_gets_its_own_rows(self):
+        requests = [([f"C{'O' * (i * 3 + j)}" for j in range(3)], False) for i in range(8)]
+        results, predict = self.run_together(requests)
+
+        self.assertEqual(predict.call_count, 1)
+        for (smiles_list, _), result in zip(requests, results):
+            self.assertEqual(result, [float(len(smiles)) for smiles in smiles_list])
+
+    def test_invalid_smiles_only_fail_their_caller(self):
+        results, predict = self.run_together([
+            (["CC", "CCC"], False),
+            (["C", "bad", "CCCC"], False),
+            (["CCCCC", "bad"], True),
+        ])
+
+        self.assertEqual(predict.call_count, 1)
+        self.assertEqual(results[0], [2.0, 3.0])
+        self.assertEqual(results[1], {"error": "Invalid SMILES input of bad"})
+        # Error indexes are relative to the caller's own list.
+        self.assertEqual(results[2], {
+            "predictions": [5.0, None],
+            "errors": [{"index": 1, "smiles": "bad", "error": "Invalid SMILES"}],
+        })
+
+    def test_exception_only_fails_its_caller(self):
+        results, predict = self.run_together([(["CC"], False), (["C", "boom"], True), (["CCC"], True)])
+
+        self.assertEqual(results[0], [2.0])
+        self.assertIsInstance(results[1], RuntimeError)
+        self.assertEqual(results[2], {"predictions": [3.0], "errors": []})
+        # The merged call, then one retry per request.
+        self.assertEqual(predict.call_count, 4)
+
+    def test_failed_batch_only_fails_its_caller(self):
+        results, _ = self.run_together([(["fatal"], True), (["CCCC"], False)])
+        self.assertEqual(results, [{"error": "Batch rejected"}, [4.0]])
+
+    def test_single_request_failure_is_not_retried(self):
+        predict = mock.Mock(wraps=fake_predict)
+        coalescer = PredictionCoalescer(predict, max_wait=0.01, max_batch=100)
+        with self.assertRaises(RuntimeError):
+            coalescer.predict(["boom"], "rf.pkl", "ECFP")
+        self.assertEqual(predict.call_count, 1)
@@ -0,0 +1,150 @@
+import sqlite3
+import tempfile
+import threading
+from pathlib import Path
+from unittest import mock
+import numpy as np
+from django.test import SimpleTestCase
+from api.v1 import utils
+from api.v1.cache import FingerprintCache, PredictionCache
+from api.v1.featurizers import MorganFeaturizer
+
+SMILES = ["CCO", "OCC", "c1ccccc1", "not a smiles", "CC(=O)Oc1ccccc1C(=O)O"]
+
+
+class FingerprintCacheTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.cache = FingerprintCache(Path(directory.name) / "fp.sqlite3", memory_budget=1 << 20, disk_budget=1 << 20)
+        patcher = mock.patch.object(utils, "FINGERPRINT_CACHE", self.cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.featurizer = MorganFeaturizer(list(range(0, 2048, 5)), radius=2, n_bits=2048)
+
+    def expected(self):
+        return self.featurizer.featurize_mols([utils.parse_smiles(s) for s in SMILES])
+
+    def assertFeatures(self, result, sparse=False):
+        expected, expected_valid = self.expected()
+        fps, valid = result
+        np.testing.assert_array_equal(valid, expected_valid)
+        np.testing.assert_array_equal(fps.toarray() if sparse else fps, expected)
+
+    def test_miss_then_hit(self):
+        # Rows are counted, so CCO and OCC are two misses.
+        self.assertFeatures(utils.featurize_cached(self.featurizer, SMILES))
+        self.assertEqual(self.cache.misses, 4)
+        self.assertEqual(self.cache.hits, 0)
+
+        self.assertFeatures(utils.featurize_cached(self.featurizer, SMILES))
+        self.assertFeatures(utils.featurize_cached(self.featurizer, SMILES, sparse=True), sparse=True)
+        self.assertEqual(self.cache.misses, 4)
+        self.assertEqual(self.cache.hits, 8)
+
+    def test_hit_under_canonical_spelling(self):
+        utils.featurize_cached(self.featurizer, ["CCO"])
+        fps, valid = utils.featurize_cached(self.featurizer, ["C(O)C"])
+        self.assertTrue(valid[0])
+        self.assertEqual(self.cache.misses, 1)
+        np.testing.assert_array_equal(fps[0], utils.featurize_cached(self.featurizer, ["CCO"])[0][0])
+
+    def test_disk_tier_is_shared(self):
+        utils.featurize_cached(self.featurizer, SMILES)
+        other = FingerprintCache(self.cache.path, disk_budget=1 << 20)
+        found = other.get_many(self.featurizer.config_key, ["CCO", "c1ccccc1"])
+        self.assertEqual(set(found), {"CCO", "c1ccccc1"})
+
+    def test_invalid_rows_are_not_cached(self):
+        utils.featurize_cached(self.featurizer, SMILES)
+        found = self.cache.get_many(self.featurizer.config_key, ["not a smiles"])
+        self.assertEqual(found, {})
+
+    def test_rows_rejected_by_the_featurizer_are_not_cached(self):
+        featurize_batch = utils.featurize_batch
+
+        def reject_first(featurizer, smiles_list, **kwargs):
+            fps, valid = featurize_batch(featurizer, smiles_list, **kwargs)
+            valid[0] = False
+            fps[0] = 0
+            return fps, valid
+
+        with mock.patch.object(utils, "featurize_batch", reject_first):
+            _, valid = utils.featurize_cached(self.featurizer, ["CCO", "c1ccccc1"])
+        self.assertEqual(valid.tolist(), [False, True])
+
+        fps, valid = utils.featurize_cached(self.featurizer, ["CCO", "c1ccccc1"])
+        self.assertEqual(valid.tolist(), [True, True])
+        self.assertGreater(fps[0].sum(), 0)
+        self.assertEqual(self.cache.misses, 3)
+
+
+class FingerprintCacheDiskTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = Path(directory.name) / "fp.sqlite3"
+
+    def stored_bytes(self):
+        with sqlite3.connect(str(self.path)) as connection:
+            return connection.execute(
+                "SELECT COALESCE(SUM(length(bits) + length(smiles) + length(config)), 0) FROM fingerprints"
+            ).fetchone()[0]
+
+    def test_size_is_tracked_across_workers_and_evicted(self):
+        first = FingerprintCache(self.path, disk_budget=1 << 20)
+        second = FingerprintCache(self.path, disk_budget=1 << 20)
+        first.put_many("cfg", {f"C{i}": bytes(100) for i in range(50)})
+        second.put_many("cfg", {f"N{i}": bytes(100) for i in range(50)})
+        first.put_many("cfg", {"C0": bytes(120)})
+        self.assertEqual(first.stats()["disk_bytes"], self.stored_bytes())
+        self.assertEqual(second._measure_disk(second._connect()), self.stored_bytes())
+
+        small = FingerprintCache(self.path, disk_budget=5000)
+        small.put_many("cfg", {"O": bytes(100)})
+        self.assertLessEqual(self.stored_bytes(), 5000)
+        self.assertEqual(small.stats()["disk_bytes"], self.stored_bytes())
+        self.assertGreater(small.evictions, 0)
+        # The newest entry survives least-recently-used eviction.
+        self.assertEqual(set(small.get_many("cfg", ["O"])), {"O"})
+
+    def test_memory_hits_do_not_wait_for_disk(self):
+        cache = FingerprintCache(self.path, memory_budget=1 << 20, disk_budget=1 << 20)
+        cache.put_many("cfg", {"CCO": bytes(10)})
+        writing, release = threading.Event(), threading.Event()
+        disk_put = cache._disk_put
+
+        def slow_disk_put(*args):
+            writing.set()
+            release.wait(5)
+            disk_put(*args)
+
+        with mock.patch.object(cache, "_disk_put", side_effect=slow_disk_put):
+            writer = threading.Thread(target=cache.put_many, args=("cfg", {"CCN": bytes(10)}))
+            writer.start()
+            self.assertTrue(writing.wait(5))
+            reader = threading.Thread(target=lambda: self.assertEqual(set(cache.get_many("cfg", ["CCO"])), {"CCO"}))
+            reader.start()
+            reader.join(2)
+            self.assertFalse(reader.is_alive())
+            release.set()
+            writer.join()
+
+
+class PredictionCacheTests(SimpleTestCase):
+    def test_hits_and_invalidation(self):
+        cache = PredictionCache(max_entries=10)
+        cache.put_many("a", {"CCO": 1.5, "CCN": 2.5})
+        cache.put_many("b", {"CCO": 3.5})
+        self.assertEqual(cache.get_many("a", ["CCO", "CCC"]), {"CCO": 1.5})
+
+        cache.invalidate("a")
+        self.assertEqual(cache.get_many("a", ["CCO", "CCN"]), {})
+        self.assertEqual(cache.get_many("b", ["CCO"]), {"CCO": 3.5})
+
+    def test_least_recently_used_entries_are_evicted(self):
+        cache = PredictionCache(max_entries=2)
+        cache.put_many("a", {"CCO": 1.0, "CCN": 2.0})
+        cache.get_many("a", ["CCO"])
+        cache.put_many("a", {"CCC": 3.0})
+        self.assertEqual(cache.get_many("a", ["CCO", "CCN", "CCC"]), {"CCO": 1.0, "CCC": 3.0})
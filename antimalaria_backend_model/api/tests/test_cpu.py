@@ -0,0 +1,104 @@
+import pickle
+import sys
+import tempfile
+import threading
+import types
+from pathlib import Path
+from unittest import mock
+from django.test import SimpleTestCase, override_settings
+from api.v1 import pool
+from api.v1.cpu import CPUBudget, current_plan
+from api.v1.registry import ModelRegistry
+
+
+class CPUPlanTests(SimpleTestCase):
+    def setUp(self):
+        self.budget = CPUBudget(8, min_rows_per_thread=100, featurize_chunk_size=1000)
+
+    def test_small_batches_get_few_threads(self):
+        self.assertEqual(self.budget.plan(50), {"cpus": 8, "featurization": 1, "inference": 1})
+        self.assertEqual(self.budget.plan(350), {"cpus": 8, "featurization": 1, "inference": 4})
+        self.assertEqual(self.budget.plan(100000), {"cpus": 8, "featurization": 8, "inference": 8})
+
+    def test_share_is_split_between_active_predictions(self):
+        self.assertEqual(self.budget.plan(100000, active=2), {"cpus": 4, "featurization": 4, "inference": 4})
+        self.assertEqual(self.budget.plan(100000, active=3), {"cpus": 2, "featurization": 2, "inference": 2})
+        self.assertEqual(self.budget.plan(100000, active=20), {"cpus": 1, "featurization": 1, "inference": 1})
+
+    def test_reservation_sets_the_plan_of_its_thread(self):
+        self.assertIsNone(current_plan())
+        with self.budget.reserve(5000) as plan:
+            self.assertEqual(current_plan(), plan)
+            self.assertEqual(plan["featurization"], 5)
+            with self.budget.reserve(10) as inner:
+                self.assertIs(inner, plan)
+        self.assertIsNone(current_plan())
+        self.assertEqual(self.budget.reservations, 1)
+
+    def test_concurrent_reservations_split_the_budget(self):
+        entered, release = threading.Event(), threading.Event()
+        plans = []
+
+        def hold():
+            with self.budget.reserve(100000) as plan:
+                plans.append(plan)
+                entered.set()
+                release.wait(5)
+
+        thread = threading.Thread(target=hold)
+        thread.start()
+        self.assertTrue(entered.wait(5))
+        with self.budget.reserve(100000) as plan:
+            # The other thread's plan does not leak into this one.
+            self.assertEqual(current_plan(), plan)
+            self.assertEqual(plan["cpus"], 4)
+        release.set()
+        thread.join()
+        self.assertEqual(plans[0]["cpus"], 8)
+        self.assertEqual((self.budget.active, self.budget.peak), (0, 2))
+
+
+@override_settings(FEATURIZE_WORKERS=6, FEATURIZE_POOL_MIN_BATCH=100)
+class PoolWorkersTests(SimpleTestCase):
+    def test_clamped_to_the_featurization_share(self):
+        self.assertEqual(pool.pool_workers(), 6)
+        budget = CPUBudget(16, featurize_chunk_size=1000)
+        with budget.reserve(2500):
+            self.assertEqual(pool.pool_workers(), 3)
+            self.assertTrue(pool.use_pool(2500))
+        with budget.reserve(100000):
+            self.assertEqual(pool.pool_workers(), 6)
+
+    def test_single_worker_stays_in_process(self):
+        with CPUBudget(16, featurize_chunk_size=1000).reserve(500):
+            self.assertEqual(pool.pool_workers(), 1)
+            self.assertFalse(pool.use_pool(500))
+        self.assertFalse(pool.use_pool(99))
+
+
+class ControllerScanTests(SimpleTestCase):
+    def test_imports_do_not_rescan(self):
+        budget = CPUBudget(2)
+        with mock.patch("api.v1.cpu.ThreadpoolController") as controller:
+            with budget.reserve(10):
+                pass
+            sys.modules["_cpu_test_module"] = types.ModuleType("_cpu_test_module")
+            self.addCleanup(sys.modules.pop, "_cpu_test_module")
+            with budget.reserve(10):
+                pass
+        self.assertEqual(controller.call_count, 1)
+
+    def test_model_loads_rescan(self):
+        budget = CPUBudget(2)
+        with mock.patch("api.v1.cpu.ThreadpoolController") as controller:
+            budget.rescan()
+            self.assertEqual(controller.call_count, 0)
+            with budget.reserve(10):
+                pass
+
+            directory = tempfile.TemporaryDirectory()
+            self.addCleanup(directory.cleanup)
+            path = Path(directory.name) / "a.pkl"
+            path.write_bytes(pickle.dumps({"weights": [1, 2]}))
+            ModelRegistry(directory.name, on_unpickle=budget.rescan).load(path, warm=False)
+        self.assertEqual(controller.call_count, 2)
@@ -0,0 +1,110 @@
+import base64
+import json
+import os
+import tempfile
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
+import numpy as np
+from django.test import SimpleTestCase
+from api.v1 import utils
+from api.v1.metrics import MetricsRegistry
+
+
+def build(registry):
+    requests = registry.counter("requests_total", "Requests served.", ["model"])
+    seconds = registry.histogram("stage_seconds", "Stage time.", ["stage"], buckets=(0.1, 1.0))
+    return requests, seconds
+
+
+class MetricsRenderTests(SimpleTestCase):
+    def setUp(self):
+        # render() writes this process's snapshot itself; no flusher thread.
+        patcher = mock.patch.object(MetricsRegistry, "changed")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_text_format(self):
+        registry = MetricsRegistry()
+        requests, seconds = build(registry)
+        requests.inc(2, model='rf "v2"')
+        seconds.observe(0.05, stage="inference")
+        seconds.observe(0.5, stage="inference")
+        seconds.observe(5.0, stage="inference")
+
+        self.assertEqual(registry.render().splitlines(), [
+            "# HELP requests_total Requests served.",
+            "# TYPE requests_total counter",
+            'requests_total{model="rf \\"v2\\""} 2.0',
+            "# HELP stage_seconds Stage time.",
+            "# TYPE stage_seconds histogram",
+            'stage_seconds_bucket{stage="inference",le="0.1"} 1',
+            'stage_seconds_bucket{stage="inference",le="1.0"} 2',
+            'stage_seconds_bucket{stage="inference",le="+Inf"} 3',
+            'stage_seconds_sum{stage="inference"} 5.55',
+            'stage_seconds_count{stage="inference"} 3',
+        ])
+
+    def test_snapshots_of_other_processes_are_merged(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+
+        # Another worker's values, as its flusher would have written them.
+        other = MetricsRegistry()
+        requests, seconds = build(other)
+        requests.inc(3, model="rf")
+        requests.inc(model="ridge")
+        seconds.observe(0.5, stage="inference")
+        Path(directory.name, f"metrics-{os.getpid() + 1}.json").write_text(json.dumps(other.snapshot()))
+        Path(directory.name, "metrics-broken.json").write_text("{")
+
+        registry = MetricsRegistry(directory.name)
+        requests, seconds = build(registry)
+        requests.inc(model="rf")
+        seconds.observe(0.05, stage="inference")
+
+        lines = registry.render().splitlines()
+        self.assertIn('requests_total{model="rf"} 4.0', lines)
+        self.assertIn('requests_total{model="ridge"} 1.0', lines)
+        self.assertIn('stage_seconds_bucket{stage="inference",le="0.1"} 1', lines)
+        self.assertIn('stage_seconds_bucket{stage="inference",le="1.0"} 2', lines)
+        self.assertIn('stage_seconds_count{stage="inference"} 2', lines)
+        self.assertTrue(Path(directory.name, f"metrics-{os.getpid()}.json").exists())
+
+    def test_metrics_endpoint(self):
+        response = self.client.get("/metrics")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Content-Type"].startswith("text/plain"))
+        body = response.content.decode()
+        self.assertIn("# TYPE ic50_stage_duration_seconds histogram", body)
+        self.assertIn("# TYPE ic50_molecules_total counter", body)
+
+
+class PackedMetricsTests(SimpleTestCase):
+    def setUp(self):
+        registry = MetricsRegistry()
+        self.stage_seconds = registry.histogram("stage", "", ["stage", "model", "descriptor"])
+        self.molecules = registry.counter("molecules", "", ["model", "descriptor"])
+        self.invalid = registry.counter("invalid", "", ["model", "descriptor"])
+        featurizer = SimpleNamespace(config_key="morgan:16", n_features=16)
+        backend = SimpleNamespace(accepts_sparse=False, predict=lambda X: X.sum(axis=1))
+        for name, value in [
+            ("STAGE_SECONDS", self.stage_seconds),
+            ("MOLECULES", self.molecules),
+            ("INVALID_FINGERPRINTS", self.invalid),
+            ("get_model_and_featurizer", lambda *args: (SimpleNamespace(backend=backend), featurizer)),
+        ]:
+            patcher = mock.patch.object(utils, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_stages_and_counts_are_recorded(self):
+        row = base64.b64encode(np.packbits(np.ones(16, dtype=np.uint8)).tobytes()).decode("ascii")
+        result = utils.predict_packed_ic50([row, "not base64!", row], "rf.pkl", "ECFP", "morgan:16", partial=True)
+        self.assertEqual(result["predictions"], [16.0, None, 16.0])
+
+        labels = json.dumps(["rf.pkl", "ECFP"])
+        self.assertEqual(self.molecules.snapshot(), {labels: 3.0})
+        self.assertEqual(self.invalid.snapshot(), {labels: 1.0})
+        stages = {json.loads(key)[0] for key in self.stage_seconds.snapshot()}
+        self.assertEqual(stages, {"fingerprint_decoding", "inference"})
@@ -0,0 +1,104 @@
+import json
+import pickle
+import tempfile
+from pathlib import Path
+from unittest import mock
+import numpy as np
+from django.test import SimpleTestCase
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.linear_model import Ridge
+from api.v1 import utils
+from api.v1.cache import FingerprintCache, PredictionCache
+from api.v1.featurizers import MACCSFeaturizer, MorganFeaturizer
+from api.v1.metrics import MetricsRegistry
+from api.v1.registry import ModelRegistry
+
+SMILES = ["CCO", "OCC", "c1ccccc1", "CC(=O)Oc1ccccc1C(=O)O", "not a smiles", "CCN(CC)CC", "c1ccc2ccccc2c1"]
+TRAIN = ["CCO", "CCC", "CCCC", "c1ccccc1", "Cc1ccccc1", "CC(=O)O", "CCN", "c1ccncc1", "OCCO", "CCOC(=O)C"]
+
+
+class MultiModelTests(SimpleTestCase):
+    """One multi-model call must match each model predicting on its own."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        model_dir = Path(directory.name)
+
+        self.featurizers = {
+            "ECFP": MorganFeaturizer(list(range(0, 2048, 4)), radius=3, n_bits=2048),
+            "MACCS": MACCSFeaturizer(None),
+        }
+        rng = np.random.default_rng(0)
+        y = rng.normal(6, 1, len(TRAIN))
+        self.expected = {}
+        for name, descriptor, model in [
+            ("rf_ecfp.pkl", "ECFP", RandomForestRegressor(n_estimators=5, random_state=0)),
+            ("ridge_ecfp.pkl", "ECFP", Ridge()),
+            ("ridge_maccs.pkl", "MACCS", Ridge()),
+        ]:
+            X, _ = self.featurizers[descriptor].featurize(TRAIN)
+            model.fit(X, y)
+            (model_dir / name).write_bytes(pickle.dumps(model))
+            X, valid = self.featurizers[descriptor].featurize(SMILES)
+            self.expected[name] = [float(value) if ok else None for value, ok in zip(model.predict(X), valid)]
+
+        for name, value in [
+            ("MODELS", ModelRegistry(model_dir)),
+            ("PREDICTION_CACHE", PredictionCache(max_entries=1000)),
+            ("get_featurizer", self.featurizers.__getitem__),
+        ]:
+            patcher = mock.patch.object(utils, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def predict(self, models, **kwargs):
+        with mock.patch.object(utils, "featurize_cached", wraps=utils.featurize_cached) as featurize:
+            result = utils.predict_multi_ic50(SMILES, models, partial=True, **kwargs)
+        return result, featurize
+
+    def test_models_match_single_predictions_and_share_featurization(self):
+        models = [("rf_ecfp.pkl", "rf", "ECFP"), ("ridge_ecfp.pkl", "ridge", "ECFP"), ("ridge_maccs.pkl", "ridge", "MACCS")]
+        result, featurize = self.predict(models, consensus="mean")
+
+        # One featurization per descriptor, not per model.
+        self.assertEqual(featurize.call_count, 2)
+        self.assertEqual([error["index"] for error in result["errors"]], [4])
+        for (name, method, descriptor), entry in zip(models, result["models"]):
+            self.assertEqual((entry["model_method"], entry["model_descriptor"]), (method, descriptor))
+            np.testing.assert_allclose(
+                [np.nan if value is None else value for value in entry["predictions"]],
+                [np.nan if value is None else value for value in self.expected[name]],
+            )
+
+        consensus = result["consensus"]
+        self.assertEqual(consensus["models"], 3)
+        self.assertIsNone(consensus["predictions"][4])
+        self.assertAlmostEqual(consensus["predictions"][0], np.mean([self.expected[name][0] for name, _, _ in models]), places=5)
+
+        # A second call is served from the prediction cache.
+        again, featurize = self.predict(models)
+        featurize.assert_not_called()
+        self.assertEqual([entry["predictions"] for entry in again["models"]], [entry["predictions"] for entry in result["models"]])
+
+    def test_missing_model_fails_alone(self):
+        result, _ = self.predict([("missing.pkl", "rf", "ECFP"), ("ridge_maccs.pkl", "ridge", "MACCS")])
+        self.assertIn("error", result["models"][0])
+        self.assertEqual(len(result["models"][1]["predictions"]), len(SMILES))
+
+    def test_invalid_smiles_fail_the_batch_unless_partial(self):
+        result = utils.predict_multi_ic50(SMILES, [("ridge_maccs.pkl", "ridge", "MACCS")])
+        self.assertEqual(result, {"error": "Invalid SMILES input of not a smiles"})
+
+    def test_stage_timings_are_labeled_per_model(self):
+        histogram = MetricsRegistry().histogram("stage", "", ["stage", "model", "descriptor"])
+        # Without a fingerprint cache every descriptor records its featurization.
+        with mock.patch.object(utils, "STAGE_SECONDS", histogram), \
+                mock.patch.object(utils, "FINGERPRINT_CACHE", FingerprintCache(None)):
+            self.predict([("rf_ecfp.pkl", "rf", "ECFP"), ("ridge_maccs.pkl", "ridge", "MACCS"), ("missing.pkl", "rf", "ECFP")])
+
+        observed = {tuple(json.loads(key)) for key in histogram.snapshot()}
+        for model, descriptor in [("rf_ecfp.pkl", "ECFP"), ("ridge_maccs.pkl", "MACCS")]:
+            for stage in ("smiles_parsing", "fingerprinting", "inference"):
+                self.assertIn((stage, model, descriptor), observed)
+        self.assertFalse([labels for labels in observed if labels[1] not in ("rf_ecfp.pkl", "ridge_maccs.pkl")])
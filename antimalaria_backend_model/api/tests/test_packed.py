@@ -0,0 +1,118 @@
+import base64
+import pickle
+import tempfile
+from pathlib import Path
+from unittest import mock
+import numpy as np
+from django.test import TestCase, override_settings
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.linear_model import Ridge
+from api.models import MLModel
+from api.v1 import utils
+from api.v1.cache import FingerprintCache, PredictionCache
+from api.v1.featurizers import MorganFeaturizer
+from api.v1.registry import ModelRegistry
+
+SMILES = ["CCO", "OCC", "c1ccccc1", "not a smiles", "CC(=O)Oc1ccccc1C(=O)O", "CCN(CC)CC"]
+TRAIN = ["CCO", "CCC", "CCCC", "c1ccccc1", "Cc1ccccc1", "CC(=O)O", "CCN", "c1ccncc1", "OCCO", "CCOC(=O)C"]
+
+
+class PackedPredictionTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.featurizer = MorganFeaturizer(list(range(0, 2048, 4)), radius=3, n_bits=2048)
+        X, _ = self.featurizer.featurize(TRAIN)
+        y = np.random.default_rng(0).normal(6, 1, len(TRAIN))
+        for name, model in [("ridge_ecfp.pkl", Ridge()), ("rf_ecfp.pkl", RandomForestRegressor(n_estimators=5, random_state=0))]:
+            Path(directory.name, name).write_bytes(pickle.dumps(model.fit(X, y)))
+
+        for name, value in [
+            ("MODELS", ModelRegistry(directory.name)),
+            ("PREDICTION_CACHE", PredictionCache(max_entries=0)),
+            ("FINGERPRINT_CACHE", FingerprintCache(None, memory_budget=1 << 20)),
+            ("get_featurizer", lambda descriptor: self.featurizer),
+        ]:
+            patcher = mock.patch.object(utils, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_round_trip_matches_smiles_predictions(self):
+        packed = utils.featurize_packed(SMILES, "ECFP")
+        self.assertEqual(packed["config_key"], self.featurizer.config_key)
+        self.assertEqual(packed["n_features"], 512)
+        self.assertIsNone(packed["fingerprints"][3])
+        self.assertEqual([error["index"] for error in packed["errors"]], [3])
+        # Spellings of one molecule share a row.
+        self.assertEqual(packed["fingerprints"][0], packed["fingerprints"][1])
+
+        for sparse in (True, False):
+            for model_name in ("ridge_ecfp.pkl", "rf_ecfp.pkl"):
+                with self.subTest(sparse=sparse, model=model_name), override_settings(SPARSE_FINGERPRINTS=sparse):
+                    expected = utils.predict_batch_ic50(SMILES, model_name, "ECFP", partial=True)
+                    result = utils.predict_packed_ic50(packed["fingerprints"], model_name, "ECFP", packed["config_key"], partial=True)
+                    self.assertEqual([error["index"] for error in result["errors"]], [3])
+                    np.testing.assert_allclose(
+                        [np.nan if value is None else value for value in result["predictions"]],
+                        [np.nan if value is None else value for value in expected["predictions"]],
+                    )
+
+    def test_config_key_mismatch_is_rejected(self):
+        packed = utils.featurize_packed(["CCO"], "ECFP")
+        other = MorganFeaturizer(list(range(0, 2048, 4)), radius=2, n_bits=2048)
+        with self.assertRaisesMessage(ValueError, "does not match the model's feature plan"):
+            utils.predict_packed_ic50(packed["fingerprints"], "ridge_ecfp.pkl", "ECFP", other.config_key)
+
+    def test_empty_and_invalid_rows(self):
+        self.assertEqual(utils.predict_packed_ic50([], "ridge_ecfp.pkl", "ECFP", self.featurizer.config_key), {})
+
+        valid = utils.featurize_packed(["CCO"], "ECFP")["fingerprints"][0]
+        short = base64.b64encode(b"\x00" * 10).decode("ascii")
+        rows = [valid, None, "not base64!", short, valid]
+
+        result = utils.predict_packed_ic50(rows, "ridge_ecfp.pkl", "ECFP", self.featurizer.config_key)
+        self.assertEqual(result, {"error": "Invalid fingerprint at index 1: Fingerprint is not valid base64."})
+
+        result = utils.predict_packed_ic50(rows, "ridge_ecfp.pkl", "ECFP", self.featurizer.config_key, partial=True)
+        self.assertEqual(result["predictions"][1:4], [None, None, None])
+        self.assertEqual(result["predictions"][0], result["predictions"][4])
+        self.assertEqual(result["errors"], [
+            {"index": 1, "error": "Fingerprint is not valid base64."},
+            {"index": 2, "error": "Fingerprint is not valid base64."},
+            {"index": 3, "error": "Fingerprint must be 64 bytes, got 10."},
+        ])
+
+    def test_views(self):
+        MLModel.objects.create(method="RIDGE", descriptor="ECFP", version="1", file="ml_models/ridge_ecfp.pkl", is_active=True)
+        packed = self.client.post("/api/v1/featurize/", {"smiles": SMILES, "model_descriptor": "ECFP"}, content_type="application/json").json()
+
+        response = self.client.post("/api/v1/predict/", {
+            "fingerprints": packed["fingerprints"],
+            "config_key": packed["config_key"],
+            "model_method": "RIDGE",
+            "model_descriptor": "ECFP",
+            "partial": True,
+        }, content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        expected = utils.predict_batch_ic50(SMILES, "ridge_ecfp.pkl", "ECFP", partial=True)
+        np.testing.assert_allclose(
+            [np.nan if value is None else value for value in response.json()["predictions"]],
+            [np.nan if value is None else value for value in expected["predictions"]],
+        )
+
+        for body, field in [
+            ({"fingerprints": [], "config_key": packed["config_key"]}, "fingerprints"),
+            ({"fingerprints": packed["fingerprints"]}, "config_key"),
+        ]:
+            response = self.client.post("/api/v1/predict/", {**body, "model_method": "RIDGE", "model_descriptor": "ECFP"}, content_type="application/json")
+            self.assertEqual(response.status_code, 400)
+            self.assertIn(field, response.json())
+
+        response = self.client.post("/api/v1/predict/", {
+            "fingerprints": packed["fingerprints"],
+            "config_key": "morgan-stale",
+            "model_method": "RIDGE",
+            "model_descriptor": "ECFP",
+        }, content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("feature plan", response.json()["error"])
@@ -0,0 +1,70 @@
+import os
+import tempfile
+from unittest import mock
+import numpy as np
+from django.test import SimpleTestCase, override_settings
+from api.v1 import pool, utils
+from api.v1.featurizers import MorganFeaturizer
+
+SMILES = [
+    "CCO", "OCC", "C(O)C", "c1ccccc1", "C1CC", "", "CC(=O)Oc1ccccc1C(=O)O", "CCN(CC)CC",
+    "c1ccc2ccccc2c1", "not a smiles", "CC(C)Cc1ccc(cc1)C(C)C(=O)O", "O=C=O",
+] * 5
+
+POOLED = {"FEATURIZE_WORKERS": 2, "FEATURIZE_CHUNK_SIZE": 7, "FEATURIZE_POOL_MIN_BATCH": 10}
+IN_PROCESS = {"FEATURIZE_WORKERS": 1}
+
+
+class PoolTests(SimpleTestCase):
+    """The process pool must give the same results as featurizing in-process."""
+
+    @classmethod
+    def tearDownClass(cls):
+        pool.shutdown_executor()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.featurizer = MorganFeaturizer(list(range(0, 2048, 3)), radius=2, n_bits=2048)
+
+    def test_canonical_groups(self):
+        with override_settings(**IN_PROCESS):
+            expected_groups, expected_invalid = utils.canonical_groups(SMILES)
+        with override_settings(**POOLED):
+            groups, invalid = utils.canonical_groups(SMILES)
+
+        self.assertEqual(invalid, expected_invalid)
+        self.assertEqual(list(groups), list(expected_groups))
+        self.assertEqual([positions for _, positions in groups.values()],
+                         [positions for _, positions in expected_groups.values()])
+        # Pooled groups leave parsing to the workers.
+        self.assertTrue(all(mol is None for mol, _ in groups.values()))
+        self.assertEqual(len(groups["CCO"][1]), 15)
+
+    def test_featurize_batch(self):
+        with override_settings(**IN_PROCESS):
+            dense, valid = pool.featurize_batch(self.featurizer, SMILES)
+            csr, csr_valid = pool.featurize_batch(self.featurizer, SMILES, sparse=True)
+        with override_settings(**POOLED):
+            pooled, pooled_valid = pool.featurize_batch(self.featurizer, SMILES)
+            pooled_csr, pooled_csr_valid = pool.featurize_batch(self.featurizer, SMILES, sparse=True)
+
+        np.testing.assert_array_equal(pooled_valid, valid)
+        np.testing.assert_array_equal(pooled_csr_valid, csr_valid)
+        np.testing.assert_array_equal(pooled, dense)
+        np.testing.assert_array_equal(pooled_csr.toarray(), dense)
+        np.testing.assert_array_equal(csr.toarray(), dense)
+        self.assertFalse(valid[SMILES.index("C1CC")])
+
+    def test_small_batches_stay_in_process(self):
+        with override_settings(**POOLED), mock.patch.object(pool, "get_executor") as get_executor:
+            pool.featurize_batch(self.featurizer, SMILES[:5])
+        get_executor.assert_not_called()
+
+    def test_shared_matrix_is_released(self):
+        before = set(os.listdir(pool.SHARED_DIR or tempfile.gettempdir()))
+        with override_settings(**POOLED):
+            fps, _ = pool.featurize_batch(self.featurizer, SMILES)
+        self.assertEqual(fps.shape, (len(SMILES), self.featurizer.n_features))
+        after = set(os.listdir(pool.SHARED_DIR or tempfile.gettempdir()))
+        self.assertEqual({name for name in after - before if name.startswith("fp-")}, set())
+
@@ -0,0 +1,70 @@
+import pickle
+import tempfile
+from pathlib import Path
+from django.test import SimpleTestCase
+from api.v1.registry import ModelRegistry
+
+
+class ModelRegistryReleaseTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.model_dir = Path(directory.name)
+        self.released = []
+
+    def registry(self, **kwargs):
+        registry = ModelRegistry(self.model_dir, on_release=self.on_release, **kwargs)
+        self.registry_under_test = registry
+        return registry
+
+    def on_release(self, content_hash):
+        # Must not run under the registry lock, which every lookup takes.
+        self.assertFalse(self.registry_under_test._lock.locked())
+        self.released.append(content_hash)
+
+    def write(self, name, payload):
+        path = self.model_dir / name
+        path.write_bytes(pickle.dumps(payload))
+        return path
+
+    def test_swap_releases_the_old_hash_outside_the_lock(self):
+        registry = self.registry()
+        old = registry.load(self.write("a.pkl", {"version": 1}), warm=False)
+        new = registry.load(self.write("a.pkl", {"version": 2}), warm=False)
+        self.assertNotEqual(old.content_hash, new.content_hash)
+        self.assertEqual(self.released, [old.content_hash])
+        self.assertEqual(registry.swaps, 1)
+
+    def test_shared_hash_is_kept_while_served(self):
+        registry = self.registry()
+        registry.load(self.write("a.pkl", {"same": True}), warm=False)
+        shared = registry.load(self.write("b.pkl", {"same": True}), warm=False)
+        registry.unload("a.pkl")
+        self.assertEqual(self.released, [])
+        registry.unload("b.pkl")
+        self.assertEqual(self.released, [shared.content_hash])
+
+    def test_eviction_keeps_the_hash(self):
+        first = self.write("a.pkl", {"weights": list(range(1000))})
+        second = self.write("b.pkl", {"weights": list(range(1000, 2000))})
+        registry = self.registry(memory_budget=first.stat().st_size + 10)
+        evicted = registry.load(first, warm=False)
+        registry.load(second, warm=False)
+        self.assertEqual(registry.evictions, 1)
+        # Only unloaded: the file still has that content.
+        self.assertEqual(self.released, [])
+        self.assertEqual(registry.model_states(["a.pkl"]), {"a.pkl": "cold"})
+
+        # Replacing the evicted file retires its hash.
+        registry.load(self.write("a.pkl", {"weights": [0]}), warm=False)
+        self.assertEqual(self.released, [evicted.content_hash])
+
+    def test_loading_locks_are_dropped_with_their_file(self):
+        registry = self.registry()
+        path = self.write("a.pkl", {"version": 1})
+        registry.discover()
+        self.assertIsNotNone(registry.entry("a.pkl"))
+        self.assertIn("a.pkl", registry._loading_locks)
+        path.unlink()
+        registry.refresh(force=True)
+        self.assertEqual(registry._loading_locks, {})
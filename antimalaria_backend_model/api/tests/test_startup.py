@@ -0,0 +1,33 @@
+import os
+from unittest import mock
+from django.test import SimpleTestCase
+from api.v1 import startup
+
+
+class StartWarmUpTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch.dict(startup._state, {"pid": None, "started_at": None, "finished_at": None})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def start(self, environ):
+        with mock.patch.dict(os.environ, environ, clear=False), \
+                mock.patch.object(startup.threading, "Thread") as thread:
+            if "GUNICORN_PRELOAD_APP" not in environ:
+                os.environ.pop("GUNICORN_PRELOAD_APP", None)
+            startup.start_warm_up()
+        return thread
+
+    def test_warms_without_a_preloading_master(self):
+        # PRELOAD_MODELS alone (e.g. only in .env) does not make gunicorn
+        # preload, so the process must warm its own models.
+        thread = self.start({"PRELOAD_MODELS": "true"})
+        thread.assert_called_once()
+        thread.return_value.start.assert_called_once()
+
+    def test_stands_down_when_gunicorn_preloads(self):
+        self.start({"GUNICORN_PRELOAD_APP": "1"}).assert_not_called()
+
+    def test_warms_once_per_process(self):
+        self.start({})
+        self.start({}).assert_not_called()
@@ -0,0 +1,118 @@
+import json
+import pickle
+import tempfile
+from pathlib import Path
+from unittest import mock
+import numpy as np
+from django.test import TestCase, override_settings
+from sklearn.linear_model import Ridge
+from api.models import MLModel
+from api.v1 import utils
+from api.v1.cache import PredictionCache
+from api.v1.featurizers import MorganFeaturizer
+from api.v1.registry import ModelRegistry
+
+# Invalid entries sit at both ends of the 3-row chunks used below.
+SMILES = ["CCO", "c1ccccc1", "not a smiles", "xyz", "CCN(CC)CC", "CC(=O)O", "OCCO", "C1CC", "c1ccncc1"]
+TRAIN = ["CCO", "CCC", "CCCC", "c1ccccc1", "Cc1ccccc1", "CC(=O)O", "CCN", "c1ccncc1", "OCCO", "CCOC(=O)C"]
+INVALID = [2, 3, 7]
+
+
+class StreamTestCase(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        featurizer = MorganFeaturizer(list(range(0, 2048, 4)), radius=3, n_bits=2048)
+        X, _ = featurizer.featurize(TRAIN)
+        model = Ridge().fit(X, np.random.default_rng(0).normal(6, 1, len(TRAIN)))
+        Path(directory.name, "ridge_ecfp.pkl").write_bytes(pickle.dumps(model))
+        X, _ = featurizer.featurize(SMILES)
+        self.expected = model.predict(X).tolist()
+
+        for name, value in [
+            ("MODELS", ModelRegistry(directory.name)),
+            ("PREDICTION_CACHE", PredictionCache(max_entries=1000)),
+            ("get_featurizer", lambda descriptor: featurizer),
+        ]:
+            patcher = mock.patch.object(utils, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def check_records(self, records, smiles_list=SMILES):
+        self.assertEqual(records[-1], {"done": True, "count": len(smiles_list)})
+        records = records[:-1]
+        self.assertEqual([record["index"] for record in records], list(range(len(smiles_list))))
+        self.assertEqual([record["smiles"] for record in records], smiles_list)
+        for i, record in enumerate(records):
+            if i in INVALID:
+                self.assertIsNone(record["prediction"])
+                self.assertIn("error", record)
+            else:
+                self.assertNotIn("error", record)
+                self.assertAlmostEqual(record["prediction"], self.expected[i], places=5)
+
+
+class PredictStreamTests(StreamTestCase):
+    def test_records_keep_input_order_across_chunks(self):
+        records = list(utils.predict_ic50_stream(iter(SMILES), "ridge_ecfp.pkl", "ECFP", chunk_size=3))
+        self.check_records(records)
+
+    def test_chunks_are_predicted_lazily(self):
+        with mock.patch.object(utils, "predict_batch_ic50", wraps=utils.predict_batch_ic50) as predict:
+            records = utils.predict_ic50_stream(iter(SMILES), "ridge_ecfp.pkl", "ECFP", chunk_size=3)
+            predict.assert_not_called()
+            next(records)
+            self.assertEqual(predict.call_count, 1)
+            list(records)
+        self.assertEqual([call.args[0] for call in predict.call_args_list], [SMILES[0:3], SMILES[3:6], SMILES[6:9]])
+
+    def test_unknown_model_is_rejected_before_streaming(self):
+        with self.assertRaises(ValueError):
+            utils.predict_ic50_stream(iter(SMILES), "missing.pkl", "ECFP")
+
+    def test_failed_chunk_ends_the_stream_without_done(self):
+        with mock.patch.object(utils, "predict_batch_ic50", side_effect=[
+            {"predictions": [1.0, 2.0, 3.0], "errors": []},
+            {"error": "Model crashed"},
+        ]):
+            records = list(utils.predict_ic50_stream(iter(SMILES), "ridge_ecfp.pkl", "ECFP", chunk_size=3))
+        self.assertEqual([record["index"] for record in records], [0, 1, 2, 3])
+        self.assertEqual(records[-1], {"index": 3, "error": "Model crashed", "done": False})
+
+
+@override_settings(PREDICT_STREAM_CHUNK_SIZE=3)
+class PredictStreamViewTests(StreamTestCase):
+    url = "/api/v1/predict/stream/"
+
+    def setUp(self):
+        super().setUp()
+        MLModel.objects.create(method="RIDGE", descriptor="ECFP", version="1", file="ml_models/ridge_ecfp.pkl", is_active=True)
+
+    def read(self, response):
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        return [json.loads(line) for line in b"".join(response.streaming_content).decode().splitlines()]
+
+    def test_json_body(self):
+        body = {"smiles": SMILES, "model_method": "RIDGE", "model_descriptor": "ECFP"}
+        self.check_records(self.read(self.client.post(self.url, body, content_type="application/json")))
+
+    def test_text_body(self):
+        # One SMILES per line; blank lines are skipped and only the first
+        # comma-separated column is read.
+        body = "\n".join(f"{smiles},name-{i}" if i % 2 else smiles for i, smiles in enumerate(SMILES)) + "\n\n"
+        response = self.client.post(f"{self.url}?model_method=RIDGE&model_descriptor=ECFP", body, content_type="text/plain")
+        self.check_records(self.read(response))
+
+    def test_ndjson_body(self):
+        body = "\n".join(json.dumps({"smiles": smiles}) for smiles in SMILES)
+        response = self.client.post(f"{self.url}?model_method=RIDGE&model_descriptor=ECFP", body, content_type="application/x-ndjson")
+        self.check_records(self.read(response))
+
+    def test_missing_input_and_model(self):
+        response = self.client.post(f"{self.url}?model_method=RIDGE", "", content_type="text/plain")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.json()), {"model_descriptor", "input"})
+
+        response = self.client.post(f"{self.url}?model_method=RF&model_descriptor=ECFP", "CCO\n", content_type="text/plain")
+        self.assertEqual(response.status_code, 404)
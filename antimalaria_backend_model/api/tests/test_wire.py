@@ -0,0 +1,123 @@
+import importlib.util
+import json
+from pathlib import Path
+from unittest import mock, skipUnless
+from django.conf import settings
+from django.test import SimpleTestCase, TestCase
+from api.models import MLModel
+from api.v1 import wire
+from api.v1.wire import BATCH_MEDIA_TYPE, RESULT_MEDIA_TYPE, accept_quality, decode_batch, decode_result, encode_batch, encode_result
+
+# What the backend sends (antimalaria_backend/api/v1/predictions/wire.py).
+BACKEND_ACCEPT = f"{RESULT_MEDIA_TYPE}, application/json;q=0.5"
+
+
+class WireCodecTests(SimpleTestCase):
+    def test_batch_round_trip(self):
+        smiles = ["CCO", "c1ccccc1", "C[C@H](N)C(=O)O", "ClC(Cl)Cl"]
+        batch = decode_batch(encode_batch(smiles, "RF", "ECFP", partial=True))
+        self.assertEqual(batch, {"smiles": smiles, "model_method": "RF", "model_descriptor": "ECFP", "partial": True})
+
+    def test_empty_batch_round_trip(self):
+        self.assertEqual(decode_batch(encode_batch([], "RF", "ECFP"))["smiles"], [])
+
+    def test_batch_refuses_nul(self):
+        with self.assertRaises(ValueError):
+            encode_batch(["CC\0O"], "RF", "ECFP")
+
+    def test_truncated_batch_is_rejected(self):
+        with self.assertRaises(ValueError):
+            decode_batch(encode_batch(["CCO", "CCN"], "RF", "ECFP")[:12])
+
+    def test_result_round_trip(self):
+        partial = {"predictions": [5.25, None, 4.0], "errors": [{"index": 1, "smiles": "C1CC", "error": "bad"}]}
+        for result in ([1.5, 2.25], partial, {"error": "Model not found."}):
+            self.assertEqual(decode_result(encode_result(result)), result)
+
+
+# The backend's copy of the codec, when both services are checked out together.
+BACKEND_WIRE = Path(settings.BASE_DIR).parent / "antimalaria_backend" / "api" / "v1" / "predictions" / "wire.py"
+
+
+@skipUnless(BACKEND_WIRE.is_file() and importlib.util.find_spec("requests"), "the backend is not checked out here")
+class CrossServiceTests(SimpleTestCase):
+    """The backend's client codec must stay byte-compatible with this one."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        spec = importlib.util.spec_from_file_location("backend_wire", BACKEND_WIRE)
+        cls.backend = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(cls.backend)
+
+    def test_constants(self):
+        for name in ("BATCH_MEDIA_TYPE", "RESULT_MEDIA_TYPE", "BATCH_MAGIC", "RESULT_MAGIC", "FLAG_PARTIAL", "KIND_LIST", "KIND_OTHER"):
+            self.assertEqual(getattr(self.backend, name), getattr(wire, name), name)
+
+    def test_backend_batches_decode_here(self):
+        smiles = ["CCO", "c1ccccc1", "C[C@H](N)C(=O)O", "ÅC"]
+        for partial in (False, True):
+            self.assertEqual(
+                decode_batch(self.backend.encode_batch(smiles, "RF", "ECFP", partial=partial)),
+                {"smiles": smiles, "model_method": "RF", "model_descriptor": "ECFP", "partial": partial},
+            )
+        self.assertEqual(decode_batch(self.backend.encode_batch([], "RF", "ECFP"))["smiles"], [])
+
+    def test_results_decode_in_the_backend(self):
+        partial = {"predictions": [5.25, None, 4.0], "errors": [{"index": 1, "smiles": "C1CC", "error": "bad"}]}
+        for result in ([1.5, 2.25], [], partial, {"error": "Model not found."}):
+            self.assertEqual(self.backend.decode_result(encode_result(result)), result)
+
+
+class AcceptQualityTests(SimpleTestCase):
+    def test_most_specific_range_wins(self):
+        accept = "application/*;q=0.2, */*;q=0.1, application/json;q=0.7"
+        self.assertEqual(accept_quality(accept, "application/json"), 0.7)
+        self.assertEqual(accept_quality(accept, "application/xml"), 0.2)
+        self.assertEqual(accept_quality(accept, "text/plain"), 0.1)
+        self.assertEqual(accept_quality("text/html", "application/json"), 0.0)
+        self.assertEqual(accept_quality(f"{RESULT_MEDIA_TYPE} ; q=0", RESULT_MEDIA_TYPE), 0.0)
+        self.assertEqual(accept_quality(RESULT_MEDIA_TYPE, RESULT_MEDIA_TYPE), 1.0)
+
+
+class PredictNegotiationTests(TestCase):
+    def setUp(self):
+        MLModel.objects.create(method="RF", descriptor="ECFP", version="1", file="ml_models/rf_ecfp.pkl", is_active=True)
+        result = {"predictions": [5.5, None], "errors": [{"index": 1, "smiles": "C1CC", "error": "bad"}]}
+        patcher = mock.patch("api.v1.views.COALESCER.predict", return_value=result)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.result = result
+
+    def post_batch(self, accept):
+        body = encode_batch(["CCO", "C1CC"], "RF", "ECFP", partial=True)
+        return self.client.generic("POST", "/api/v1/predict/", body, content_type=BATCH_MEDIA_TYPE, HTTP_ACCEPT=accept)
+
+    def test_backend_accept_header_gets_binary(self):
+        response = self.post_batch(BACKEND_ACCEPT)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], RESULT_MEDIA_TYPE)
+        self.assertEqual(decode_result(response.content), self.result)
+
+    def test_other_clients_get_json(self):
+        for accept in ("*/*", "application/json"):
+            response = self.post_batch(accept)
+            self.assertEqual(response["Content-Type"], "application/json")
+            self.assertEqual(json.loads(response.content), self.result)
+
+    def test_q_values_are_honoured(self):
+        for accept in (f"{RESULT_MEDIA_TYPE};q=0, application/json",
+                       f"{RESULT_MEDIA_TYPE};q=0.3, application/json;q=0.8",
+                       f"{RESULT_MEDIA_TYPE};q=0.5, */*"):
+            response = self.post_batch(accept)
+            self.assertEqual(response["Content-Type"], "application/json", accept)
+        response = self.post_batch(f"application/json;q=0.4, {RESULT_MEDIA_TYPE};q=0.9")
+        self.assertEqual(response["Content-Type"], RESULT_MEDIA_TYPE)
+        # Refusing the only listed type leaves nothing acceptable.
+        self.assertEqual(self.post_batch(f"{RESULT_MEDIA_TYPE};q=0").status_code, 406)
+
+    def test_errors_are_binary_when_negotiated(self):
+        body = encode_batch(["CCO"], "", "ECFP")
+        response = self.client.generic("POST", "/api/v1/predict/", body, content_type=BATCH_MEDIA_TYPE, HTTP_ACCEPT=BACKEND_ACCEPT)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("model_method", decode_result(response.content))
@@ -0,0 +1,172 @@
+import numpy as np
+from scipy import sparse
+
+PARITY_ROWS = 64
+PARITY_DENSITY = 0.05
+
+
+def _framework(model):
+    return type(model).__module__.split(".")[0]
+
+
+def n_features_in(model):
+    # Feature count the model was fit on, or None when it does not say.
+    n_features = getattr(model, "n_features_in_", None)
+    if n_features:
+        return int(n_features)
+    if _framework(model) == "xgboost" and hasattr(model, "num_features"):
+        return model.num_features()
+    if _framework(model) == "lightgbm" and hasattr(model, "num_feature"):
+        return model.num_feature()
+    return None
+
+
+class InferenceBackend:
+    """
+    Plain model.predict; the fallback for anything without a faster path.
+
+    Subclasses call a framework's native entry point directly, skipping the
+    input validation and conversions of its scikit-learn wrapper. Returns a
+    1-d float64 array. Backends with accepts_sparse take CSR matrices.
+
+    threads > 0 pins the library's thread count; 0 overrides whatever the
+    pickled model was trained with, so each call uses the OpenMP/joblib
+    limit of the CPU budget reservation it runs in.
+    """
+
+    name = "predict"
+    accepts_sparse = False
+
+    def __init__(self, model, threads=0):
+        self.model = model
+        self.threads = threads
+
+    @classmethod
+    def accepts(cls, model):
+        return True
+
+    def predict(self, X):
+        if sparse.issparse(X):
+            X = X.toarray()
+        return np.asarray(self.model.predict(X), dtype=np.float64).ravel()
+
+
+class XGBoostBackend(InferenceBackend):
+    # XGBoost reads the zeros a CSR matrix leaves out as missing values, which
+    # changes the predictions of models trained on dense fingerprints, so it
+    # is given dense input only.
+    name = "xgboost-inplace"
+    accepts_sparse = False
+
+    def __init__(self, model, threads=0):
+        super().__init__(model, threads)
+        self.booster = model.get_booster() if hasattr(model, "get_booster") else model
+        # nthread 0 is OpenMP's current limit for the calling thread.
+        self.booster.set_param({"nthread": threads})
+
+        # Match XGBModel.predict, which stops at the best early-stopping round.
+        best_iteration = getattr(model, "best_iteration", None) if model is not self.booster else None
+        self.iteration_range = (0, best_iteration + 1) if best_iteration is not None else (0, 0)
+
+    @classmethod
+    def accepts(cls, model):
+        # Classifiers return labels from predict, not the raw scores.
+        return _framework(model) == "xgboost" and not hasattr(model, "predict_proba")
+
+    def predict(self, X):
+        # Dense arrays are predicted without building a DMatrix.
+        if sparse.issparse(X):
+            X = X.toarray()
+        return np.asarray(
+            self.booster.inplace_predict(X, iteration_range=self.iteration_range),
+            dtype=np.float64,
+        ).ravel()
+
+
+class LightGBMBackend(InferenceBackend):
+    name = "lightgbm-booster"
+    accepts_sparse = True
+
+    def __init__(self, model, threads=0):
+        super().__init__(model, threads)
+        self.booster = getattr(model, "booster_", model)
+        # num_threads 0 is OpenMP's current limit for the calling thread.
+        self.params = {"num_threads": threads}
+
+    @classmethod
+    def accepts(cls, model):
+        return _framework(model) == "lightgbm" and not hasattr(model, "predict_proba")
+
+    def predict(self, X):
+        return np.asarray(self.booster.predict(X, **self.params), dtype=np.float64).ravel()
+
+
+class SklearnBackend(InferenceBackend):
+    name = "sklearn-float32"
+    accepts_sparse = True
+
+    def __init__(self, model, threads=0):
+        super().__init__(model, threads)
+        # n_jobs None takes the joblib default, which the CPU budget sets.
+        if hasattr(model, "n_jobs"):
+            model.n_jobs = threads if threads > 0 else None
+
+    @classmethod
+    def accepts(cls, model):
+        return _framework(model) == "sklearn"
+
+    def predict(self, X):
+        # Tree ensembles evaluate on C-ordered float32; passing that skips a
+        # full copy of the batch. Sparse input is left as is.
+        if isinstance(X, np.ndarray):
+            X = np.ascontiguousarray(X, dtype=np.float32)
+        return np.asarray(self.model.predict(X), dtype=np.float64).ravel()
+
+
+BACKENDS = [XGBoostBackend, LightGBMBackend, SklearnBackend]
+
+
+def check_parity(backend, n_features, rtol=1e-5, atol=1e-6):
+    """
+    Compare backend.predict with the model's own predict on a fixed random
+    binary matrix shaped like real fingerprints. A backend whose sparse
+    output differs only loses accepts_sparse.
+    """
+    rng = np.random.default_rng(0)
+    X = (rng.random((PARITY_ROWS, n_features)) < PARITY_DENSITY).astype(np.float32)
+    expected = np.asarray(backend.model.predict(X), dtype=np.float64).ravel()
+    if not np.allclose(backend.predict(X), expected, rtol=rtol, atol=atol):
+        return False
+
+    if backend.accepts_sparse:
+        try:
+            sparse_ok = np.allclose(backend.predict(sparse.csr_matrix(X)), expected, rtol=rtol, atol=atol)
+        except Exception:
+            sparse_ok = False
+        if not sparse_ok:
+            print(f"{backend.name} backend output differs on sparse input; densifying.")
+            backend.accepts_sparse = False
+    return True
+
+
+def select_backend(model, threads=0):
+    """
+    Fastest backend for model whose outputs match model.predict, falling back
+    to InferenceBackend when no fast path applies or the parity check fails.
+    """
+    n_features = n_features_in(model)
+    for backend_class in BACKENDS:
+        if not backend_class.accepts(model):
+            continue
+        if n_features is None:
+            break
+        try:
+            backend = backend_class(model, threads)
+            if check_parity(backend, n_features):
+                return backend
+            print(f"{backend_class.name} backend output differs from predict; using predict.")
+        except Exception as e:
+            print(f"{backend_class.name} backend unavailable: {e}")
+        break
+
+    return InferenceBackend(model, threads)
@@ -0,0 +1,148 @@
+import threading
+from collections import Counter
+from concurrent.futures import Future
+
+
+class _Batch:
+    def __init__(self):
+        self.requests = []
+        self.size = 0
+        self.full = threading.Event()
+
+
+class PredictionCoalescer:
+    """
+    Merges concurrent predictions for the same model into one call.
+
+    The first request for a (model, descriptor) opens a batch and becomes its
+    leader: it waits up to max_wait seconds, or until the batch holds
+    max_batch molecules, then runs predict_fn once in partial mode on all of
+    the queued SMILES and hands each request its slice of the result. If the
+    merged call raises or fails as a whole, each request is retried on its
+    own, so one caller's bad input only fails that caller. Requests that are already max_batch molecules long skip the queue, and a
+    max_wait of 0 disables coalescing.
+    """
+
+    def __init__(self, predict_fn, max_wait=0.0, max_batch=0):
+        self.predict_fn = predict_fn
+        self.max_wait = max_wait
+        self.max_batch = max_batch
+
+        self.batches = 0
+        self.requests = 0
+        self.molecules = 0
+        self.max_requests = 0
+        self.request_histogram = Counter()
+
+        self._open = {}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.max_wait > 0 and self.max_batch > 1
+
+    def predict(self, smiles_list, model_name, model_descriptor, partial=False):
+        if not self.enabled or not smiles_list or len(smiles_list) >= self.max_batch:
+            self._record([smiles_list])
+            return self.predict_fn(smiles_list, model_name, model_descriptor, partial=partial)
+
+        key = (model_name, model_descriptor)
+        future = Future()
+        with self._lock:
+            batch = self._open.get(key)
+            leader = batch is None
+            if leader:
+                batch = self._open[key] = _Batch()
+            batch.requests.append((smiles_list, future))
+            batch.size += len(smiles_list)
+            if batch.size >= self.max_batch:
+                self._close(key, batch)
+
+        if leader:
+            batch.full.wait(self.max_wait)
+            with self._lock:
+                self._close(key, batch)
+            self._run(batch, model_name, model_descriptor)
+
+        return as_request_result(future.result(), smiles_list, partial)
+
+    def _close(self, key, batch):
+        if self._open.get(key) is batch:
+            del self._open[key]
+        batch.full.set()
+
+    def _run(self, batch, model_name, model_descriptor):
+        self._record([smiles_list for smiles_list, _ in batch.requests])
+        merged = [smiles for smiles_list, _ in batch.requests for smiles in smiles_list]
+        try:
+            result = self.predict_fn(merged, model_name, model_descriptor, partial=True)
+        except Exception as e:
+            result = e
+
+        if isinstance(result, Exception) or "error" in result:
+            if len(batch.requests) == 1:
+                self._settle(batch.requests[0][1], result)
+                return
+            for smiles_list, future in batch.requests:
+                try:
+                    self._settle(future, self.predict_fn(smiles_list, model_name, model_descriptor, partial=True))
+                except Exception as e:
+                    future.set_exception(e)
+            return
+
+        # Fan the merged result back out, re-indexing errors per request.
+        errors = {error["index"]: error for error in result["errors"]}
+        offset = 0
+        for smiles_list, future in batch.requests:
+            stop = offset + len(smiles_list)
+            future.set_result({
+                "predictions": result["predictions"][offset:stop],
+                "errors": [
+                    {**errors[i], "index": i - offset}
+                    for i in range(offset, stop) if i in errors
+                ],
+            })
+            offset = stop
+
+    @staticmethod
+    def _settle(future, result):
+        if isinstance(result, Exception):
+            future.set_exception(result)
+        else:
+            future.set_result(result)
+
+    def _record(self, smiles_lists):
+        with self._lock:
+            self.batches += 1
+            self.requests += len(smiles_lists)
+            self.molecules += sum(len(smiles_list) for smiles_list in smiles_lists)
+            self.max_requests = max(self.max_requests, len(smiles_lists))
+            self.request_histogram[len(smiles_lists)] += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "max_wait_ms": self.max_wait * 1000,
+                "max_batch": self.max_batch,
+                "batches": self.batches,
+                "requests": self.requests,
+                "molecules": self.molecules,
+                "requests_per_batch": self.requests / self.batches if self.batches else 0.0,
+                "molecules_per_batch": self.molecules / self.batches if self.batches else 0.0,
+                "max_requests_per_batch": self.max_requests,
+                "requests_per_batch_histogram": dict(sorted(self.request_histogram.items())),
+            }
+
+
+def as_request_result(result, smiles_list, partial):
+    """
+    Turn a partial-mode result for smiles_list into the answer for a request
+    that asked for partial or legacy mode. Legacy answers fail the whole
+    request on its first invalid SMILES.
+    """
+    if partial or "error" in result:
+        return result
+    if result["errors"]:
+        return {"error": f"Invalid SMILES input of {smiles_list[result['errors'][0]['index']]}"}
+    return result["predictions"]
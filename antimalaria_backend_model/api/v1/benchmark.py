@@ -0,0 +1,246 @@
+import importlib
+import os
+import pickle
+import platform
+import random
+import resource
+import tempfile
+import time
+import numpy as np
+from contextlib import contextmanager
+from pathlib import Path
+from rdkit import Chem
+from rdkit.Chem import Crippen
+from . import utils
+from .registry import ModelRegistry
+
+# Building blocks for the synthetic corpus; concatenations that do not
+# sanitize are skipped, so the corpus only depends on the seed and RDKit.
+FRAGMENTS = [
+    "C", "CC", "CCC", "C(C)C", "O", "N", "S", "F", "Cl", "Br", "C#N", "OC", "N(C)C",
+    "C(=O)O", "C(=O)N", "c1ccccc1", "c1ccncc1", "c1ccsc1", "c1cnc[nH]1", "c1ccc2ccccc2c1",
+    "C1CCCCC1", "C1CCNCC1", "C1CCOC1",
+]
+TRAINING_SIZE = 2000
+LIBRARIES = ("numpy", "scipy", "sklearn", "xgboost", "lightgbm", "rdkit")
+
+
+def synthetic_corpus(n, seed=0):
+    rng = random.Random(seed)
+    corpus = []
+    while len(corpus) < n:
+        smiles = "".join(rng.choice(FRAGMENTS) for _ in range(rng.randint(2, 8)))
+        if Chem.MolFromSmiles(smiles) is not None:
+            corpus.append(smiles)
+    return corpus
+
+
+def train_models(featurizer, corpus, seed=0):
+    """
+    Small regressors for each installed framework, fit on the corpus with
+    Crippen logP as a learnable synthetic target.
+    """
+    training = corpus[:TRAINING_SIZE]
+    X, _ = featurizer.featurize(training)
+    y = np.array([Crippen.MolLogP(Chem.MolFromSmiles(smiles)) for smiles in training])
+
+    factories = {
+        "sklearn-rf": ("sklearn.ensemble", "RandomForestRegressor",
+                       {"n_estimators": 50, "max_depth": 12, "random_state": seed}),
+        "xgboost": ("xgboost", "XGBRegressor",
+                    {"n_estimators": 100, "max_depth": 6, "random_state": seed}),
+        "lightgbm": ("lightgbm", "LGBMRegressor",
+                     {"n_estimators": 100, "random_state": seed, "verbose": -1}),
+    }
+    models = {}
+    for name, (module_name, class_name, params) in factories.items():
+        try:
+            model_class = getattr(importlib.import_module(module_name), class_name)
+        except ImportError:
+            print(f"Skipping {name}: {module_name} is not installed.")
+            continue
+        models[name] = model_class(**params).fit(X, y)
+    return models
+
+
+def peak_rss_bytes():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if platform.system() == "Darwin" else peak * 1024
+
+
+def time_calls(fn, repeats):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def summarize(timings, n_molecules):
+    timings = np.array(timings)
+    median = float(np.median(timings))
+    return {
+        "median_ms": median * 1000,
+        "p95_ms": float(np.percentile(timings, 95)) * 1000,
+        "molecules_per_second": n_molecules / median if median > 0 else 0.0,
+    }
+
+
+@contextmanager
+def isolated_service(model_dir):
+    """
+    Point the prediction path at a scratch model registry and disable the
+    fingerprint and prediction caches, so repeats measure real work.
+    """
+    saved = (
+        utils.MODELS,
+        utils.PREDICTION_CACHE.max_entries,
+        utils.FINGERPRINT_CACHE.memory_budget,
+        utils.FINGERPRINT_CACHE.disk_budget,
+    )
+    utils.MODELS = ModelRegistry(model_dir, inference_threads=utils.settings.INFERENCE_THREADS)
+    utils.MODELS.discover()
+    utils.PREDICTION_CACHE.max_entries = 0
+    utils.FINGERPRINT_CACHE.memory_budget = 0
+    utils.FINGERPRINT_CACHE.disk_budget = 0
+    try:
+        yield utils.MODELS
+    finally:
+        (
+            utils.MODELS,
+            utils.PREDICTION_CACHE.max_entries,
+            utils.FINGERPRINT_CACHE.memory_budget,
+            utils.FINGERPRINT_CACHE.disk_budget,
+        ) = saved
+
+
+def run_benchmark(molecules=5000, batch_sizes=(1, 32, 1024, 4096), repeats=5, seed=0, descriptor="ECFP"):
+    """
+    Measure the featurize/predict hot path on a synthetic corpus and return a
+    JSON-serializable report.
+    """
+    featurizer = utils.get_featurizer(descriptor)
+    full_corpus = synthetic_corpus(max(molecules, TRAINING_SIZE), seed=seed)
+    corpus = full_corpus[:molecules]
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "cpu_count": os.cpu_count(),
+            "cpu_budget": utils.CPU_BUDGET.cpus,
+            "molecules": molecules,
+            "batch_sizes": list(batch_sizes),
+            "repeats": repeats,
+            "seed": seed,
+            "descriptor": descriptor,
+            "featurizers": {name: plan.describe() for name, plan in utils.FEATURIZER_MAP.items()},
+            "versions": {name: _version(name) for name in LIBRARIES},
+        },
+        "featurization": {},
+        "models": {},
+    }
+
+    sample = corpus[:min(len(corpus), 1000)]
+    ecfp = utils.FEATURES.get("ecfp", [])
+    pubchemfp = utils.FEATURES.get("pubchemfp", [])
+    featurization = {
+        "smiles_to_ecfp": lambda: [utils.smiles_to_ecfp(smiles, ecfp) for smiles in sample],
+        "smiles_to_pubchemfp": lambda: [utils.smiles_to_pubchemfp(smiles, pubchemfp) for smiles in sample],
+        "featurize_dense": lambda: featurizer.featurize(corpus),
+        "featurize_sparse": lambda: featurizer.featurize_sparse(corpus),
+    }
+    for name, fn in featurization.items():
+        n = len(sample) if name.startswith("smiles_to") else len(corpus)
+        report["featurization"][name] = summarize(time_calls(fn, repeats), n)
+    # Every registered descriptor, so featurizer plugins are compared on the
+    # same corpus.
+    report["featurization"]["descriptors"] = {
+        name: {
+            "dense": summarize(time_calls(lambda: plan.featurize(corpus), repeats), len(corpus)),
+            "sparse": summarize(time_calls(lambda: plan.featurize_sparse(corpus), repeats), len(corpus)),
+        }
+        for name, plan in utils.FEATURIZER_MAP.items()
+    }
+    report["featurization"]["peak_rss_bytes"] = peak_rss_bytes()
+
+    models = train_models(featurizer, full_corpus, seed=seed)
+    with tempfile.TemporaryDirectory(prefix="ic50-bench-") as model_dir, isolated_service(model_dir) as registry:
+        for name, model in models.items():
+            model_path = Path(model_dir) / f"{name}.pkl"
+            model_path.write_bytes(pickle.dumps(model))
+
+            start = time.perf_counter()
+            loaded = registry.load(model_path)
+            load_seconds = time.perf_counter() - start
+
+            result = {
+                "load_seconds": load_seconds,
+                "size_bytes": loaded.size,
+                "backend": loaded.backend.name,
+                "inference": {},
+                "predict_batch_ic50": {},
+            }
+            for batch_size in batch_sizes:
+                batch = (corpus * (batch_size // len(corpus) + 1))[:batch_size]
+                X, _ = utils.featurize_batch(featurizer, batch, sparse=loaded.backend.accepts_sparse)
+                result["inference"][str(batch_size)] = summarize(
+                    time_calls(lambda: loaded.backend.predict(X), repeats), batch_size
+                )
+                result["predict_batch_ic50"][str(batch_size)] = summarize(
+                    time_calls(lambda: utils.predict_batch_ic50(batch, model_path.name, descriptor), repeats),
+                    batch_size,
+                )
+            result["peak_rss_bytes"] = peak_rss_bytes()
+            report["models"][name] = result
+
+    report["peak_rss_bytes"] = peak_rss_bytes()
+    return report
+
+
+def _version(module_name):
+    try:
+        return importlib.import_module(module_name).__version__
+    except (ImportError, AttributeError):
+        return None
+
+
+def flatten_metrics(report, prefix=""):
+    metrics = {}
+    for key, value in report.items():
+        if key == "meta":
+            continue
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            metrics.update(flatten_metrics(value, f"{path}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            metrics[path] = float(value)
+    return metrics
+
+
+def compare_reports(current, baseline, tolerance=0.1):
+    """
+    Compare every numeric metric present in both reports. Throughput is
+    better when higher; latencies, load times and memory when lower. Returns
+    one row per metric with its relative change and whether it regressed by
+    more than tolerance.
+    """
+    current_metrics = flatten_metrics(current)
+    baseline_metrics = flatten_metrics(baseline)
+    rows = []
+    for path in sorted(set(current_metrics) & set(baseline_metrics)):
+        before, after = baseline_metrics[path], current_metrics[path]
+        if path.endswith("size_bytes") or before == 0:
+            continue
+        change = (after - before) / before
+        higher_is_better = path.endswith("molecules_per_second")
+        regressed = change < -tolerance if higher_is_better else change > tolerance
+        rows.append({
+            "metric": path,
+            "baseline": before,
+            "current": after,
+            "change": change,
+            "regressed": regressed,
+        })
+    return rows
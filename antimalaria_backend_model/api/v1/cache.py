@@ -0,0 +1,286 @@
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+SQLITE_BATCH_SIZE = 500
+
+
+class FingerprintCache:
+    """
+    Two-tier cache of packed fingerprints keyed by (featurizer config, SMILES).
+
+    The first tier is an in-process LRU bounded by memory_budget bytes. The
+    second is a SQLite file shared by every worker on the pod, bounded by
+    disk_budget bytes and evicted least-recently-used first. A budget of 0
+    disables that tier.
+
+    self._lock only guards the memory tier and the counters; each thread
+    reads and writes the SQLite file through its own connection, so memory
+    hits never wait on disk I/O. Triggers keep the file's total size in a
+    one-row table, so the budget is checked without scanning it.
+    """
+
+    def __init__(self, path, memory_budget=0, disk_budget=0):
+        self.path = path
+        self.memory_budget = memory_budget
+        self.disk_budget = disk_budget
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._disk_bytes = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._evict_lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.memory_budget > 0 or self.disk_budget > 0
+
+    def _connect(self):
+        # One connection per thread, and never one inherited through fork.
+        connection = getattr(self._local, "connection", None)
+        if connection is None or self._local.pid != os.getpid():
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            connection = sqlite3.connect(str(self.path), timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            if connection.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'fingerprint_bytes'"
+            ).fetchone() is None:
+                self._create_schema(connection)
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    @staticmethod
+    def _create_schema(connection):
+        # In one write transaction, so rows written by another worker are
+        # either counted by the initial sum or by the triggers.
+        connection.executescript(
+            "BEGIN IMMEDIATE;"
+            "CREATE TABLE IF NOT EXISTS fingerprints ("
+            "config TEXT NOT NULL, smiles TEXT NOT NULL, bits BLOB NOT NULL, last_used REAL NOT NULL, "
+            "PRIMARY KEY (config, smiles)) WITHOUT ROWID;"
+            "CREATE INDEX IF NOT EXISTS fingerprints_last_used ON fingerprints (last_used);"
+            "CREATE TABLE IF NOT EXISTS fingerprint_bytes (id INTEGER PRIMARY KEY CHECK (id = 0), bytes INTEGER NOT NULL);"
+            "INSERT OR IGNORE INTO fingerprint_bytes (id, bytes) "
+            "SELECT 0, COALESCE(SUM(length(bits) + length(smiles) + length(config)), 0) FROM fingerprints;"
+            "CREATE TRIGGER IF NOT EXISTS fingerprints_insert AFTER INSERT ON fingerprints BEGIN "
+            "UPDATE fingerprint_bytes SET bytes = bytes + length(NEW.bits) + length(NEW.smiles) + length(NEW.config); END;"
+            "CREATE TRIGGER IF NOT EXISTS fingerprints_update AFTER UPDATE OF bits ON fingerprints BEGIN "
+            "UPDATE fingerprint_bytes SET bytes = bytes + length(NEW.bits) - length(OLD.bits); END;"
+            "CREATE TRIGGER IF NOT EXISTS fingerprints_delete AFTER DELETE ON fingerprints BEGIN "
+            "UPDATE fingerprint_bytes SET bytes = bytes - length(OLD.bits) - length(OLD.smiles) - length(OLD.config); END;"
+            "COMMIT;"
+        )
+
+    def _measure_disk(self, connection):
+        return connection.execute("SELECT bytes FROM fingerprint_bytes WHERE id = 0").fetchone()[0]
+
+    def _remember(self, key, bits):
+        if self.memory_budget <= 0:
+            return
+
+        previous = self._memory.pop(key, None)
+        if previous is not None:
+            self._memory_bytes -= _entry_size(key, previous)
+
+        self._memory[key] = bits
+        self._memory_bytes += _entry_size(key, bits)
+
+        while self._memory_bytes > self.memory_budget and self._memory:
+            old_key, old_bits = self._memory.popitem(last=False)
+            self._memory_bytes -= _entry_size(old_key, old_bits)
+            self.evictions += 1
+
+    def get_many(self, config, smiles_list):
+        found = {}
+        with self._lock:
+            missing = []
+            for smiles in smiles_list:
+                bits = self._memory.get((config, smiles))
+                if bits is None:
+                    missing.append(smiles)
+                else:
+                    self._memory.move_to_end((config, smiles))
+                    found[smiles] = bits
+            self.hits += len(found)
+
+        if missing and self.disk_budget > 0:
+            disk_found = self._disk_get(config, missing)
+            with self._lock:
+                for smiles, bits in disk_found.items():
+                    self._remember((config, smiles), bits)
+                self.disk_hits += len(disk_found)
+            found.update(disk_found)
+
+        return found
+
+    def put_many(self, config, entries):
+        if not entries:
+            return
+
+        with self._lock:
+            for smiles, bits in entries.items():
+                self._remember((config, smiles), bits)
+        if self.disk_budget > 0:
+            self._disk_put(config, entries)
+
+    def record_misses(self, count):
+        with self._lock:
+            self.misses += count
+
+    def _disk_get(self, config, smiles_list):
+        connection = self._connect()
+        found = {}
+        unique = list(dict.fromkeys(smiles_list))
+        for start in range(0, len(unique), SQLITE_BATCH_SIZE):
+            batch = unique[start:start + SQLITE_BATCH_SIZE]
+            placeholders = ",".join("?" * len(batch))
+            rows = connection.execute(
+                f"SELECT smiles, bits FROM fingerprints WHERE config = ? AND smiles IN ({placeholders})",
+                [config, *batch],
+            ).fetchall()
+            found.update(rows)
+
+        if found:
+            now = time.time()
+            with connection:
+                connection.executemany(
+                    "UPDATE fingerprints SET last_used = ? WHERE config = ? AND smiles = ?",
+                    [(now, config, smiles) for smiles in found],
+                )
+        return found
+
+    def _disk_put(self, config, entries):
+        connection = self._connect()
+        now = time.time()
+        with connection:
+            connection.executemany(
+                "INSERT INTO fingerprints (config, smiles, bits, last_used) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (config, smiles) DO UPDATE SET bits = excluded.bits, last_used = excluded.last_used",
+                [(config, smiles, bits, now) for smiles, bits in entries.items()],
+            )
+            disk_bytes = self._measure_disk(connection)
+        self._disk_bytes = disk_bytes
+
+        # One evicting thread per process is enough; the others carry on.
+        if disk_bytes > self.disk_budget and self._evict_lock.acquire(blocking=False):
+            try:
+                self._evict_disk(connection)
+            finally:
+                self._evict_lock.release()
+
+    def _evict_disk(self, connection):
+        # The size is shared by every worker, so each batch is sized from it.
+        target = int(self.disk_budget * 0.9)
+        while True:
+            excess = self._measure_disk(connection) - target
+            if excess <= 0:
+                break
+            rows = connection.execute(
+                "SELECT config, smiles, length(bits) + length(smiles) + length(config) "
+                "FROM fingerprints ORDER BY last_used LIMIT ?",
+                (SQLITE_BATCH_SIZE,),
+            ).fetchall()
+            if not rows:
+                break
+
+            victims = []
+            for config, smiles, size in rows:
+                victims.append((config, smiles))
+                excess -= size
+                if excess <= 0:
+                    break
+
+            with connection:
+                connection.executemany("DELETE FROM fingerprints WHERE config = ? AND smiles = ?", victims)
+            with self._lock:
+                self.evictions += len(victims)
+        self._disk_bytes = self._measure_disk(connection)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+                "memory_budget": self.memory_budget,
+                "disk_bytes": self._disk_bytes,
+                "disk_budget": self.disk_budget,
+            }
+
+
+def _entry_size(key, bits):
+    return sys.getsizeof(key[1]) + sys.getsizeof(bits)
+
+
+class PredictionCache:
+    """
+    In-process LRU of predictions keyed by (model content hash, SMILES).
+
+    Pickled models are immutable, so a prediction stays valid for as long as
+    the file with that hash is served; invalidate() drops a model's entries
+    when its file is replaced or deleted.
+    """
+
+    def __init__(self, max_entries=0):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def get_many(self, model_hash, smiles_list):
+        found = {}
+        with self._lock:
+            for smiles in smiles_list:
+                value = self._entries.get((model_hash, smiles))
+                if value is not None:
+                    self._entries.move_to_end((model_hash, smiles))
+                    found[smiles] = value
+            self.hits += len(found)
+        return found
+
+    def put_many(self, model_hash, entries):
+        with self._lock:
+            for smiles, value in entries.items():
+                self._entries[(model_hash, smiles)] = value
+                self._entries.move_to_end((model_hash, smiles))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def record_misses(self, count):
+        with self._lock:
+            self.misses += count
+
+    def invalidate(self, model_hash):
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == model_hash]:
+                del self._entries[key]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+            }
@@ -0,0 +1,139 @@
+import math
+import os
+import threading
+from contextlib import contextmanager
+from joblib import parallel_config
+from threadpoolctl import ThreadpoolController
+
+_local = threading.local()
+
+
+def available_cpus():
+    # CPUs this process may run on, which can be fewer than the machine has.
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def current_plan():
+    """The thread counts reserved by the prediction running in this thread, or None."""
+    return getattr(_local, "plan", None)
+
+
+class CPUBudget:
+    """
+    Per-process CPU budget shared by concurrent predictions.
+
+    A prediction reserves threads for its featurization and its inference
+    (they run one after the other, so each may use the whole share). The
+    budget is split evenly between the reservations open in this process,
+    and a batch never gets more than one thread per min_rows_per_thread
+    molecules, since small batches lose more to thread start-up and
+    synchronisation than extra threads gain.
+
+    Inside a reservation the OpenMP thread count of the calling thread
+    (xgboost, lightgbm) and the joblib n_jobs default (sklearn) are limited
+    to the inference share. BLAS pools are limited to one thread for the
+    whole process, as no prediction path needs them.
+
+    The thread pool controller is created on first use, so a preloading
+    master starts no thread pools, and rebuilt only by rescan(), which the
+    model registry calls after unpickling a model: that can load another
+    OpenMP or BLAS runtime.
+    """
+
+    def __init__(self, cpus, min_rows_per_thread=256, featurize_chunk_size=1024):
+        self.cpus = max(1, cpus)
+        self.min_rows_per_thread = max(1, min_rows_per_thread)
+        self.featurize_chunk_size = max(1, featurize_chunk_size)
+
+        self.active = 0
+        self.peak = 0
+        self.reservations = 0
+        self.last_plan = None
+
+        self._controller = None
+        self._blas_limit = None
+        self._lock = threading.Lock()
+
+    def _get_controller(self):
+        with self._lock:
+            if self._controller is None:
+                self._scan()
+            return self._controller
+
+    def rescan(self):
+        """Pick up thread pool libraries loaded since the last scan; a no-op before first use."""
+        with self._lock:
+            if self._controller is not None:
+                self._scan()
+
+    def _scan(self):
+        # Called under self._lock.
+        self._controller = ThreadpoolController()
+        self._blas_limit = self._controller.limit(limits=1, user_api="blas")
+
+    def plan(self, n_molecules, active=1):
+        """Thread counts for a batch of n_molecules with active predictions running."""
+        share = max(1, self.cpus // max(1, active))
+        return {
+            "cpus": share,
+            "featurization": max(1, min(share, math.ceil(n_molecules / self.featurize_chunk_size))),
+            "inference": max(1, min(share, math.ceil(n_molecules / self.min_rows_per_thread))),
+        }
+
+    @contextmanager
+    def reserve(self, n_molecules):
+        """
+        Reserve threads for a prediction over n_molecules and apply them to
+        the inference libraries for the duration. Nested reservations in the
+        same thread reuse the outer one.
+        """
+        outer = current_plan()
+        if outer is not None:
+            yield outer
+            return
+
+        controller = self._get_controller()
+        with self._lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+            self.reservations += 1
+            plan = self.plan(n_molecules, self.active)
+            self.last_plan = plan
+
+        _local.plan = plan
+        try:
+            with controller.limit(limits=plan["inference"], user_api="openmp"), \
+                    parallel_config(n_jobs=plan["inference"]):
+                yield plan
+        finally:
+            _local.plan = None
+            with self._lock:
+                self.active -= 1
+
+    def stats(self):
+        with self._lock:
+            controller = self._controller
+            stats = {
+                "cpus": self.cpus,
+                "available_cpus": available_cpus(),
+                "min_rows_per_thread": self.min_rows_per_thread,
+                "active": self.active,
+                "peak": self.peak,
+                "reservations": self.reservations,
+                "last_plan": self.last_plan,
+            }
+        # Thread counts as seen from this (request) thread, outside any
+        # reservation.
+        stats["libraries"] = [
+            {
+                "user_api": info["user_api"],
+                "internal_api": info["internal_api"],
+                "num_threads": info["num_threads"],
+                "filepath": info["filepath"],
+            }
+            for info in (controller.info() if controller is not None else [])
+        ]
+        return stats
@@ -0,0 +1,241 @@
+import hashlib
+import time
+import numpy as np
+from rdkit import Chem, DataStructs
+from scipy import sparse
+from rdkit.Chem import MACCSkeys
+from rdkit.Chem.rdFingerprintGenerator import GetMorganGenerator
+
+
+FEATURIZER_KINDS = {}
+
+
+def register_featurizer(cls):
+    FEATURIZER_KINDS[cls.kind] = cls
+    return cls
+
+
+def build_featurizer(kind, selected_features=None, **params):
+    featurizer_class = FEATURIZER_KINDS.get(kind)
+    if featurizer_class is None:
+        raise ValueError(f"Unknown featurizer kind '{kind}'.")
+    return featurizer_class(selected_features, **params)
+
+
+class BitFeaturizer:
+    """
+    Featurizer over a fixed-width RDKit bit vector, compiled once per
+    descriptor.
+
+    Each featurizer declares its output: n_features float32 columns (the
+    selected_features bits of an n_bits fingerprint, or all of them when
+    None), its params, and a config_key naming the exact feature plan.
+    Featurizing a batch writes the selected bits of each fingerprint straight
+    into one preallocated (n, k) matrix, or builds a CSR matrix from the
+    on-bits.
+
+    Subclasses set kind, implement fingerprint(mol) and params, and rebuild
+    per-process state (RDKit generators are not picklable) in _build(); they
+    are made available to descriptors with @register_featurizer.
+    """
+
+    kind = None
+    dtype = np.float32
+    _transient = ("columns",)
+
+    def __init__(self, selected_features, n_bits):
+        self.n_bits = n_bits
+        if selected_features is None:
+            selected_features = range(n_bits)
+        self.indices = np.array(selected_features).flatten().astype(np.intp)
+        selection_hash = hashlib.sha1(self.indices.tobytes()).hexdigest()[:16]
+        self.config_key = f"{self.kind}-{self.config_params()}-{selection_hash}"
+        self._build()
+
+    def _build(self):
+        self.columns = _column_map(self.indices, self.n_bits)
+
+    def __getstate__(self):
+        return {k: v for k, v in self.__dict__.items() if k not in self._transient}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._build()
+
+    @property
+    def params(self):
+        return {"n_bits": self.n_bits}
+
+    def config_params(self):
+        return f"b{self.n_bits}"
+
+    def fingerprint(self, mol):
+        raise NotImplementedError
+
+    @property
+    def n_features(self):
+        return len(self.indices)
+
+    def describe(self):
+        return {
+            "kind": self.kind,
+            "n_features": self.n_features,
+            "dtype": np.dtype(self.dtype).name,
+            "params": self.params,
+            "config_key": self.config_key,
+        }
+
+    def allocate(self, n):
+        return np.zeros((n, self.n_features), dtype=self.dtype)
+
+    def featurize_mols(self, mols, out=None, timings=None):
+        """
+        Featurize already parsed mols. When a timings dict is given, seconds
+        spent generating fingerprints and selecting features are added to its
+        "fingerprinting" and "feature_selection" entries.
+        """
+        if out is None:
+            out = self.allocate(len(mols))
+
+        valid = np.zeros(len(mols), dtype=bool)
+        scratch = np.zeros((self.n_bits,), dtype=self.dtype)
+        fingerprinting = selection = 0.0
+        for i, mol in enumerate(mols):
+            if mol is None:
+                continue
+            start = time.perf_counter()
+            DataStructs.ConvertToNumpyArray(self.fingerprint(mol), scratch)
+            selected = time.perf_counter()
+            np.take(scratch, self.indices, out=out[i])
+            valid[i] = True
+            fingerprinting += selected - start
+            selection += time.perf_counter() - selected
+
+        _add_timings(timings, fingerprinting, selection)
+        return out, valid
+
+    def featurize(self, smiles_list, out=None):
+        return self.featurize_mols([Chem.MolFromSmiles(s) for s in smiles_list], out=out)
+
+    def featurize_mols_sparse(self, mols, timings=None):
+        """
+        Same features as featurize_mols as an (n, k) CSR matrix, built from
+        each fingerprint's on-bits without a dense intermediate.
+        """
+        if self.columns is None:
+            dense, valid = self.featurize_mols(mols, timings=timings)
+            return sparse.csr_matrix(dense), valid
+
+        valid = np.zeros(len(mols), dtype=bool)
+        indptr = np.zeros(len(mols) + 1, dtype=np.int64)
+        row_columns = []
+        fingerprinting = selection = 0.0
+        for i, mol in enumerate(mols):
+            if mol is not None:
+                start = time.perf_counter()
+                on_bits = np.fromiter(self.fingerprint(mol).GetOnBits(), dtype=np.intp)
+                selected = time.perf_counter()
+                columns = self.columns[on_bits]
+                columns = np.sort(columns[columns >= 0])
+                row_columns.append(columns)
+                valid[i] = True
+                indptr[i + 1] = len(columns)
+                fingerprinting += selected - start
+                selection += time.perf_counter() - selected
+        np.cumsum(indptr, out=indptr)
+        _add_timings(timings, fingerprinting, selection)
+
+        indices = np.concatenate(row_columns).astype(np.int32) if row_columns else np.zeros(0, dtype=np.int32)
+        data = np.ones(len(indices), dtype=self.dtype)
+        return sparse.csr_matrix((data, indices, indptr), shape=(len(mols), self.n_features)), valid
+
+    def featurize_sparse(self, smiles_list):
+        return self.featurize_mols_sparse([Chem.MolFromSmiles(s) for s in smiles_list])
+
+
+@register_featurizer
+class MorganFeaturizer(BitFeaturizer):
+    """Morgan (ECFP-style) fingerprint of the given radius folded to n_bits."""
+
+    kind = "morgan"
+    _transient = ("columns", "generator")
+
+    def __init__(self, selected_features, radius, n_bits):
+        self.radius = radius
+        super().__init__(selected_features, n_bits)
+
+    def _build(self):
+        super()._build()
+        self.generator = GetMorganGenerator(radius=self.radius, fpSize=self.n_bits)
+
+    @property
+    def params(self):
+        return {"radius": self.radius, "n_bits": self.n_bits}
+
+    def config_params(self):
+        return f"r{self.radius}-b{self.n_bits}"
+
+    def fingerprint(self, mol):
+        return self.generator.GetFingerprint(mol)
+
+
+@register_featurizer
+class MACCSFeaturizer(BitFeaturizer):
+    """The 166 MACCS structural keys (167 bits, bit 0 unused) from RDKit."""
+
+    kind = "maccs"
+
+    def __init__(self, selected_features=None):
+        super().__init__(selected_features, n_bits=167)
+
+    @property
+    def params(self):
+        return {}
+
+    def fingerprint(self, mol):
+        return MACCSkeys.GenMACCSKeys(mol)
+
+
+def _add_timings(timings, fingerprinting, selection):
+    if timings is not None:
+        timings["fingerprinting"] = timings.get("fingerprinting", 0.0) + fingerprinting
+        timings["feature_selection"] = timings.get("feature_selection", 0.0) + selection
+
+
+def _column_map(indices, n_bits):
+    # Fingerprint bit -> selected column, or -1. None when a bit is selected
+    # more than once, which only the dense path handles.
+    if len(np.unique(indices)) != len(indices):
+        return None
+    columns = np.full(n_bits, -1, dtype=np.intp)
+    columns[indices] = np.arange(len(indices))
+    return columns
+
+
+def pack_rows(matrix):
+    """
+    np.packbits(matrix != 0, axis=1) for a dense array or CSR matrix, without
+    densifying the latter.
+    """
+    if not sparse.issparse(matrix):
+        return np.packbits(np.asarray(matrix).astype(bool), axis=1)
+
+    matrix = matrix.tocsr()
+    n_rows, n_features = matrix.shape
+    packed = np.zeros((n_rows, (n_features + 7) // 8), dtype=np.uint8)
+    rows = np.repeat(np.arange(n_rows), np.diff(matrix.indptr))
+    columns = matrix.indices[matrix.data != 0]
+    rows = rows[matrix.data != 0]
+    np.bitwise_or.at(packed, (rows, columns >> 3), (0x80 >> (columns & 7)).astype(np.uint8))
+    return packed
+
+
+def unpack_rows_sparse(packed, n_features, chunk_size=1024):
+    # Chunked so the dense uint8 intermediate stays small.
+    chunks = [
+        sparse.csr_matrix(np.unpackbits(packed[start:start + chunk_size], axis=1, count=n_features), dtype=np.float32)
+        for start in range(0, len(packed), chunk_size)
+    ]
+    if not chunks:
+        return sparse.csr_matrix((0, n_features), dtype=np.float32)
+    return sparse.vstack(chunks, format="csr")
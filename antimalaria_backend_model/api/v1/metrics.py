@@ -0,0 +1,218 @@
+import atexit
+import json
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SNAPSHOT_INTERVAL = 1.0
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value))
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        self.registry = None
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+        if self.registry is not None:
+            self.registry.changed()
+
+    def snapshot(self):
+        with self._lock:
+            return {json.dumps(key): value for key, value in self._values.items()}
+
+    @staticmethod
+    def merge(total, values):
+        for key, value in values.items():
+            total[key] = total.get(key, 0.0) + value
+
+    def render(self, values):
+        for key, value in sorted(values.items()):
+            yield f"{self.name}{_format_labels(self.labelnames, json.loads(key))} {_format_value(value)}"
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}
+        self._lock = threading.Lock()
+        self.registry = None
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {"buckets": [0] * len(self.buckets), "count": 0, "sum": 0.0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state["buckets"][i] += 1
+                    break
+            state["count"] += 1
+            state["sum"] += value
+        if self.registry is not None:
+            self.registry.changed()
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                json.dumps(key): {"buckets": list(state["buckets"]), "count": state["count"], "sum": state["sum"]}
+                for key, state in self._values.items()
+            }
+
+    @staticmethod
+    def merge(total, values):
+        for key, state in values.items():
+            merged = total.setdefault(key, {"buckets": [0] * len(state["buckets"]), "count": 0, "sum": 0.0})
+            merged["buckets"] = [a + b for a, b in zip(merged["buckets"], state["buckets"])]
+            merged["count"] += state["count"]
+            merged["sum"] += state["sum"]
+
+    def render(self, values):
+        for key, state in sorted(values.items()):
+            label_values = json.loads(key)
+            cumulative = 0
+            # Buckets are stored per interval and rendered cumulatively.
+            for bound, count in zip(self.buckets, state["buckets"]):
+                cumulative += count
+                labels = _format_labels(self.labelnames, label_values, [("le", _format_value(bound))])
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.labelnames, label_values, [("le", "+Inf")])
+            yield f"{self.name}_bucket{labels} {state['count']}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, label_values)} {_format_value(state['sum'])}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, label_values)} {state['count']}"
+
+
+class MetricsRegistry:
+    """
+    Counters and histograms rendered in the Prometheus text format.
+
+    Values live in the process that recorded them. With a snapshot_dir, every
+    process that records something also writes its values to
+    <snapshot_dir>/metrics-<pid>.json from a background thread (at most once
+    per SNAPSHOT_INTERVAL), and render() sums the files of all processes, so
+    a scrape answered by any gunicorn worker covers the whole service.
+    Snapshots of exited workers are kept so counters never go backwards;
+    gunicorn.conf.py clears the directory when the server starts.
+    """
+
+    def __init__(self, snapshot_dir=None):
+        self.snapshot_dir = Path(snapshot_dir) if snapshot_dir else None
+        self._metrics = {}
+        self._dirty = False
+        self._flusher_pid = None
+        self._flusher_lock = threading.Lock()
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def _register(self, metric):
+        metric.registry = self
+        self._metrics[metric.name] = metric
+        return metric
+
+    def changed(self):
+        if self.snapshot_dir is None:
+            return
+        self._dirty = True
+        # One flusher per process; a forked worker starts its own.
+        if self._flusher_pid != os.getpid():
+            with self._flusher_lock:
+                if self._flusher_pid != os.getpid():
+                    self._flusher_pid = os.getpid()
+                    atexit.register(self.write_snapshot)
+                    threading.Thread(target=self._flush_loop, name="metrics-snapshot", daemon=True).start()
+
+    def _flush_loop(self):
+        pid = os.getpid()
+        while self._flusher_pid == pid:
+            time.sleep(SNAPSHOT_INTERVAL)
+            if self._dirty:
+                self._dirty = False
+                self.write_snapshot()
+
+    def snapshot(self):
+        return {name: metric.snapshot() for name, metric in self._metrics.items()}
+
+    def write_snapshot(self):
+        if self.snapshot_dir is None:
+            return
+        try:
+            self.snapshot_dir.mkdir(parents=True, exist_ok=True)
+            path = self.snapshot_dir / f"metrics-{os.getpid()}.json"
+            tmp_path = path.with_suffix(".tmp")
+            tmp_path.write_text(json.dumps(self.snapshot()))
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Failed to write metrics snapshot: {e}")
+
+    def _collect(self):
+        if self.snapshot_dir is None:
+            return self.snapshot()
+
+        self.write_snapshot()
+        totals = {name: {} for name in self._metrics}
+        for path in self.snapshot_dir.glob("metrics-*.json"):
+            try:
+                snapshot = json.loads(path.read_text())
+            except (OSError, ValueError):
+                continue
+            for name, values in snapshot.items():
+                if name in self._metrics:
+                    self._metrics[name].merge(totals[name], values)
+        return totals
+
+    def render(self):
+        values = self._collect()
+        lines = []
+        for name, metric in self._metrics.items():
+            lines.append(f"# HELP {name} {metric.documentation}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            lines.extend(metric.render(values.get(name, {})))
+        return "\n".join(lines) + "\n"
+
+
+@contextmanager
+def timed(histogram, **labels):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram.observe(time.perf_counter() - start, **labels)
@@ -0,0 +1,80 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class QueueFull(Exception):
+    pass
+
+
+class BoundedExecutor:
+    """
+    Fixed-size thread pool for running CPU-bound work from async views.
+
+    At most max_queue calls may be waiting or running at once; run() raises
+    QueueFull beyond that so callers can shed load instead of piling up.
+    Cancelling the awaiting task drops a call that has not started yet; a
+    call already running finishes in its thread and its result is discarded.
+    """
+
+    def __init__(self, max_workers, max_queue=0):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.cancelled = 0
+        self.rejected = 0
+
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        # Created on first use so a preloading master never starts threads.
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="inference")
+            return self._executor
+
+    def _call(self, fn, args, kwargs):
+        with self._lock:
+            self.queued -= 1
+            self.running += 1
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            with self._lock:
+                self.running -= 1
+                self.completed += 1
+
+    async def run(self, fn, *args, **kwargs):
+        executor = self._get_executor()
+        with self._lock:
+            if self.max_queue > 0 and self.queued + self.running >= self.max_queue:
+                self.rejected += 1
+                raise QueueFull(f"Inference queue is full ({self.max_queue} calls).")
+            self.queued += 1
+
+        future = executor.submit(self._call, fn, args, kwargs)
+        try:
+            return await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            with self._lock:
+                self.cancelled += 1
+                if future.cancel():
+                    self.queued -= 1
+            raise
+
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "queued": self.queued,
+                "running": self.running,
+                "depth": self.queued + self.running,
+                "completed": self.completed,
+                "cancelled": self.cancelled,
+                "rejected": self.rejected,
+            }
@@ -0,0 +1,184 @@
+import atexit
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+import numpy as np
+import scipy.sparse
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from django.conf import settings
+from rdkit import Chem
+from .cpu import current_plan
+
+# tmpfs-backed so workers write fingerprints into memory the parent maps,
+# instead of pickling arrays back through the result pipe.
+SHARED_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else None
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=settings.FEATURIZE_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _executor
+
+
+def shutdown_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(cancel_futures=True)
+            _executor = None
+
+
+atexit.register(shutdown_executor)
+
+
+def after_fork():
+    # A pool started by the parent belongs to the parent.
+    global _executor, _executor_lock
+    _executor = None
+    _executor_lock = threading.Lock()
+
+
+def _featurize_shared(featurizer, smiles_chunk, path, shape, start):
+    fp_array = np.memmap(path, dtype=np.float32, mode="r+", shape=shape)
+    stop = start + len(smiles_chunk)
+    _, valid = featurizer.featurize(smiles_chunk, out=fp_array[start:stop])
+    fp_array.flush()
+    del fp_array
+    return start, valid
+
+
+def _featurize_sparse(featurizer, smiles_chunk):
+    # CSR chunks are a few hundred bytes per molecule, cheap to pickle back.
+    return featurizer.featurize_sparse(smiles_chunk)
+
+
+def _canonicalize(smiles_chunk):
+    keys = []
+    for smiles in smiles_chunk:
+        mol = Chem.MolFromSmiles(smiles) if isinstance(smiles, str) and smiles.strip() else None
+        keys.append(Chem.MolToSmiles(mol) if mol is not None else None)
+    return keys
+
+
+def canonicalize_batch(smiles_list):
+    """
+    Canonical SMILES of each entry of smiles_list, None where it does not
+    parse, computed on the process pool in chunks like featurize_batch. The
+    molecules stay in the workers; featurizing parses them again there.
+    """
+    chunk_size = settings.FEATURIZE_CHUNK_SIZE
+    chunks = _map_bounded(
+        get_executor(), _canonicalize,
+        [(smiles_list[start:start + chunk_size],) for start in range(0, len(smiles_list), chunk_size)],
+        pool_workers(),
+    )
+    return [key for chunk in chunks for key in chunk]
+
+
+def pool_workers():
+    # Pool processes one batch may keep busy: the featurization share of the
+    # CPU budget reserved by the current prediction, if any.
+    plan = current_plan()
+    if plan is None:
+        return settings.FEATURIZE_WORKERS
+    return min(settings.FEATURIZE_WORKERS, plan["featurization"])
+
+
+def use_pool(n):
+    return pool_workers() > 1 and n >= settings.FEATURIZE_POOL_MIN_BATCH
+
+
+def featurize_batch(featurizer, smiles_list, mols=None, sparse=False, timings=None):
+    """
+    Featurize smiles_list into an (n, k) float32 matrix and a validity mask;
+    a CSR matrix when sparse is true.
+
+    Large batches are sharded across the persistent process pool, with at
+    most pool_workers() chunks of the batch in flight. Dense rows
+    are written by each worker into a shared tmpfs-backed matrix whose backing
+    file is unlinked before returning, so the memory is released with the
+    array; sparse chunks are small enough to be returned directly.
+    Already parsed mols are reused on the in-process path.
+
+    timings is passed to the featurizer on the in-process path; for pooled
+    batches the whole wall time is counted as fingerprinting, since the
+    workers do not report their split.
+    """
+    n = len(smiles_list)
+    if not use_pool(n) or featurizer.n_features == 0:
+        if mols is None:
+            mols = [Chem.MolFromSmiles(s) for s in smiles_list]
+        if sparse:
+            return featurizer.featurize_mols_sparse(mols, timings=timings)
+        return featurizer.featurize_mols(mols, timings=timings)
+
+    start = time.perf_counter()
+    try:
+        return _featurize_pooled(featurizer, smiles_list, sparse)
+    finally:
+        if timings is not None:
+            timings["fingerprinting"] = timings.get("fingerprinting", 0.0) + time.perf_counter() - start
+
+
+def _featurize_pooled(featurizer, smiles_list, sparse):
+    n = len(smiles_list)
+
+    chunk_size = settings.FEATURIZE_CHUNK_SIZE
+    executor = get_executor()
+    workers = pool_workers()
+
+    if sparse:
+        chunks = _map_bounded(
+            executor, _featurize_sparse,
+            [(featurizer, smiles_list[start:start + chunk_size]) for start in range(0, n, chunk_size)],
+            workers,
+        )
+        return (
+            scipy.sparse.vstack([matrix for matrix, _ in chunks], format="csr"),
+            np.concatenate([valid for _, valid in chunks]),
+        )
+
+    shape = (n, featurizer.n_features)
+
+    with tempfile.NamedTemporaryFile(prefix="fp-", suffix=".f32", dir=SHARED_DIR) as shared_file:
+        shared_file.truncate(n * featurizer.n_features * np.dtype(np.float32).itemsize)
+        fp_array = np.memmap(shared_file.name, dtype=np.float32, mode="r+", shape=shape)
+
+        chunks = _map_bounded(
+            executor, _featurize_shared,
+            [(featurizer, smiles_list[start:start + chunk_size], shared_file.name, shape, start)
+             for start in range(0, n, chunk_size)],
+            workers,
+        )
+
+        valid = np.zeros(n, dtype=bool)
+        for start, chunk_valid in chunks:
+            valid[start:start + len(chunk_valid)] = chunk_valid
+
+    return np.asarray(fp_array), valid
+
+
+def _map_bounded(executor, fn, calls, workers):
+    # fn(*args) for every args in calls, in order, with at most workers calls
+    # submitted at a time, so concurrent batches share the pool.
+    results = [None] * len(calls)
+    pending = {}
+    for index, args in enumerate(calls):
+        if len(pending) >= workers:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                results[pending.pop(future)] = future.result()
+        pending[executor.submit(fn, *args)] = index
+    for future, index in pending.items():
+        results[index] = future.result()
+    return results
@@ -0,0 +1,63 @@
+import gc
+import os
+import threading
+from django.db import connections
+from . import pool, startup, utils
+
+MEMORY_FIELDS = ("Rss", "Pss", "Shared_Clean", "Shared_Dirty", "Private_Clean", "Private_Dirty")
+
+
+def memory_report(pid="self"):
+    """
+    Resident memory of a process split into pages shared with other processes
+    (copy-on-write model memory inherited from the master) and private pages.
+    Returns {} where /proc/<pid>/smaps_rollup is unavailable.
+    """
+    fields = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 2 and parts[0].rstrip(":") in MEMORY_FIELDS:
+                    fields[parts[0].rstrip(":")] = int(parts[1]) * 1024
+    except (OSError, ValueError):
+        return {}
+
+    return {
+        "pid": os.getpid() if pid == "self" else int(pid),
+        "rss_bytes": fields.get("Rss", 0),
+        "pss_bytes": fields.get("Pss", 0),
+        "shared_bytes": fields.get("Shared_Clean", 0) + fields.get("Shared_Dirty", 0),
+        "private_bytes": fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0),
+    }
+
+
+def preload():
+    """
+    Load the active models in the master before workers are forked.
+
+    Models are not warmed here: a prediction would start the OpenMP thread
+    pools of xgboost/lightgbm, which do not survive fork. Afterwards every
+    object is moved out of the garbage collector's reach, so collections in
+    the workers do not write to (and un-share) the inherited pages.
+    """
+    utils.ensure_features()
+    utils.MODELS.discover()
+    utils.MODELS.preload(utils.active_model_names(), warm=False)
+    # Workers must open their own database connections.
+    connections.close_all()
+
+    gc.collect()
+    gc.freeze()
+    print(f"Preloaded {len(utils.MODELS.stats()['loaded'])} model(s) in master {os.getpid()}.")
+
+
+def after_fork():
+    utils.MODELS.after_fork()
+    pool.after_fork()
+
+    def warm():
+        startup.warm_up()
+        print(f"Worker memory after warm-up: {memory_report()}")
+
+    threading.Thread(target=warm, name="model-warm-up", daemon=True).start()
@@ -0,0 +1,404 @@
+import gc
+import hashlib
+import pickle
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from .backends import select_backend
+
+MODEL_SUFFIXES = (".pkl",)
+
+
+class LoadedModel:
+    def __init__(self, model, content_hash, size, threads=0):
+        self.model = model
+        self.content_hash = content_hash
+        # Serialized size is used as the resident-size estimate: tree
+        # ensembles unpickle into arrays of roughly the same footprint.
+        self.size = size
+        self.threads = threads
+        self.loaded_at = time.time()
+        self.last_used = self.loaded_at
+        self._backend = None
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            self._backend = select_backend(self.model, self.threads)
+        return self._backend
+
+
+def warm_up(loaded):
+    # Selecting the backend runs its parity check, whose predictions also
+    # initialize lazy native state (thread pools, compiled predictors) before
+    # the model takes real traffic.
+    return loaded.backend
+
+
+class _Released:
+    """
+    Changes made under the registry lock and acted on by _release() after
+    it: hashes that stopped being served and the number of model objects
+    dropped from memory.
+    """
+
+    def __init__(self):
+        self.retired = set()
+        self.dropped = 0
+
+
+def _file_stamp(path):
+    stat = path.stat()
+    return stat.st_mtime_ns, stat.st_size
+
+
+class ModelRegistry:
+    """
+    Content-addressed, lazily loaded set of pickled models in model_dir.
+
+    File names map to content hashes and loaded models are stored per hash,
+    so identical files share one object. Every refresh_interval seconds the
+    directory is re-scanned, so each worker notices files added, replaced or
+    removed by another worker: replaced and newly active models are loaded
+    and warmed in the background, then swapped in atomically while the old
+    object keeps serving; removed ones are released.
+
+    When the summed size of loaded models exceeds memory_budget bytes (0
+    means unlimited), the least recently used ones are unloaded, except
+    models pinned by the pinned_names callable (the active models).
+    on_release(content_hash) is called when a hash stops being served
+    because its file was replaced or removed (not when it is only unloaded),
+    on_unpickle() after each model is unpickled, and validate(name, model)
+    may raise to reject a file before it is served.
+    """
+
+    def __init__(self, model_dir, memory_budget=0, pinned_names=None, refresh_interval=0, on_release=None,
+                 inference_threads=0, validate=None, on_unpickle=None):
+        self.model_dir = Path(model_dir)
+        self.memory_budget = memory_budget
+        self.pinned_names = pinned_names or (lambda: set())
+        self.refresh_interval = refresh_interval
+        self.on_release = on_release or (lambda content_hash: None)
+        self.inference_threads = inference_threads
+        self.validate = validate or (lambda name, model: None)
+        self.on_unpickle = on_unpickle or (lambda: None)
+
+        self.loads = 0
+        self.swaps = 0
+        self.evictions = 0
+
+        self._paths = {}
+        self._stamps = {}
+        self._hashes = {}
+        self._failures = {}
+        self._loaded = OrderedDict()
+        self._last_refresh = 0.0
+        self._init_process_state()
+
+    def _init_process_state(self):
+        self._warming = set()
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        # name -> lock serializing loads of that file; guarded by self._lock.
+        self._loading_locks = {}
+        self._warmer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="model-warmer")
+
+    def after_fork(self):
+        # Locks and threads do not survive fork; loaded models do, and stay
+        # shared with the parent until written to.
+        self._init_process_state()
+
+    def discover(self):
+        # Runs during app initialization, so active models are not looked up
+        # (and warmed) until the first periodic refresh.
+        self.model_dir.mkdir(parents=True, exist_ok=True)
+        with self._refresh_lock:
+            self._last_refresh = time.monotonic()
+            self._rescan(warm_pinned=False)
+
+    def refresh(self, force=False):
+        now = time.monotonic()
+        if not force and now - self._last_refresh < self.refresh_interval:
+            return
+        if not self._refresh_lock.acquire(blocking=False):
+            return
+        try:
+            self._last_refresh = now
+            self._rescan()
+        finally:
+            self._refresh_lock.release()
+
+    def _rescan(self, warm_pinned=True):
+        current = {}
+        if self.model_dir.is_dir():
+            for model_path in self.model_dir.iterdir():
+                if model_path.suffix in MODEL_SUFFIXES and model_path.is_file():
+                    current[model_path.name] = (model_path, _file_stamp(model_path))
+
+        stale = []
+        released = _Released()
+        with self._lock:
+            for name in [name for name in self._paths if name not in current]:
+                self._forget(name, released)
+            for name, (model_path, stamp) in current.items():
+                previous = self._stamps.get(name)
+                self._paths[name] = model_path
+                self._stamps[name] = stamp
+                if previous is not None and previous != stamp and name in self._hashes:
+                    stale.append(name)
+        self._release(released)
+
+        pinned = self.pinned_names() if warm_pinned else set()
+        with self._lock:
+            cold = [name for name in pinned if name in self._paths and name not in self._hashes]
+        for name in set(stale) | set(cold):
+            self.warm_in_background(name)
+
+    def warm_in_background(self, name):
+        with self._lock:
+            if name in self._warming or name not in self._paths:
+                return
+            self._warming.add(name)
+            model_path = self._paths[name]
+
+        def warm():
+            try:
+                self.load(model_path)
+            except Exception as e:
+                self._failed(name, e)
+            finally:
+                with self._lock:
+                    self._warming.discard(name)
+
+        self._warmer.submit(warm)
+
+    def __contains__(self, name):
+        with self._lock:
+            return name in self._paths
+
+    def entry(self, name):
+        self.refresh()
+        with self._lock:
+            loaded = self._loaded_for(name)
+            if loaded is not None:
+                return loaded
+            model_path = self._paths.get(name)
+        if model_path is None:
+            # Files uploaded through another worker since the last scan.
+            candidate = self.model_dir / name
+            if candidate.suffix not in MODEL_SUFFIXES or not candidate.is_file():
+                return None
+            model_path = candidate
+
+        with self._lock:
+            loading_lock = self._loading_locks.setdefault(name, threading.Lock())
+        with loading_lock:
+            with self._lock:
+                loaded = self._loaded_for(name)
+            if loaded is not None:
+                return loaded
+            try:
+                return self.load(model_path)
+            except Exception as e:
+                self._failed(name, e)
+                return None
+
+    def failure(self, name):
+        with self._lock:
+            return self._failures.get(name)
+
+    def _failed(self, name, error):
+        print(f"Failed to load model {name}: {error}")
+        with self._lock:
+            self._failures[name] = str(error)
+
+    def _loaded_for(self, name):
+        content_hash = self._hashes.get(name)
+        loaded = self._loaded.get(content_hash) if content_hash else None
+        if loaded is not None:
+            self._loaded.move_to_end(content_hash)
+            loaded.last_used = time.time()
+        return loaded
+
+    def get(self, name, default=None):
+        loaded = self.entry(name)
+        return loaded.model if loaded is not None else default
+
+    def preload(self, names, warm=True):
+        # Models already loaded (e.g. inherited from a preloading master) are
+        # left alone; warm_loaded() warms those.
+        for name in names:
+            with self._lock:
+                model_path = self._paths.get(name)
+                if model_path is None or name in self._warming or self._hashes.get(name) in self._loaded:
+                    continue
+                self._warming.add(name)
+            try:
+                self.load(model_path, warm=warm)
+            except Exception as e:
+                self._failed(name, e)
+            finally:
+                with self._lock:
+                    self._warming.discard(name)
+
+    def warm_loaded(self):
+        with self._lock:
+            models = list(self._loaded.values())
+        for loaded in models:
+            warm_up(loaded)
+
+    def load(self, model_path, warm=True):
+        model_path = Path(model_path)
+        try:
+            return self._load(model_path, warm)
+        except Exception as e:
+            with self._lock:
+                self._failures[model_path.name] = str(e)
+            raise
+
+    def _load(self, model_path, warm):
+        # The new model is unpickled, validated and warmed before it is
+        # swapped in under the lock, so requests never see a half-loaded model.
+        if model_path.suffix not in MODEL_SUFFIXES:
+            raise ValueError("Unsupported model format.")
+
+        stamp = _file_stamp(model_path)
+        data = model_path.read_bytes()
+        content_hash = hashlib.sha256(data).hexdigest()
+
+        with self._lock:
+            loaded = self._loaded.get(content_hash)
+        if loaded is None:
+            loaded = LoadedModel(pickle.loads(data), content_hash, len(data), self.inference_threads)
+            self.on_unpickle()
+        del data
+        self.validate(model_path.name, loaded.model)
+        if warm:
+            warm_up(loaded)
+
+        pinned = self.pinned_names() if self.memory_budget > 0 else set()
+        released = _Released()
+        with self._lock:
+            name = model_path.name
+            self._failures.pop(name, None)
+            previous_hash = self._hashes.get(name)
+            self._paths[name] = model_path
+            self._stamps[name] = stamp
+            self._hashes[name] = content_hash
+            if content_hash not in self._loaded:
+                self._loaded[content_hash] = loaded
+                self.loads += 1
+            self._loaded.move_to_end(content_hash)
+            if previous_hash and previous_hash != content_hash:
+                self.swaps += 1
+                self._release_if_unused(previous_hash, released)
+            self._evict(content_hash, pinned, released)
+        self._release(released)
+        return loaded
+
+    def unload(self, name):
+        released = _Released()
+        with self._lock:
+            loaded = self._forget(name, released)
+        self._release(released)
+        return loaded
+
+    def _forget(self, name, released):
+        self._paths.pop(name, None)
+        self._failures.pop(name, None)
+        self._stamps.pop(name, None)
+        self._loading_locks.pop(name, None)
+        content_hash = self._hashes.pop(name, None)
+        if content_hash is None:
+            return None
+        loaded = self._loaded.get(content_hash)
+        self._release_if_unused(content_hash, released)
+        return loaded
+
+    def _release_if_unused(self, content_hash, released):
+        # Called under self._lock; the hash is released by _release().
+        if content_hash in self._hashes.values():
+            return
+        if self._loaded.pop(content_hash, None) is not None:
+            released.dropped += 1
+        released.retired.add(content_hash)
+
+    def _release(self, released):
+        # Runs after self._lock is released: a collection and on_release (a
+        # scan of the prediction cache) must not hold up entry() lookups.
+        if released.dropped:
+            gc.collect()
+        for content_hash in released.retired:
+            self.on_release(content_hash)
+
+    def _evict(self, keep, pinned, released):
+        if self.memory_budget <= 0:
+            return
+
+        pinned_hashes = {self._hashes[name] for name in pinned if name in self._hashes}
+        total = sum(loaded.size for loaded in self._loaded.values())
+        for content_hash in list(self._loaded):
+            if total <= self.memory_budget:
+                break
+            if content_hash == keep or content_hash in pinned_hashes:
+                continue
+            # Still the content of its files, so its memoized predictions
+            # stay valid; only the model object is collected.
+            total -= self._loaded.pop(content_hash).size
+            released.dropped += 1
+            self.evictions += 1
+            print(f"Model {content_hash[:12]} unloaded to stay within the memory budget.")
+
+    def model_states(self, names):
+        """
+        Serving state of each name: "warm" (loaded and warmed), "loaded" (not
+        warmed yet), "loading", "failed", "cold" (known but not loaded) or
+        "missing" (no such file).
+        """
+        states = {}
+        with self._lock:
+            for name in names:
+                loaded = self._loaded.get(self._hashes.get(name))
+                if loaded is not None and loaded._backend is not None:
+                    states[name] = "warm"
+                elif name in self._warming:
+                    states[name] = "loading"
+                elif name in self._failures:
+                    states[name] = "failed"
+                elif loaded is not None:
+                    states[name] = "loaded"
+                elif name in self._paths:
+                    states[name] = "cold"
+                else:
+                    states[name] = "missing"
+        return states
+
+    def stats(self):
+        pinned = self.pinned_names()
+        with self._lock:
+            names = defaultdict(list)
+            for name, content_hash in self._hashes.items():
+                names[content_hash].append(name)
+            return {
+                "memory_budget": self.memory_budget,
+                "resident_bytes": sum(loaded.size for loaded in self._loaded.values()),
+                "loads": self.loads,
+                "swaps": self.swaps,
+                "evictions": self.evictions,
+                "known": sorted(self._paths),
+                "warming": sorted(self._warming),
+                "failures": dict(self._failures),
+                "loaded": [
+                    {
+                        "content_hash": content_hash,
+                        "names": sorted(names[content_hash]),
+                        "size": loaded.size,
+                        "backend": loaded._backend.name if loaded._backend is not None else None,
+                        "pinned": any(name in pinned for name in names[content_hash]),
+                        "last_used": loaded.last_used,
+                    }
+                    for content_hash, loaded in self._loaded.items()
+                ],
+            }
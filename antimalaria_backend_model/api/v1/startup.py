@@ -0,0 +1,67 @@
+import os
+import threading
+import time
+from . import utils
+
+# Per-process warm-up progress; reset when a forked worker starts its own.
+_state = {"pid": None, "started_at": None, "finished_at": None}
+_lock = threading.Lock()
+
+
+def start_warm_up():
+    """
+    Load the feature plans and the active models in a background thread, so
+    the server accepts connections (and answers liveness probes) at once and
+    reports ready when the models are warm.
+
+    Called by the WSGI/ASGI entry points only, so management commands never
+    load models. When gunicorn.conf.py preloads the app, the master imports
+    it before forking and the post_fork hook warms the models each worker
+    inherits instead; the config marks that with GUNICORN_PRELOAD_APP, so
+    any other server (runserver, or gunicorn without preloading) warms here.
+    """
+    if os.environ.get("GUNICORN_PRELOAD_APP") == "1":
+        return
+    with _lock:
+        if _state["pid"] == os.getpid():
+            return
+        _state["pid"] = os.getpid()
+    threading.Thread(target=warm_up, name="startup-warm-up", daemon=True).start()
+
+
+def warm_up():
+    with _lock:
+        _state.update(pid=os.getpid(), started_at=time.time(), finished_at=None)
+
+    try:
+        utils.ensure_features()
+        utils.MODELS.discover()
+        utils.MODELS.preload(utils.active_model_names())
+        utils.MODELS.warm_loaded()
+    except Exception as e:
+        print(f"Model warm-up failed: {e}")
+    finally:
+        with _lock:
+            _state["finished_at"] = time.time()
+    print(f"Worker {os.getpid()} warmed up in {_state['finished_at'] - _state['started_at']:.1f}s.")
+
+
+def readiness():
+    """
+    Whether this process can serve predictions: warm-up has finished, the
+    feature plans are loaded and every active model is warm.
+    """
+    with _lock:
+        state = dict(_state) if _state["pid"] == os.getpid() else {"started_at": None, "finished_at": None}
+
+    models = utils.MODELS.model_states(sorted(utils.active_model_names()))
+    features = bool(utils.FEATURIZER_MAP)
+    ready = state["finished_at"] is not None and features and all(s == "warm" for s in models.values())
+    return {
+        "status": "ready" if ready else "warming",
+        "pid": os.getpid(),
+        "started_at": state["started_at"],
+        "finished_at": state["finished_at"],
+        "features": features,
+        "models": models,
+    }
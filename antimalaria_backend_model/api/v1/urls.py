@@ -7,5 +7,15 @@ router.register('models', views.MLModelViewSet, basename='model')
 
 urlpatterns = [
     path("", include(router.urls)),
-    path('predict/', views.PredictIC50View.as_view(), name="predict")
+    path('predict/', views.PredictIC50View.as_view(), name="predict"),
+    path('predict/multi/', views.MultiPredictIC50View.as_view(), name="predict-multi"),
+    path('predict/async/', views.AsyncPredictIC50View.as_view(), name="predict-async"),
+    path('featurize/', views.FeaturizeView.as_view(), name="featurize"),
+    path('featurizers/', views.FeaturizersView.as_view(), name="featurizers"),
+    path('predict/stream/', views.PredictIC50StreamView.as_view(), name="predict-stream"),
+    path('cache/', views.CacheStatsView.as_view(), name="cache-stats"),
+    path('registry/', views.ModelRegistryStatsView.as_view(), name="model-registry"),
+    path('batching/', views.BatchingStatsView.as_view(), name="batching-stats"),
+    path('queue/', views.InferenceQueueView.as_view(), name="inference-queue"),
+    path('cpu/', views.CPUBudgetStatsView.as_view(), name="cpu-budget"),
 ]
\ No newline at end of file
@@ -1,139 +1,829 @@
+import base64
 import numpy as np
-import pickle
+import scipy.sparse
+import os
 import json
-from rdkit import Chem, DataStructs
-from rdkit.Chem.rdFingerprintGenerator import GetMorganGenerator
-from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+import warnings
+from collections import defaultdict
+from functools import lru_cache
+from itertools import islice
 from django.conf import settings
 from pathlib import Path
+from rdkit import Chem
+from .cache import FingerprintCache, PredictionCache
+from .cpu import CPUBudget, available_cpus
+from .batching import PredictionCoalescer, as_request_result
+from .backends import n_features_in
+from .featurizers import MorganFeaturizer, build_featurizer, pack_rows, unpack_rows_sparse
+from .metrics import MetricsRegistry, timed
+from .offload import BoundedExecutor
+from .pool import canonicalize_batch, featurize_batch, use_pool
+from .registry import ModelRegistry
 
 MODEL_DIR = settings.ML_MODEL_DIR
 ECFP_JSON_FILE_PATH = Path(__file__).resolve().parent / "ecfp_features.json"
 PUBCHEMFP_JSON_FILE_PATH = Path(__file__).resolve().parent / "pubchemfp_features.json"
-MODELS = {}
 FEATURES = {}
+FEATURIZER_MAP = {}
+# Descriptor (MLModel.descriptor) -> featurizer kind, its parameters and an
+# optional selected-features file. A new descriptor needs an entry here and,
+# for a new kind of fingerprint, a @register_featurizer class. PUBCHEMFP is
+# the 881-bit Morgan fingerprint the existing models were trained on, not
+# the PubChem substructure keys.
+DESCRIPTORS = {
+    "ECFP": {"kind": "morgan", "params": {"radius": 3, "n_bits": 2048}, "features": ("ecfp", ECFP_JSON_FILE_PATH)},
+    "PUBCHEMFP": {"kind": "morgan", "params": {"radius": 2, "n_bits": 881}, "features": ("pubchemfp", PUBCHEMFP_JSON_FILE_PATH)},
+    "MACCS": {"kind": "maccs", "params": {}},
+}
+_features_lock = threading.Lock()
+FINGERPRINT_CACHE = FingerprintCache(
+    settings.FINGERPRINT_CACHE_PATH,
+    memory_budget=settings.FINGERPRINT_CACHE_MEMORY_BYTES,
+    disk_budget=settings.FINGERPRINT_CACHE_DISK_BYTES,
+)
+PREDICTION_CACHE = PredictionCache(max_entries=settings.PREDICTION_CACHE_SIZE)
 
-def load_all_models():
-    MODEL_DIR.mkdir(parents=True, exist_ok=True) 
+METRICS = MetricsRegistry(settings.METRICS_DIR)
+STAGE_SECONDS = METRICS.histogram(
+    "ic50_stage_duration_seconds",
+    "Time spent in each stage of a prediction request.",
+    ["stage", "model", "descriptor"],
+)
+MOLECULES = METRICS.counter(
+    "ic50_molecules_total",
+    "Molecules submitted for prediction.",
+    ["model", "descriptor"],
+)
+INVALID_SMILES = METRICS.counter(
+    "ic50_invalid_smiles_total",
+    "Submitted SMILES that could not be parsed or featurized.",
+    ["model", "descriptor"],
+)
+INVALID_FINGERPRINTS = METRICS.counter(
+    "ic50_invalid_fingerprints_total",
+    "Submitted packed fingerprints that could not be decoded.",
+    ["model", "descriptor"],
+)
 
-    for model_path in MODEL_DIR.iterdir():
-        if not model_path.is_file():
-            continue 
+def active_model_names():
+    from api.models import MLModel
 
-        try:
-            if model_path.suffix == ".pkl":
-                with model_path.open("rb") as f:
-                    model = pickle.load(f)
-            else:
-                continue
+    try:
+        files = MLModel.objects.filter(is_active=True).values_list("file", flat=True)
+        return {os.path.basename(name) for name in files if name}
+    except Exception as e:
+        print(f"Failed to read active models: {e}")
+        return set()
 
-            model_name = model_path.name
-            MODELS[model_name] = model
+def model_descriptors(model_name):
+    from api.models import MLModel
 
-        except Exception as e:
-            print(f"Failed to load model {model_path.name}: {e}")
+    files = MLModel.objects.exclude(descriptor__isnull=True).values_list("file", "descriptor")
+    return {descriptor for name, descriptor in files if name and os.path.basename(name) == model_name}
+
+def validate_model(model_name, model):
+    """
+    Check that every descriptor a model file is registered with produces the
+    number of features the model was fit on, so a mismatch fails the load
+    instead of every prediction.
+    """
+    expected = n_features_in(model)
+    if expected is None:
+        return
+    try:
+        descriptors = model_descriptors(model_name)
+    except Exception as e:
+        print(f"Failed to read descriptors of {model_name}: {e}")
+        return
+
+    for descriptor in descriptors:
+        featurizer = get_featurizer(descriptor)
+        if featurizer.n_features != expected:
+            raise ValueError(
+                f"Model '{model_name}' expects {expected} features, but descriptor '{descriptor}' "
+                f"produces {featurizer.n_features}."
+            )
+
+# gunicorn.conf.py exports GUNICORN_WORKERS, so the default budget splits the
+# machine between the workers of one server.
+CPU_BUDGET = CPUBudget(
+    settings.CPU_BUDGET or max(1, available_cpus() // int(os.environ.get("GUNICORN_WORKERS", "1"))),
+    min_rows_per_thread=settings.CPU_MIN_ROWS_PER_THREAD,
+    featurize_chunk_size=settings.FEATURIZE_CHUNK_SIZE,
+)
+
+MODELS = ModelRegistry(
+    MODEL_DIR,
+    memory_budget=settings.MODEL_MEMORY_BUDGET_BYTES,
+    pinned_names=active_model_names,
+    refresh_interval=settings.MODEL_REGISTRY_REFRESH_SECONDS,
+    on_release=PREDICTION_CACHE.invalidate,
+    inference_threads=settings.INFERENCE_THREADS,
+    validate=validate_model,
+    on_unpickle=CPU_BUDGET.rescan,
+)
 
 def load_model(model_name):
-    model_path = MODEL_DIR / model_name
+    # Models are keyed by file name, whether given a name or a full path.
+    model_path = MODEL_DIR / Path(model_name).name
     if not model_path.is_file():
         raise FileNotFoundError(f"Model file '{model_name}' not found in '{MODEL_DIR}'.")
 
     try:
-        if model_path.suffix == ".pkl":
-            with model_path.open("rb") as f:
-                model = pickle.load(f)
-        else:
-            raise ValueError("Unsupported model format.")
-        
-        model_name = model_path.name
-        MODELS[model_name] = model
-
-        print(f"Model '{model_name}' loaded successfully.")
+        loaded = MODELS.load(model_path)
+        print(f"Model '{model_path.name}' loaded successfully.")
+        return loaded
 
     except Exception as e:
         print(f"Failed to load model {model_path.name}: {e}")
         return None
 
+def unload_model(model_name):
+    MODELS.unload(Path(model_name).name)
+
 def load_features():
-    try:
-        with open(ECFP_JSON_FILE_PATH, "r") as f:
-            ecfp_features = json.load(f)
-            FEATURES["ecfp"] = ecfp_features
-    except Exception as e:
-        print(f"Failed to load features from {ECFP_JSON_FILE_PATH}: {e}")
+    for spec in DESCRIPTORS.values():
+        if "features" not in spec:
+            continue
+        key, path = spec["features"]
+        try:
+            with open(path, "r") as f:
+                FEATURES[key] = json.load(f)
+        except Exception as e:
+            print(f"Failed to load features from {path}: {e}")
 
-    try:
-        with open(PUBCHEMFP_JSON_FILE_PATH, "r") as f:
-            pubchemfp_features = json.load(f)
-            FEATURES["pubchemfp"] = pubchemfp_features
-    except Exception as e:
-        print(f"Failed to load features from {PUBCHEMFP_JSON_FILE_PATH}: {e}")
+    build_featurizers()
 
-FEATURIZER_MAP = {
-    "ECFP": lambda smiles: smiles_to_ecfp(smiles, tuple(FEATURES.get("ecfp", []))),
-    "PUBCHEMFP": lambda smiles: smiles_to_pubchemfp(smiles, tuple(FEATURES.get("pubchemfp", [])))
-}
+def ensure_features():
+    # Feature plans are loaded on first use (or by the start-up warm-up),
+    # not at import, so management commands skip them.
+    if FEATURIZER_MAP:
+        return
+    with _features_lock:
+        if not FEATURIZER_MAP:
+            load_features()
 
-def smiles_to_ecfp(smiles, selected_features, radius=3, n_bits=2048):
-    mol = Chem.MolFromSmiles(smiles)
-    if mol is None: return None
-    fp_generator = GetMorganGenerator(radius, fpSize=n_bits)
-    fp = fp_generator.GetFingerprint(mol)
-    array = np.zeros((n_bits,), dtype=np.float32)
-    DataStructs.ConvertToNumpyArray(fp, array)
+def build_featurizers():
+    for descriptor, spec in DESCRIPTORS.items():
+        selected = FEATURES.get(spec["features"][0], []) if "features" in spec else None
+        FEATURIZER_MAP[descriptor] = build_featurizer(spec["kind"], selected, **spec["params"])
 
-    indices = np.array(selected_features).flatten().astype(int)
-    new_array = array[indices]
+@lru_cache(maxsize=8)
+def _cached_featurizer(selected_features, radius, n_bits):
+    return MorganFeaturizer(selected_features, radius=radius, n_bits=n_bits)
 
-    return new_array
+def _featurize_one(smiles, selected_features, radius, n_bits):
+    featurizer = _cached_featurizer(tuple(selected_features), radius, n_bits)
+    out, valid = featurizer.featurize([smiles])
+    if not valid[0]: return None
+    return out[0]
+
+def smiles_to_ecfp(smiles, selected_features, radius=3, n_bits=2048):
+    return _featurize_one(smiles, selected_features, radius, n_bits)
 
 def smiles_to_pubchemfp(smiles, selected_features, radius=2, n_bits=881):
-    mol = Chem.MolFromSmiles(smiles)
-    if mol is None: return None
+    return _featurize_one(smiles, selected_features, radius, n_bits)
+
+def featurize_cached(featurizer, smiles_list, mols=None, sparse=False, timings=None, canonical=None):
+    # canonical optionally holds the canonical SMILES of each entry, when the
+    # caller has already computed them. Groups canonicalized on the pool
+    # hold no mols; those are parsed where they are featurized.
+    if mols is not None and any(mol is None for mol in mols):
+        mols = None
+    cache = FINGERPRINT_CACHE
+    if not cache.enabled:
+        return featurize_batch(featurizer, smiles_list, mols=mols, sparse=sparse, timings=timings)
+
+    config = featurizer.config_key
+    n = len(smiles_list)
+    valid = np.zeros(n, dtype=bool)
+
+    # Cheap lookup on the submitted spelling first, then parse the rest and
+    # retry under the canonical SMILES before running the featurizer.
+    cached = cache.get_many(config, smiles_list)
+    packed_rows = {i: cached[s] for i, s in enumerate(smiles_list) if s in cached}
+    pending = [i for i in range(n) if i not in packed_rows]
+    missing = []
+    computed = None
 
-    fp_generator = GetMorganGenerator(radius=radius, fpSize=n_bits)
-    fp = fp_generator.GetFingerprint(mol)
-    array = np.zeros((n_bits,), dtype=np.float32)
-    DataStructs.ConvertToNumpyArray(fp, array)
+    if pending:
+        if canonical is None:
+            if mols is None:
+                mols = [None] * n
+                for i in pending:
+                    mols[i] = Chem.MolFromSmiles(smiles_list[i])
+            canonical = {i: Chem.MolToSmiles(mols[i]) for i in pending if mols[i] is not None}
+        else:
+            # Given canonical SMILES come from parsed, valid molecules.
+            canonical = {i: canonical[i] for i in pending}
+        cached = cache.get_many(config, list(canonical.values()))
+
+        aliases = {}
+        for i, key in canonical.items():
+            if key in cached:
+                packed_rows[i] = cached[key]
+                aliases[smiles_list[i]] = cached[key]
+            else:
+                missing.append(i)
+        cache.put_many(config, aliases)
+        cache.record_misses(len(missing))
+
+        if missing:
+            computed, computed_valid = featurize_batch(
+                featurizer, [smiles_list[i] for i in missing], mols=[mols[i] for i in missing] if mols else None,
+                sparse=sparse,
+                timings=timings,
+            )
+            valid[missing] = computed_valid
+
+            # Rows the featurizer rejected are left out, so a later hit does
+            # not turn an invalid molecule into an all-zero fingerprint.
+            packed = pack_rows(computed)
+            entries = {}
+            for i, bits, ok in zip(missing, packed, computed_valid):
+                if ok:
+                    entries[canonical[i]] = entries[smiles_list[i]] = bits.tobytes()
+            cache.put_many(config, entries)
+
+    rows = np.fromiter(packed_rows.keys(), dtype=np.intp, count=len(packed_rows))
+    packed = np.frombuffer(b"".join(packed_rows.values()), dtype=np.uint8)
+    packed = packed.reshape(len(rows), (featurizer.n_features + 7) // 8)
+    valid[rows] = True
+
+    if sparse:
+        # Stack cache hits, fresh rows and one empty row for invalid SMILES,
+        # then gather them back into input order.
+        parts = [unpack_rows_sparse(packed, featurizer.n_features)]
+        if computed is not None:
+            parts.append(computed)
+        parts.append(scipy.sparse.csr_matrix((1, featurizer.n_features), dtype=np.float32))
+        stacked = scipy.sparse.vstack(parts, format="csr")
+
+        order = np.full(n, stacked.shape[0] - 1, dtype=np.intp)
+        order[rows] = np.arange(len(rows))
+        order[missing] = len(rows) + np.arange(len(missing))
+        return stacked[order], valid
+
+    fp_array = featurizer.allocate(n)
+    if computed is not None:
+        fp_array[missing] = computed
+    if len(rows):
+        fp_array[rows] = np.unpackbits(packed, axis=1, count=featurizer.n_features)
+    return fp_array, valid
+
+def parse_smiles(smiles):
+    if not isinstance(smiles, str) or not smiles.strip():
+        return None
+    return Chem.MolFromSmiles(smiles)
+
+def describe_invalid_smiles(smiles):
+    if not isinstance(smiles, str) or not smiles.strip():
+        return "SMILES must be a non-empty string."
+
+    # Only called for inputs that already failed, so re-parsing is cheap.
+    mol = Chem.MolFromSmiles(smiles, sanitize=False)
+    if mol is None:
+        return "Unparsable SMILES syntax."
+    try:
+        Chem.SanitizeMol(mol)
+    except Exception as e:
+        return f"Invalid structure: {e}"
+    return "Invalid SMILES."
 
-    indices = np.array(selected_features).flatten().astype(int)
-    new_array = array[indices]
+def canonical_groups(smiles_list, positions=None):
+    """
+    Parse each distinct spelling in smiles_list once and group positions by
+    canonical SMILES, so differently written copies of one structure (OCC,
+    CCO, C(O)C) are featurized and predicted once.
 
-    return new_array
+    Returns ({canonical: (mol, [positions])}, [invalid positions]), both in
+    input order; positions defaults to every index.
 
-def predict_batch_ic50(smiles_list, model_name, model_descriptor):
-    model = MODELS.get(model_name)
-    if model is None:
-        raise ValueError(f"Model '{model_name}' not found or failed to load.")
+    Batches large enough for the featurization pool are parsed there, in
+    parallel, and their groups hold no mol; the pool workers parse them
+    again when featurizing, so the request process parses none of them.
+    """
+    if positions is None:
+        positions = range(len(smiles_list))
 
+    distinct = list(dict.fromkeys(smiles if isinstance(smiles, str) else None for smiles in (smiles_list[i] for i in positions)))
+    if use_pool(len(distinct)):
+        keys = canonicalize_batch(distinct)
+        spellings = {spelling: (key, None) if key is not None else None for spelling, key in zip(distinct, keys)}
+    else:
+        spellings = {}
+
+    groups = {}
+    invalid = []
+    for i in positions:
+        smiles = smiles_list[i]
+        spelling = smiles if isinstance(smiles, str) else None
+        if spelling not in spellings:
+            mol = parse_smiles(spelling) if spelling is not None else None
+            spellings[spelling] = (Chem.MolToSmiles(mol), mol) if mol is not None else None
+
+        parsed = spellings[spelling]
+        if parsed is None:
+            invalid.append(i)
+            continue
+        key, mol = parsed
+        group = groups.get(key)
+        if group is None:
+            groups[key] = (mol, [i])
+        else:
+            group[1].append(i)
+    return groups, invalid
+
+def get_featurizer(model_descriptor):
+    ensure_features()
     featurizer = FEATURIZER_MAP.get(model_descriptor)
     if featurizer is None:
         raise ValueError("Unsupported model descriptor.")
-    
-    with ThreadPoolExecutor() as executor:
-        results = list(executor.map(featurizer, smiles_list))
+    return featurizer
 
-    fingerprints, valid_smiles, errors = [], [], {}
-    for i, fp in enumerate(results):
-        smiles = smiles_list[i]
-        if fp is not None:
-            fingerprints.append(fp)
-            valid_smiles.append(smiles)
+def get_model_and_featurizer(model_name, model_descriptor):
+    loaded = MODELS.entry(model_name)
+    if loaded is None:
+        reason = MODELS.failure(model_name)
+        raise ValueError(f"Model '{model_name}' failed to load: {reason}" if reason else f"Model '{model_name}' not found or failed to load.")
+
+    return loaded, get_featurizer(model_descriptor)
+
+def predict_batch_ic50(smiles_list, model_name, model_descriptor, partial=False):
+    """
+    Predict pIC50 for every SMILES in smiles_list.
+
+    By default any invalid SMILES fails the whole batch with {"error": ...}.
+    With partial=True, valid molecules are still predicted and the result is
+    {"predictions": [...], "errors": [...]}, where invalid positions hold None
+    and each error names its index, SMILES and reason.
+
+    Stage timings and molecule counts are recorded in METRICS, labeled by
+    model and descriptor. Featurization and inference threads come from a
+    CPU_BUDGET reservation.
+    """
+    labels = {"model": model_name, "descriptor": model_descriptor}
+    timings = {}
+    try:
+        with CPU_BUDGET.reserve(len(smiles_list)):
+            result = _predict_batch_ic50(smiles_list, model_name, model_descriptor, partial, timings)
+    finally:
+        for stage, seconds in timings.items():
+            STAGE_SECONDS.observe(seconds, stage=stage, **labels)
+
+    if smiles_list:
+        MOLECULES.inc(len(smiles_list), **labels)
+        if isinstance(result, dict) and "errors" in result:
+            INVALID_SMILES.inc(len(result["errors"]), **labels)
+        elif isinstance(result, dict) and result.get("error", "").startswith("Invalid SMILES"):
+            INVALID_SMILES.inc(**labels)
+    return result
+
+def _predict_batch_ic50(smiles_list, model_name, model_descriptor, partial, timings):
+    loaded, featurizer = get_model_and_featurizer(model_name, model_descriptor)
+    backend = loaded.backend
+    sparse = settings.SPARSE_FINGERPRINTS and backend.accepts_sparse
+
+    if not smiles_list:
+        return {}
+
+    model_hash = loaded.content_hash
+    use_cache = PREDICTION_CACHE.enabled
+    predictions = np.full(len(smiles_list), np.nan, dtype=np.float64)
+    invalid = []
+
+    # Repeat screens usually resubmit the same spellings, so try those before
+    # paying for SMILES parsing.
+    hashable = [s if isinstance(s, str) else None for s in smiles_list]
+    cached = PREDICTION_CACHE.get_many(model_hash, hashable) if use_cache else {}
+    pending = []
+    for i, smiles in enumerate(hashable):
+        if smiles in cached:
+            predictions[i] = cached[smiles]
         else:
-            return {"error": "Invalid SMILES input of " + smiles}
+            pending.append(i)
 
-    if not fingerprints:
-        return errors 
+    if pending:
+        start = time.perf_counter()
+        groups, invalid = canonical_groups(smiles_list, pending)
+        timings["smiles_parsing"] = time.perf_counter() - start
+        if invalid and not partial:
+            return {"error": f"Invalid SMILES input of {smiles_list[invalid[0]]}"}
+
+        canonical = list(groups)
+        cached = PREDICTION_CACHE.get_many(model_hash, canonical) if use_cache else {}
+
+        missing = []
+        aliases = {}
+        for key in canonical:
+            if key in cached:
+                for i in groups[key][1]:
+                    predictions[i] = aliases[smiles_list[i]] = cached[key]
+            else:
+                missing.append(key)
+
+        if missing:
+            # One row per structure; its first spelling stands for the group.
+            fp_array, valid = featurize_cached(
+                featurizer,
+                [smiles_list[groups[key][1][0]] for key in missing],
+                mols=[groups[key][0] for key in missing],
+                sparse=sparse,
+                timings=timings,
+                canonical=missing,
+            )
+            if not valid.all():
+                failed = sorted(i for key, ok in zip(missing, valid) if not ok for i in groups[key][1])
+                if not partial:
+                    return {"error": f"Invalid SMILES input of {smiles_list[failed[0]]}"}
+                invalid.extend(failed)
+                missing = [key for key, ok in zip(missing, valid) if ok]
+                fp_array = fp_array[valid]
+
+        if missing:
+            try:
+                start = time.perf_counter()
+                computed = backend.predict(fp_array)
+                timings["inference"] = time.perf_counter() - start
+            except Exception as e:
+                return {"error": str(e)}
 
-    fp_array = np.vstack(fingerprints)
+            for key, value in zip(missing, computed):
+                aliases[key] = float(value)
+                for i in groups[key][1]:
+                    predictions[i] = aliases[smiles_list[i]] = float(value)
 
+        if use_cache:
+            PREDICTION_CACHE.record_misses(len(missing))
+            PREDICTION_CACHE.put_many(model_hash, aliases)
+
+    if not partial:
+        return predictions.tolist()
+
+    invalid.sort()
+    results = predictions.tolist()
+    for i in invalid:
+        results[i] = None
+    return {
+        "predictions": results,
+        "errors": [
+            {"index": i, "smiles": smiles_list[i], "error": describe_invalid_smiles(smiles_list[i])}
+            for i in invalid
+        ],
+    }
+
+def predict_multi_ic50(smiles_list, models, partial=False, consensus=None):
+    """
+    Predict smiles_list with several models in one pass.
+
+    models is a list of (model_name, model_method, model_descriptor). SMILES
+    are parsed and deduplicated once, each distinct descriptor is featurized
+    once, and every model runs on its descriptor's shared matrix. Returns
+    {"models": [{"model_method", "model_descriptor", "predictions"}, ...],
+    "errors": [...]}; a model that fails reports "error" instead of
+    "predictions". With consensus ("mean" or "median") a "consensus" entry
+    holds the aggregate over models and their standard deviation per
+    molecule. Invalid SMILES are handled as in predict_batch_ic50.
+    """
+    if not smiles_list or not models:
+        return {}
+
+    # Parsing is shared by every model; the other stages by the models of
+    # one descriptor. Each model observes the stages it depended on, labeled
+    # like a single-model request.
+    timings = {}
+    labels = []
     try:
-        predictions = model.predict(fp_array)
-    except Exception as e:
-        return {"error": str(e)}
+        with CPU_BUDGET.reserve(len(smiles_list)):
+            return _predict_multi_ic50(smiles_list, models, partial, consensus, timings, labels)
+    finally:
+        for model_name, model_descriptor, stages in labels:
+            for stage, seconds in {**timings, **stages}.items():
+                STAGE_SECONDS.observe(seconds, stage=stage, model=model_name, descriptor=model_descriptor)
+
+def _predict_multi_ic50(smiles_list, models, partial, consensus, timings, labels):
+    start = time.perf_counter()
+    groups, invalid = canonical_groups(smiles_list)
+    timings["smiles_parsing"] = time.perf_counter() - start
+    if invalid and not partial:
+        return {"error": f"Invalid SMILES input of {smiles_list[invalid[0]]}"}
+
+    keys = list(groups)
+    invalid = set(invalid)
+    by_descriptor = defaultdict(list)
+    for position, (model_name, model_method, model_descriptor) in enumerate(models):
+        by_descriptor[model_descriptor].append((position, model_name))
+
+    values = {}
+    failures = {}
+    for model_descriptor, entries in by_descriptor.items():
+        featurizer = get_featurizer(model_descriptor)
+        stages = {}
+
+        # Only structures some model has not cached yet are featurized.
+        pending = {}
+        for position, model_name in entries:
+            loaded = MODELS.entry(model_name)
+            if loaded is None:
+                failures[position] = MODELS.failure(model_name) or f"Model '{model_name}' not found or failed to load."
+                continue
+            cached = PREDICTION_CACHE.get_many(loaded.content_hash, keys) if PREDICTION_CACHE.enabled else {}
+            values[position] = cached
+            pending[position] = (loaded, [key for key in keys if key not in cached])
+            labels.append((model_name, model_descriptor, stages))
+
+        needed = list(dict.fromkeys(key for _, missing in pending.values() for key in missing))
+        rows = {}
+        dense = None
+        if needed:
+            sparse = settings.SPARSE_FINGERPRINTS and any(loaded.backend.accepts_sparse for loaded, _ in pending.values())
+            fp_array, valid = featurize_cached(
+                featurizer,
+                [smiles_list[groups[key][1][0]] for key in needed],
+                mols=[groups[key][0] for key in needed],
+                sparse=sparse,
+                timings=stages,
+                canonical=needed,
+            )
+            failed = sorted(i for key, ok in zip(needed, valid) if not ok for i in groups[key][1])
+            if failed and not partial:
+                return {"error": f"Invalid SMILES input of {smiles_list[failed[0]]}"}
+            invalid.update(failed)
+            rows = {key: row for row, (key, ok) in enumerate(zip(needed, valid)) if ok}
+
+        for position, (loaded, missing) in pending.items():
+            missing = [key for key in missing if key in rows]
+            if not missing:
+                continue
+            X = fp_array[[rows[key] for key in missing]]
+            if scipy.sparse.issparse(X) and not loaded.backend.accepts_sparse:
+                if dense is None:
+                    dense = fp_array.toarray()
+                X = dense[[rows[key] for key in missing]]
+            try:
+                with timed(STAGE_SECONDS, stage="inference", model=models[position][0], descriptor=model_descriptor):
+                    computed = loaded.backend.predict(X)
+            except Exception as e:
+                failures[position] = str(e)
+                continue
+
+            aliases = {}
+            for key, value in zip(missing, computed):
+                values[position][key] = aliases[key] = float(value)
+                for i in groups[key][1]:
+                    aliases[smiles_list[i]] = float(value)
+            if PREDICTION_CACHE.enabled:
+                PREDICTION_CACHE.record_misses(len(missing))
+                PREDICTION_CACHE.put_many(loaded.content_hash, aliases)
+
+    table = np.full((len(models), len(smiles_list)), np.nan, dtype=np.float64)
+    results = []
+    for position, (model_name, model_method, model_descriptor) in enumerate(models):
+        entry = {"model_method": model_method, "model_descriptor": model_descriptor}
+        if position in failures:
+            entry["error"] = failures[position]
+        else:
+            for key, value in values[position].items():
+                table[position, groups[key][1]] = value
+            entry["predictions"] = _nan_to_none(table[position])
+            MOLECULES.inc(len(smiles_list), model=model_name, descriptor=model_descriptor)
+            INVALID_SMILES.inc(len(invalid), model=model_name, descriptor=model_descriptor)
+        results.append(entry)
+
+    result = {
+        "models": results,
+        "errors": [
+            {"index": i, "smiles": smiles_list[i], "error": describe_invalid_smiles(smiles_list[i])}
+            for i in sorted(invalid)
+        ],
+    }
+    if consensus:
+        succeeded = table[[position for position in range(len(models)) if position not in failures]]
+        with warnings.catch_warnings():
+            # All-NaN columns (invalid SMILES) are expected and become None.
+            warnings.simplefilter("ignore", RuntimeWarning)
+            aggregate = np.nanmedian(succeeded, axis=0) if consensus == "median" else np.nanmean(succeeded, axis=0)
+            spread = np.nanstd(succeeded, axis=0)
+        result["consensus"] = {
+            "method": consensus,
+            "models": len(succeeded),
+            "predictions": _nan_to_none(aggregate),
+            "std": _nan_to_none(spread),
+        }
+    return result
+
+def _nan_to_none(values):
+    values = values.tolist()
+    return [None if value != value else value for value in values]
+
+def featurize_packed(smiles_list, model_descriptor):
+    """
+    Packed fingerprints for smiles_list as accepted back by
+    predict_packed_ic50: one base64 string of np.packbits over the selected
+    features per molecule, None for invalid SMILES.
+    """
+    featurizer = get_featurizer(model_descriptor)
+    groups, _ = canonical_groups(smiles_list)
+    fingerprints = [None] * len(smiles_list)
+    if groups:
+        keys = list(groups)
+        with CPU_BUDGET.reserve(len(keys)):
+            fp_array, valid = featurize_cached(
+                featurizer,
+                [smiles_list[groups[key][1][0]] for key in keys],
+                mols=[groups[key][0] for key in keys],
+                sparse=True,
+                canonical=keys,
+            )
+        for key, ok, row in zip(keys, valid, pack_rows(fp_array)):
+            if ok:
+                encoded = base64.b64encode(row.tobytes()).decode("ascii")
+                for i in groups[key][1]:
+                    fingerprints[i] = encoded
+
+    return {
+        "model_descriptor": model_descriptor,
+        "config_key": featurizer.config_key,
+        "n_features": featurizer.n_features,
+        "fingerprints": fingerprints,
+        "errors": [
+            {"index": i, "smiles": smiles_list[i], "error": describe_invalid_smiles(smiles_list[i])}
+            for i, fingerprint in enumerate(fingerprints) if fingerprint is None
+        ],
+    }
+
+def decode_fingerprints(fingerprints, featurizer):
+    # Returns the (n, row_bytes) packed matrix and a reason per unusable row.
+    row_bytes = (featurizer.n_features + 7) // 8
+    packed = np.zeros((len(fingerprints), row_bytes), dtype=np.uint8)
+    reasons = {}
+    for i, value in enumerate(fingerprints):
+        try:
+            row = base64.b64decode(value, validate=True)
+        except (TypeError, ValueError):
+            reasons[i] = "Fingerprint is not valid base64."
+            continue
+        if len(row) != row_bytes:
+            reasons[i] = f"Fingerprint must be {row_bytes} bytes, got {len(row)}."
+            continue
+        packed[i] = np.frombuffer(row, dtype=np.uint8)
+    return packed, reasons
+
+def predict_packed_ic50(fingerprints, model_name, model_descriptor, config_key, partial=False):
+    """
+    Predict pIC50 from packed fingerprints (as returned by featurize_packed)
+    without parsing SMILES or generating fingerprints.
+
+    config_key must equal the descriptor's featurizer config, so rows built
+    for a different radius, size or feature selection are rejected rather
+    than silently mispredicted. Results follow predict_batch_ic50, with
+    errors naming the index and reason of each unusable row. Stage timings
+    and molecule counts are recorded in METRICS as for predict_batch_ic50.
+    """
+    labels = {"model": model_name, "descriptor": model_descriptor}
+    timings = {}
+    try:
+        result = _predict_packed_ic50(fingerprints, model_name, model_descriptor, config_key, partial, timings)
+    finally:
+        for stage, seconds in timings.items():
+            STAGE_SECONDS.observe(seconds, stage=stage, **labels)
+
+    if fingerprints:
+        MOLECULES.inc(len(fingerprints), **labels)
+        if isinstance(result, dict) and "errors" in result:
+            INVALID_FINGERPRINTS.inc(len(result["errors"]), **labels)
+        elif isinstance(result, dict) and result.get("error", "").startswith("Invalid fingerprint"):
+            INVALID_FINGERPRINTS.inc(**labels)
+    return result
+
+def _predict_packed_ic50(fingerprints, model_name, model_descriptor, config_key, partial, timings):
+    loaded, featurizer = get_model_and_featurizer(model_name, model_descriptor)
+    if config_key != featurizer.config_key:
+        raise ValueError(
+            f"Fingerprint config '{config_key}' does not match the model's feature plan '{featurizer.config_key}'."
+        )
+    if not fingerprints:
+        return {}
+
+    start = time.perf_counter()
+    packed, reasons = decode_fingerprints(fingerprints, featurizer)
+    timings["fingerprint_decoding"] = time.perf_counter() - start
+    if reasons and not partial:
+        first = min(reasons)
+        return {"error": f"Invalid fingerprint at index {first}: {reasons[first]}"}
+
+    valid = np.ones(len(fingerprints), dtype=bool)
+    valid[list(reasons)] = False
+    predictions = np.full(len(fingerprints), np.nan, dtype=np.float64)
+
+    if valid.any():
+        backend = loaded.backend
+        rows = packed[valid]
+        if settings.SPARSE_FINGERPRINTS and backend.accepts_sparse:
+            fp_array = unpack_rows_sparse(rows, featurizer.n_features)
+        else:
+            fp_array = np.unpackbits(rows, axis=1, count=featurizer.n_features).astype(np.float32)
+        timings["fingerprint_decoding"] = time.perf_counter() - start
+        try:
+            with CPU_BUDGET.reserve(len(rows)):
+                start = time.perf_counter()
+                predictions[valid] = backend.predict(fp_array)
+                timings["inference"] = time.perf_counter() - start
+        except Exception as e:
+            return {"error": str(e)}
+
+    if not partial:
+        return predictions.tolist()
+
+    results = predictions.tolist()
+    for i in reasons:
+        results[i] = None
+    return {
+        "predictions": results,
+        "errors": [{"index": i, "error": reasons[i]} for i in sorted(reasons)],
+    }
+
+COALESCER = PredictionCoalescer(
+    predict_batch_ic50,
+    max_wait=settings.PREDICT_BATCH_MAX_WAIT_MS / 1000,
+    max_batch=settings.PREDICT_BATCH_MAX_SIZE,
+)
+
+INFERENCE_EXECUTOR = BoundedExecutor(
+    max_workers=settings.ASYNC_PREDICT_WORKERS,
+    max_queue=settings.ASYNC_PREDICT_MAX_QUEUE,
+)
+
+async def apredict_batch_ic50(smiles_list, model_name, model_descriptor, partial=False, chunk_size=None):
+    """
+    Async predict_batch_ic50 for ASGI views.
+
+    The batch is predicted chunk by chunk on INFERENCE_EXECUTOR with one chunk
+    in flight per request, so a large request takes turns with small ones
+    instead of holding the pool, and cancelling the awaiting task (client
+    disconnect) stops it after the current chunk. Raises QueueFull when the
+    executor is saturated.
+    """
+    await INFERENCE_EXECUTOR.run(get_model_and_featurizer, model_name, model_descriptor)
+    if not smiles_list:
+        return {}
+
+    chunk_size = chunk_size or settings.ASYNC_PREDICT_CHUNK_SIZE
+    predictions = []
+    errors = []
+    for offset in range(0, len(smiles_list), chunk_size):
+        result = await INFERENCE_EXECUTOR.run(
+            predict_batch_ic50, smiles_list[offset:offset + chunk_size], model_name, model_descriptor, partial=True
+        )
+        if "error" in result:
+            return result
+        predictions.extend(result["predictions"])
+        errors.extend({**error, "index": error["index"] + offset} for error in result["errors"])
+
+    return as_request_result({"predictions": predictions, "errors": errors}, smiles_list, partial)
+
+def iter_chunks(iterable, chunk_size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+def predict_ic50_stream(smiles_iter, model_name, model_descriptor, chunk_size=None):
+    """
+    Predict an iterable of SMILES chunk by chunk, yielding one record per input.
+
+    Only one chunk of SMILES, fingerprints and predictions is alive at a time.
+    Each record is {"index", "smiles", "prediction"} plus "error" for invalid
+    input; a final {"done": true, "count": n} record marks a complete stream.
+    The model and descriptor are checked eagerly so callers can still reject
+    the request before streaming starts.
+    """
+    get_model_and_featurizer(model_name, model_descriptor)
+    chunk_size = chunk_size or settings.PREDICT_STREAM_CHUNK_SIZE
+
+    def records():
+        offset = 0
+        for chunk in iter_chunks(smiles_iter, chunk_size):
+            try:
+                result = predict_batch_ic50(chunk, model_name, model_descriptor, partial=True)
+            except ValueError as e:
+                result = {"error": str(e)}
+            if "error" in result:
+                yield {"index": offset, "error": result["error"], "done": False}
+                return
+
+            errors = {error["index"]: error["error"] for error in result["errors"]}
+            for j, (smiles, prediction) in enumerate(zip(chunk, result["predictions"])):
+                record = {"index": offset + j, "smiles": smiles, "prediction": prediction}
+                if j in errors:
+                    record["error"] = errors[j]
+                yield record
+            offset += len(chunk)
 
-    results_map = {smiles: float(pred) for smiles, pred in zip(valid_smiles, predictions)}
-    results_map.update(errors)
-    final_results = [results_map.get(s, None) for s in smiles_list] 
+        yield {"done": True, "count": offset}
 
-    return final_results
\ No newline at end of file
+    return records()
\ No newline at end of file
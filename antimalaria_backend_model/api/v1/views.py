@@ -1,14 +1,28 @@
 from rest_framework import status
 from rest_framework.views import APIView
+import json
 import os
+import time
+from itertools import chain
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
 from django.shortcuts import get_object_or_404
 from rest_framework.response import Response
 from api.models import MLModel
-from .utils import predict_batch_ic50, load_model
+from .utils import predict_ic50_stream, apredict_batch_ic50, predict_packed_ic50, predict_multi_ic50, featurize_packed, ensure_features, FEATURIZER_MAP, load_model, unload_model, MODELS, FINGERPRINT_CACHE, PREDICTION_CACHE, COALESCER, INFERENCE_EXECUTOR, CPU_BUDGET, METRICS, STAGE_SECONDS
+from .metrics import timed
+from .offload import QueueFull
+from .wire import BatchParser, ResultRenderer, ResultNegotiation, BATCH_MEDIA_TYPE, RESULT_MEDIA_TYPE, decode_batch, encode_result
+from .prefork import memory_report
+from .startup import readiness
 
 from rest_framework import viewsets, status
 from rest_framework.response import Response
-from rest_framework.parsers import MultiPartParser, FormParser
+from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
+from rest_framework.settings import api_settings
 
 from api.models import MLModel
 from .serializers import MLModelSerializer
@@ -26,7 +40,17 @@ class MLModelViewSet(viewsets.ModelViewSet):
 
             model_path = serializer.instance.file.path
 
-            load_model(model_path)
+            if load_model(model_path) is None:
+                # Unreadable files and feature-count mismatches are refused.
+                error = MODELS.failure(os.path.basename(model_path)) or "Model failed to load."
+                serializer.instance.delete()
+                unload_model(model_path)
+                if os.path.exists(model_path):
+                    os.remove(model_path)
+                return Response(
+                    {"status": "error", "errors": {"file": [error]}},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
 
             return Response({
                 "status": "success",
@@ -38,10 +62,23 @@ class MLModelViewSet(viewsets.ModelViewSet):
             status=status.HTTP_400_BAD_REQUEST
         )
 
+    def perform_update(self, serializer):
+        old_path = serializer.instance.file.path if serializer.instance.file else None
+        serializer.save()
+
+        new_path = serializer.instance.file.path if serializer.instance.file else None
+        if new_path != old_path:
+            # Warm the new file before dropping the old one.
+            if new_path:
+                load_model(new_path)
+            if old_path:
+                unload_model(old_path)
+
     def destroy(self, request, *args, **kwargs):
         instance = self.get_object()
         file_path = instance.file.path  # get file path before deleting DB row
         self.perform_destroy(instance)
+        unload_model(file_path)
 
         import os
         if os.path.exists(file_path):
@@ -53,30 +90,330 @@ class MLModelViewSet(viewsets.ModelViewSet):
         )
 
 class PredictIC50View(APIView):
+    # JSON stays the default; the binary format is used when negotiated.
+    parser_classes = [JSONParser, FormParser, MultiPartParser, BatchParser]
+    renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, ResultRenderer]
+    content_negotiation_class = ResultNegotiation
+
     def post(self, request, *args, **kwargs):
-        smiles_list = request.data.get("smiles", None)
-        model_descriptor = request.data.get("model_descriptor", None)
-        model_method = request.data.get("model_method", None)
+        # DRF parses the body on first access to request.data.
+        start = time.perf_counter()
+        data = request.data
+        parse_seconds = time.perf_counter() - start
+
+        smiles_list = data.get("smiles", None)
+        # Pre-featurized input: base64 packed rows from /featurize/ plus the
+        # config_key they were built with.
+        fingerprints = data.get("fingerprints", None)
+        config_key = data.get("config_key", None)
+        model_descriptor = data.get("model_descriptor", None)
+        model_method = data.get("model_method", None)
+        partial = data.get("partial", False) in (True, "true", "True", "1", 1)
 
         errors = {}
         if not model_method:
             errors["model_method"] = ["This field is required."]
         if not model_descriptor:
             errors["model_descriptor"] = ["This field is required."]
-        if not smiles_list:
+        if fingerprints is not None:
+            if not isinstance(fingerprints, list) or not fingerprints:
+                errors["fingerprints"] = ["A non-empty list of base64 fingerprints is required."]
+            if not config_key:
+                errors["config_key"] = ["This field is required with fingerprints."]
+        elif not smiles_list:
             errors["input"] = ["This field is required."]
         if errors:
             return Response(errors, status=status.HTTP_400_BAD_REQUEST)
 
         ml_model = get_object_or_404(MLModel, descriptor=model_descriptor, method=model_method, is_active=True)
+        self.metric_labels = {"model": os.path.basename(ml_model.file.name), "descriptor": model_descriptor}
+        STAGE_SECONDS.observe(parse_seconds, stage="request_parsing", **self.metric_labels)
+
+        try:
+            if fingerprints is not None:
+                predictions = predict_packed_ic50(
+                    fingerprints,
+                    model_name=os.path.basename(ml_model.file.name),
+                    model_descriptor=model_descriptor,
+                    config_key=config_key,
+                    partial=partial,
+                )
+            else:
+                predictions = COALESCER.predict(
+                    smiles_list=smiles_list,
+                    model_name=os.path.basename(ml_model.file.name),
+                    model_descriptor=model_descriptor,
+                    partial=partial,
+                )
+            return Response(predictions, status=status.HTTP_200_OK)
+
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        # Render here rather than after the view returns, so it can be timed.
+        labels = getattr(self, "metric_labels", None)
+        if labels is not None and isinstance(response, Response):
+            with timed(STAGE_SECONDS, stage="response_rendering", **labels):
+                response.render()
+        return response
+
+class MultiPredictIC50View(APIView):
+    """
+    Predict one SMILES list with several models, sharing parsing and
+    featurization between them.
+
+    "models" is "all" (every active model) or a list of
+    {"model_method", "model_descriptor"} pairs; "consensus" may be "mean" or
+    "median". Each model's entry carries its MLModel id, so callers can store
+    one job per model.
+    """
+
+    def post(self, request, *args, **kwargs):
+        smiles_list = request.data.get("smiles", None)
+        models = request.data.get("models", "all")
+        consensus = request.data.get("consensus", None)
+        partial = request.data.get("partial", False) in (True, "true", "True", "1", 1)
+
+        errors = {}
+        if not smiles_list or not isinstance(smiles_list, list):
+            errors["input"] = ["This field is required."]
+        if models != "all" and (
+            not isinstance(models, list) or not models
+            or not all(isinstance(m, dict) and m.get("model_method") and m.get("model_descriptor") for m in models)
+        ):
+            errors["models"] = ['Must be "all" or a non-empty list of {model_method, model_descriptor}.']
+        if consensus not in (None, "mean", "median"):
+            errors["consensus"] = ['Must be "mean" or "median".']
+        if errors:
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+
+        active = MLModel.objects.filter(is_active=True).order_by("method", "descriptor")
+        if models == "all":
+            ml_models = list(active)
+        else:
+            by_pair = {(m.method, m.descriptor): m for m in active}
+            pairs = list(dict.fromkeys((m["model_method"], m["model_descriptor"]) for m in models))
+            unknown = [f"{method}/{descriptor}" for method, descriptor in pairs if (method, descriptor) not in by_pair]
+            if unknown:
+                return Response({"detail": f"No active model for {', '.join(unknown)}."}, status=status.HTTP_404_NOT_FOUND)
+            ml_models = [by_pair[pair] for pair in pairs]
+        if not ml_models:
+            return Response({"detail": "No active models."}, status=status.HTTP_404_NOT_FOUND)
+
+        try:
+            result = predict_multi_ic50(
+                smiles_list,
+                [(os.path.basename(m.file.name), m.method, m.descriptor) for m in ml_models],
+                partial=partial,
+                consensus=consensus,
+            )
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        for entry, ml_model in zip(result.get("models", []), ml_models):
+            entry["model_id"] = str(ml_model.id)
+        return Response(result, status=status.HTTP_200_OK)
+
+@method_decorator(csrf_exempt, name="dispatch")
+class AsyncPredictIC50View(View):
+    """
+    Async variant of PredictIC50View for ASGI deployments.
+
+    Featurization and inference run on INFERENCE_EXECUTOR, so the event loop
+    keeps serving other requests while a large batch is predicted, and a
+    client disconnect cancels the remaining work. Answers 503 when the
+    executor queue is full, and 501 under a WSGI server, where Django would
+    run it to completion on the request thread with none of that (see
+    ASGI_WORKERS in gunicorn.conf.py).
+    """
+
+    async def post(self, request, *args, **kwargs):
+        if not isinstance(request, ASGIRequest):
+            return JsonResponse(
+                {"error": "/predict/async/ needs an ASGI server; use /predict/ with this deployment."},
+                status=status.HTTP_501_NOT_IMPLEMENTED,
+            )
 
         try:
-            predictions = predict_batch_ic50(
+            if request.content_type == BATCH_MEDIA_TYPE:
+                data = decode_batch(request.body)
+            else:
+                data = json.loads(request.body or b"{}")
+        except ValueError:
+            return JsonResponse({"error": "Invalid request body."}, status=status.HTTP_400_BAD_REQUEST)
+
+        smiles_list = data.get("smiles", None)
+        model_descriptor = data.get("model_descriptor", None)
+        model_method = data.get("model_method", None)
+        partial = data.get("partial", False) in (True, "true", "True", "1", 1)
+
+        errors = {}
+        if not model_method:
+            errors["model_method"] = ["This field is required."]
+        if not model_descriptor:
+            errors["model_descriptor"] = ["This field is required."]
+        if not smiles_list:
+            errors["input"] = ["This field is required."]
+        if errors:
+            return JsonResponse(errors, status=status.HTTP_400_BAD_REQUEST)
+
+        ml_model = await MLModel.objects.filter(
+            descriptor=model_descriptor, method=model_method, is_active=True
+        ).afirst()
+        if ml_model is None:
+            return JsonResponse({"detail": "No MLModel matches the given query."}, status=status.HTTP_404_NOT_FOUND)
+
+        try:
+            predictions = await apredict_batch_ic50(
                 smiles_list=smiles_list,
                 model_name=os.path.basename(ml_model.file.name),
                 model_descriptor=model_descriptor,
+                partial=partial,
             )
-            return Response(predictions, status=status.HTTP_200_OK)
+            if RESULT_MEDIA_TYPE in request.headers.get("Accept", ""):
+                return HttpResponse(encode_result(predictions), content_type=RESULT_MEDIA_TYPE)
+            return JsonResponse(predictions, status=status.HTTP_200_OK, safe=False)
+
+        except ValueError as e:
+            return JsonResponse({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except QueueFull as e:
+            return JsonResponse({"error": str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+class FeaturizersView(APIView):
+    def get(self, request, *args, **kwargs):
+        ensure_features()
+        return Response(
+            {descriptor: featurizer.describe() for descriptor, featurizer in FEATURIZER_MAP.items()},
+            status=status.HTTP_200_OK,
+        )
+
+class InferenceQueueView(View):
+    async def get(self, request, *args, **kwargs):
+        return JsonResponse(INFERENCE_EXECUTOR.stats(), status=status.HTTP_200_OK)
+
+class FeaturizeView(APIView):
+    """
+    Packed fingerprints for a SMILES list, to be stored and later sent back
+    to /predict/ as pre-featurized input.
+    """
+
+    def post(self, request, *args, **kwargs):
+        smiles_list = request.data.get("smiles", None)
+        model_descriptor = request.data.get("model_descriptor", None)
+
+        errors = {}
+        if not model_descriptor:
+            errors["model_descriptor"] = ["This field is required."]
+        if not smiles_list or not isinstance(smiles_list, list):
+            errors["input"] = ["This field is required."]
+        if errors:
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            return Response(featurize_packed(smiles_list, model_descriptor), status=status.HTTP_200_OK)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+def iter_smiles_lines(stream, ndjson=False):
+    for raw_line in stream or []:
+        line = raw_line.decode("utf-8-sig").strip() if isinstance(raw_line, bytes) else raw_line.strip()
+        if not line:
+            continue
+        if ndjson:
+            try:
+                item = json.loads(line)
+            except ValueError:
+                # Passed through so it is reported as an invalid record.
+                yield line
+                continue
+            yield item.get("smiles") if isinstance(item, dict) else item
+        else:
+            yield line.split(",")[0].strip()
+
+class PredictIC50StreamView(APIView):
+    """
+    Streaming variant of PredictIC50View that answers with NDJSON records.
+
+    A JSON body is accepted like PredictIC50View. With an application/x-ndjson
+    or text/plain body (one SMILES per line), the model is selected through
+    query parameters and the input is read line by line, so memory stays
+    bounded by PREDICT_STREAM_CHUNK_SIZE rather than the request size.
+    """
+
+    def post(self, request, *args, **kwargs):
+        content_type = request.content_type.split(";")[0].strip()
+        if content_type == "application/json":
+            params = request.data
+            smiles_iter = iter(params.get("smiles") or [])
+        else:
+            params = request.query_params
+            smiles_iter = iter_smiles_lines(request.stream, ndjson=content_type == "application/x-ndjson")
+
+        model_descriptor = params.get("model_descriptor", None)
+        model_method = params.get("model_method", None)
+
+        errors = {}
+        if not model_method:
+            errors["model_method"] = ["This field is required."]
+        if not model_descriptor:
+            errors["model_descriptor"] = ["This field is required."]
+        first = next(smiles_iter, None)
+        if first is None:
+            errors["input"] = ["This field is required."]
+        if errors:
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+
+        ml_model = get_object_or_404(MLModel, descriptor=model_descriptor, method=model_method, is_active=True)
 
+        try:
+            records = predict_ic50_stream(
+                chain([first], smiles_iter),
+                model_name=os.path.basename(ml_model.file.name),
+                model_descriptor=model_descriptor,
+            )
         except ValueError as e:
-            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return StreamingHttpResponse(
+            (json.dumps(record) + "\n" for record in records),
+            content_type="application/x-ndjson",
+        )
+
+class CacheStatsView(APIView):
+    def get(self, request, *args, **kwargs):
+        return Response({
+            "fingerprints": FINGERPRINT_CACHE.stats(),
+            "predictions": PREDICTION_CACHE.stats(),
+        }, status=status.HTTP_200_OK)
+
+class BatchingStatsView(APIView):
+    def get(self, request, *args, **kwargs):
+        return Response(COALESCER.stats(), status=status.HTTP_200_OK)
+
+class CPUBudgetStatsView(APIView):
+    def get(self, request, *args, **kwargs):
+        return Response(CPU_BUDGET.stats(), status=status.HTTP_200_OK)
+
+class ModelRegistryStatsView(APIView):
+    def get(self, request, *args, **kwargs):
+        return Response({**MODELS.stats(), "process_memory": memory_report()}, status=status.HTTP_200_OK)
+
+class MetricsView(View):
+    """Prediction stage timings and molecule counters in the Prometheus text format."""
+
+    def get(self, request, *args, **kwargs):
+        return HttpResponse(METRICS.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+class LivenessView(View):
+    def get(self, request, *args, **kwargs):
+        return JsonResponse({"status": "alive", "pid": os.getpid()}, status=status.HTTP_200_OK)
+
+class ReadinessView(View):
+    """200 once the feature plans and all active models are warm in this process, 503 until then."""
+
+    def get(self, request, *args, **kwargs):
+        report = readiness()
+        code = status.HTTP_200_OK if report["status"] == "ready" else status.HTTP_503_SERVICE_UNAVAILABLE
+        return JsonResponse(report, status=code)
@@ -0,0 +1,200 @@
+"""
+Binary wire format for /predict/, negotiated through Content-Type and Accept
+with JSON as the fallback. All integers are little-endian.
+
+Request (application/x-ic50-batch):
+    b"ICB1" | u8 flags (bit 0: partial)
+    | u16 length + UTF-8 model_method | u16 length + UTF-8 model_descriptor
+    | u32 n | NUL-separated UTF-8 SMILES
+
+Response (application/x-ic50-result):
+    b"ICR1" | u8 kind | u32 n | f64[n] predictions | u32 length + UTF-8 JSON
+    kind 0 is a plain prediction list, kind 1 a partial result whose JSON
+    tail holds the errors and whose NaN predictions are invalid inputs, and
+    kind 2 any other payload (error bodies), carried entirely as JSON.
+"""
+import json
+import struct
+import numpy as np
+from rest_framework.exceptions import ParseError
+from rest_framework.negotiation import DefaultContentNegotiation
+from rest_framework.parsers import BaseParser
+from rest_framework.renderers import BaseRenderer
+
+BATCH_MEDIA_TYPE = "application/x-ic50-batch"
+RESULT_MEDIA_TYPE = "application/x-ic50-result"
+BATCH_MAGIC = b"ICB1"
+RESULT_MAGIC = b"ICR1"
+FLAG_PARTIAL = 1
+
+KIND_LIST = 0
+KIND_PARTIAL = 1
+KIND_OTHER = 2
+
+
+def _pack_str(value):
+    data = (value or "").encode("utf-8")
+    return struct.pack("<H", len(data)) + data
+
+
+def _unpack_str(data, pos):
+    (length,) = struct.unpack_from("<H", data, pos)
+    pos += 2
+    return data[pos:pos + length].decode("utf-8"), pos + length
+
+
+def encode_batch(smiles_list, model_method, model_descriptor, partial=False):
+    # One join and one split beat per-item length prefixes in Python; NUL
+    # never occurs in SMILES, and inputs containing it are refused.
+    joined = "\0".join(smiles_list)
+    if joined.count("\0") != max(len(smiles_list) - 1, 0):
+        raise ValueError("SMILES must not contain NUL characters.")
+    return b"".join([
+        BATCH_MAGIC,
+        struct.pack("<B", FLAG_PARTIAL if partial else 0),
+        _pack_str(model_method),
+        _pack_str(model_descriptor),
+        struct.pack("<I", len(smiles_list)),
+        joined.encode("utf-8"),
+    ])
+
+
+def decode_batch(data):
+    if data[:4] != BATCH_MAGIC:
+        raise ValueError("Not an IC50 batch.")
+    try:
+        return _decode_batch(data)
+    except struct.error as e:
+        raise ValueError(str(e))
+
+
+def _decode_batch(data):
+    (flags,) = struct.unpack_from("<B", data, 4)
+    model_method, pos = _unpack_str(data, 5)
+    model_descriptor, pos = _unpack_str(data, pos)
+    (n,) = struct.unpack_from("<I", data, pos)
+    smiles_list = data[pos + 4:].decode("utf-8").split("\0") if n else []
+    if len(smiles_list) != n:
+        raise ValueError(f"Expected {n} SMILES, got {len(smiles_list)}.")
+    return {
+        "smiles": smiles_list,
+        "model_method": model_method,
+        "model_descriptor": model_descriptor,
+        "partial": bool(flags & FLAG_PARTIAL),
+    }
+
+
+def encode_result(result):
+    if isinstance(result, list):
+        kind, predictions, tail = KIND_LIST, result, None
+    elif isinstance(result, dict) and set(result) == {"predictions", "errors"}:
+        kind, predictions, tail = KIND_PARTIAL, result["predictions"], result["errors"]
+    else:
+        kind, predictions, tail = KIND_OTHER, [], result
+
+    values = np.array([np.nan if value is None else value for value in predictions], dtype="<f8")
+    tail = json.dumps(tail).encode("utf-8") if tail is not None else b""
+    return b"".join([
+        RESULT_MAGIC,
+        struct.pack("<BI", kind, len(values)),
+        values.tobytes(),
+        struct.pack("<I", len(tail)),
+        tail,
+    ])
+
+
+def decode_result(data):
+    if data[:4] != RESULT_MAGIC:
+        raise ValueError("Not an IC50 result.")
+    kind, n = struct.unpack_from("<BI", data, 4)
+    pos = 9
+    values = np.frombuffer(data, dtype="<f8", count=n, offset=pos)
+    pos += 8 * n
+    (length,) = struct.unpack_from("<I", data, pos)
+    tail = json.loads(data[pos + 4:pos + 4 + length]) if length else None
+
+    if kind == KIND_OTHER:
+        return tail
+    predictions = values.tolist()
+    if kind == KIND_LIST:
+        return predictions
+    for i in np.flatnonzero(np.isnan(values)).tolist():
+        predictions[i] = None
+    return {"predictions": predictions, "errors": tail}
+
+
+class BatchParser(BaseParser):
+    media_type = BATCH_MEDIA_TYPE
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        if stream is None:
+            raise ParseError("Empty IC50 batch.")
+        try:
+            return decode_batch(stream.read())
+        except ValueError as e:
+            raise ParseError(f"Malformed IC50 batch: {e}")
+
+
+class ResultRenderer(BaseRenderer):
+    media_type = RESULT_MEDIA_TYPE
+    format = "ic50"
+    charset = None
+    render_style = "binary"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return encode_result(data)
+
+
+def accept_quality(accept, media_type):
+    """
+    Quality (q) the Accept header value accept gives media_type through its
+    most specific matching range ("type/subtype", then "type/*", then
+    "*/*"); 0.0 when none matches.
+    """
+    main_type = media_type.split("/")[0]
+    best = None
+    for media_range in accept.split(","):
+        kind, *params = [part.strip() for part in media_range.split(";")]
+        if kind == media_type:
+            specificity = 2
+        elif kind == f"{main_type}/*":
+            specificity = 1
+        elif kind == "*/*":
+            specificity = 0
+        else:
+            continue
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if best is None or specificity > best[0]:
+            best = (specificity, quality)
+    return best[1] if best else 0.0
+
+
+class ResultNegotiation(DefaultContentNegotiation):
+    """
+    Serves the binary result to clients that list its media type explicitly
+    in Accept with a quality at least that of JSON, such as the backend's
+    "application/x-ic50-result, application/json;q=0.5". DRF's default
+    negotiation ignores q values and would pick JSON; clients that do not
+    list the binary type still negotiate as before.
+    """
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        accept = request.META.get("HTTP_ACCEPT", "")
+        if not format_suffix and RESULT_MEDIA_TYPE in accept:
+            quality = accept_quality(accept, RESULT_MEDIA_TYPE)
+            if quality > 0 and quality >= accept_quality(accept, "application/json"):
+                for renderer in renderers:
+                    if isinstance(renderer, ResultRenderer):
+                        return renderer, RESULT_MEDIA_TYPE
+            # Ranked below JSON or refused (q=0): the default negotiation
+            # would still match the listed type, so it is not offered.
+            renderers = [renderer for renderer in renderers if not isinstance(renderer, ResultRenderer)]
+        return super().select_renderer(request, renderers, format_suffix)
+
@@ -0,0 +1,59 @@
+"""
+Gunicorn configuration for the ML service.
+
+    gunicorn -c gunicorn.conf.py
+
+With PRELOAD_MODELS=true the app, the feature plans and the active models are
+loaded once in the master and shared copy-on-write by the forked workers,
+instead of every worker unpickling its own copy. It is read from the process
+environment (not .env); without it each worker warms its models itself.
+
+With ASGI_WORKERS=true the ASGI app is served by uvicorn workers, which
+/predict/async/ needs: it answers 501 under the default sync (WSGI) workers.
+Sync views then run one at a time per worker on Django's sync thread, so
+GUNICORN_THREADS no longer applies and concurrent /predict/ calls are not
+coalesced; deployments mixing both endpoints keep WSGI for /predict/.
+"""
+import os
+
+asgi_workers = os.environ.get("ASGI_WORKERS", "false").lower() in ("1", "true", "yes")
+if asgi_workers:
+    wsgi_app = "antimalaria_ml.asgi:application"
+    worker_class = "uvicorn_worker.UvicornWorker"
+else:
+    wsgi_app = "antimalaria_ml.wsgi:application"
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:8080")
+workers = int(os.environ.get("GUNICORN_WORKERS", "2"))
+# Read back by the app to split the CPUs between the workers (CPU_BUDGET).
+os.environ["GUNICORN_WORKERS"] = str(workers)
+# More than one thread per worker lets concurrent predictions be coalesced.
+threads = int(os.environ.get("GUNICORN_THREADS", "1"))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "120"))
+preload_app = os.environ.get("PRELOAD_MODELS", "false").lower() in ("1", "true", "yes")
+# The master imports the app before the hooks below run; this tells it (and
+# the forked workers) that post_fork warms the models, so the app's own
+# start-up warm-up stands down (api/v1/startup.py).
+if preload_app:
+    os.environ["GUNICORN_PRELOAD_APP"] = "1"
+
+
+def on_starting(server):
+    # Metrics snapshots left by a previous run would be added to this one.
+    metrics_dir = os.environ.get("METRICS_DIR")
+    if metrics_dir and os.path.isdir(metrics_dir):
+        for name in os.listdir(metrics_dir):
+            if name.startswith("metrics-"):
+                os.remove(os.path.join(metrics_dir, name))
+
+
+def when_ready(server):
+    if server.cfg.preload_app:
+        from api.v1 import prefork
+        prefork.preload()
+
+
+def post_fork(server, worker):
+    if server.cfg.preload_app:
+        from api.v1 import prefork
+        prefork.after_fork()
+